@@ -1,9 +1,11 @@
 import streamlit as st
 from PIL import Image
-import uuid
 import os
-from shared.config import init_apis
-from shared.database import store_product, get_all_products, delete_product
+from shared.config import init_apis, BULK_UPLOAD_CHUNK
+from shared.database import store_product, store_products, get_all_products, delete_product
+from shared.embeddings import prepare_image
+from shared.image_store import content_key, is_ingested
+from shared.product_fragments import get_fragments
 
 # Page config
 st.set_page_config(
@@ -38,11 +40,11 @@ if page == "Add Products":
     
     if uploaded_file:
         # Display image
-        image = Image.open(uploaded_file)
+        image = prepare_image(Image.open(uploaded_file))
         col1, col2 = st.columns([1, 2])
         
         with col1:
-            st.image(image, caption="Product Image", use_column_width=True)
+            st.image(image.image, caption="Product Image", use_column_width=True)
         
         with col2:
             # Product details form
@@ -75,17 +77,14 @@ if page == "Add Products":
                 if submitted:
                     if name and price:
                         with st.spinner("Processing product..."):
-                            # Save image temporarily (in production, upload to cloud storage)
-                            image_filename = f"product_{uuid.uuid4()}.jpg"
-                            
-                            # Store product
+                            # Store product (the image is saved in the local image store)
                             success = store_product(
                                 index=pinecone_index,
                                 image=image,
                                 name=name,
                                 price=price,
                                 category=category,
-                                image_url=f"images/{image_filename}"  # placeholder URL
+                                image_bytes=uploaded_file.getvalue()
                             )
                             
                             if success:
@@ -117,9 +116,7 @@ elif page == "View Products":
                 st.write(f"**Category:** {metadata.get('category', 'Unknown')}")
                 
                 # Description (truncated)
-                description = metadata.get('description', '')
-                if len(description) > 100:
-                    description = description[:100] + "..."
+                description = get_fragments(product.id, metadata).list_description
                 st.write(f"**Description:** {description}")
                 
                 # Similarity score
@@ -127,7 +124,7 @@ elif page == "View Products":
                 
                 # Delete button
                 if st.button(f"🗑️ Delete", key=f"delete_{product.id}"):
-                    if delete_product(pinecone_index, product.id):
+                    if delete_product(pinecone_index, product.id, image_key=metadata.get('image_key')):
                         st.rerun()
                 
                 st.divider()
@@ -157,40 +154,49 @@ elif page == "Bulk Upload":
         if st.button("Process All Images", type="primary"):
             progress_bar = st.progress(0)
             success_count = 0
+            skipped_count = 0
             
-            for idx, uploaded_file in enumerate(uploaded_files):
-                try:
-                    # Update progress
-                    progress = (idx + 1) / len(uploaded_files)
-                    progress_bar.progress(progress)
-                    
-                    # Process image
-                    image = Image.open(uploaded_file)
-                    filename_without_ext = os.path.splitext(uploaded_file.name)[0]
-                    
-                    # Use filename as product name (can be edited later)
-                    product_name = filename_without_ext.replace('_', ' ').replace('-', ' ').title()
-                    
-                    # Default price (can be edited later)
-                    default_price = 99.99
-                    
-                    # Store product
-                    success = store_product(
-                        index=pinecone_index,
-                        image=image,
-                        name=product_name,
-                        price=default_price,
-                        category=bulk_category,
-                        image_url=f"images/{uploaded_file.name}"
-                    )
-                    
-                    if success:
-                        success_count += 1
+            # Skip images that were already turned into products
+            pending = []
+            for uploaded_file in uploaded_files:
+                image_bytes = uploaded_file.getvalue()
+                if is_ingested(content_key(image_bytes)):
+                    skipped_count += 1
+                else:
+                    pending.append((uploaded_file, image_bytes))
+            
+            # Chunks of images described concurrently, with one batched embedding request each
+            for start in range(0, len(pending), BULK_UPLOAD_CHUNK):
+                chunk = pending[start:start + BULK_UPLOAD_CHUNK]
+                products = []
+                for uploaded_file, image_bytes in chunk:
+                    try:
+                        # Use filename as product name (can be edited later)
+                        filename_without_ext = os.path.splitext(uploaded_file.name)[0]
+                        product_name = filename_without_ext.replace('_', ' ').replace('-', ' ').title()
                         
+                        products.append({
+                            "image": prepare_image(Image.open(uploaded_file)),
+                            "name": product_name,
+                            "price": 99.99,  # Default price (can be edited later)
+                            "category": bulk_category,
+                            "image_bytes": image_bytes
+                        })
+                    except Exception as e:
+                        st.error(f"Error processing {uploaded_file.name}: {e}")
+                
+                try:
+                    success_count += sum(store_products(pinecone_index, products))
                 except Exception as e:
-                    st.error(f"Error processing {uploaded_file.name}: {e}")
+                    st.error(f"Error processing batch: {e}")
+                
+                # Update progress
+                progress_bar.progress((skipped_count + start + len(chunk)) / len(uploaded_files))
+            progress_bar.progress(1.0)
             
             st.success(f"✅ Successfully processed {success_count}/{len(uploaded_files)} products!")
+            if skipped_count:
+                st.info(f"⏭️ Skipped {skipped_count} images that were already added")
             st.info("💡 Tip: Use 'View Products' to review and edit the auto-generated details.")
 
 # Footer
@@ -1,9 +1,12 @@
 import streamlit as st
 from PIL import Image
-import uuid
 import os
-from shared.config import init_apis
-from shared.database import store_product, get_all_products, delete_product
+from shared.config import init_apis, BULK_UPLOAD_CHUNK
+from shared.database import store_product, store_products, get_all_products, delete_product
+from shared.embeddings import prepare_image
+from shared.query_parser import CATEGORY_NAMES, KARAT_NAMES, STYLE_NAMES, OTHER_OPTION
+from shared.image_store import content_key, is_ingested, has_image, image_path
+from shared.product_fragments import get_fragments
 
 # Page config
 st.set_page_config(
@@ -38,11 +41,11 @@ if page == "إضافة منتجات":
     
     if uploaded_file:
         # Display image
-        image = Image.open(uploaded_file)
+        image = prepare_image(Image.open(uploaded_file))
         col1, col2 = st.columns([1, 2])
         
         with col1:
-            st.image(image, caption="صورة المنتج", use_container_width=True)
+            st.image(image.image, caption="صورة المنتج", use_container_width=True)
         
         with col2:
             # Product details form
@@ -61,7 +64,7 @@ if page == "إضافة منتجات":
                 
                 category = st.selectbox(
                     "الفئة*",
-                    ["خواتم", "عقود", "أقراط", "أساور", "دبابيس", "طقم", "أخرى"]
+                    CATEGORY_NAMES + [OTHER_OPTION]
                 )
                 
                 # Additional jewelry-specific fields
@@ -71,7 +74,7 @@ if page == "إضافة منتجات":
                 with col_a:
                     karat = st.selectbox(
                         "العيار",
-                        ["", "18 قيراط", "21 قيراط", "24 قيراط", "فضة 925", "فضة 999", "بلاتين", "أخرى"],
+                        [""] + KARAT_NAMES + [OTHER_OPTION],
                         help="اختر عيار المعدن"
                     )
                     
@@ -92,7 +95,7 @@ if page == "إضافة منتجات":
                     
                     style = st.selectbox(
                         "الستايل",
-                        ["", "عصري", "كلاسيكي", "عتيق", "بسيط", "فاخر", "رومانسي", "هندسي", "بوهيمي", "أخرى"],
+                        [""] + STYLE_NAMES + [OTHER_OPTION],
                         help="الطراز العام للقطعة"
                     )
 
@@ -118,23 +121,20 @@ if page == "إضافة منتجات":
                 if submitted:
                     if name and price:
                         with st.spinner("معالجة المنتج..."):
-                            # Save image temporarily
-                            image_filename = f"product_{uuid.uuid4()}.jpg"
-                            
-                            # Store product
+                            # Store product (the image is saved in the local image store)
                             success = store_product(
                                 index=pinecone_index,
                                 image=image,
                                 name=name,
                                 price=price,
                                 category=category,
-                                image_url=f"images/{image_filename}",
                                 additional_info=additional_description,
                                 karat=karat,
                                 weight=weight,
                                 design=design,
                                 style=style,
-                                product_url=product_url
+                                product_url=product_url,
+                                image_bytes=uploaded_file.getvalue()
                             )
                             
                             if success:
@@ -160,6 +160,11 @@ elif page == "عرض المنتجات":
             with cols[idx % 3]:
                 metadata = product.metadata
                 
+                # Thumbnail from the local image store
+                image_key = metadata.get('image_key')
+                if image_key and has_image(image_key):
+                    st.image(image_path(image_key, "thumb"))
+                
                 # Product card
                 st.subheader(metadata.get('name', 'منتج بدون اسم'))
                 st.write(f"**السعر:** {metadata.get('price', 0):.2f} ريال")
@@ -178,9 +183,7 @@ elif page == "عرض المنتجات":
                     st.write(f"**الرابط:** [عرض المنتج]({metadata.get('product_url')})")
 
                 # Description (truncated)
-                description = metadata.get('description', '')
-                if len(description) > 100:
-                    description = description[:100] + "..."
+                description = get_fragments(product.id, metadata).list_description
                 st.write(f"**الوصف:** {description}")
                 
                 # Similarity score
@@ -188,7 +191,7 @@ elif page == "عرض المنتجات":
                 
                 # Delete button
                 if st.button(f"🗑️ حذف", key=f"delete_{product.id}"):
-                    if delete_product(pinecone_index, product.id):
+                    if delete_product(pinecone_index, product.id, image_key=image_key):
                         st.rerun()
                 
                 st.divider()
@@ -212,52 +215,55 @@ elif page == "رفع مجمع":
         # Default category for bulk upload
         bulk_category = st.selectbox(
             "الفئة الافتراضية لجميع العناصر:",
-            ["خواتم", "عقود", "أقراط", "أساور", "دبابيس", "طقم", "أخرى"]
+            CATEGORY_NAMES + [OTHER_OPTION]
         )
         
         if st.button("معالجة جميع الصور", type="primary"):
             progress_bar = st.progress(0)
             success_count = 0
+            skipped_count = 0
             
-            for idx, uploaded_file in enumerate(uploaded_files):
-                try:
-                    # Update progress
-                    progress = (idx + 1) / len(uploaded_files)
-                    progress_bar.progress(progress)
-                    
-                    # Process image
-                    image = Image.open(uploaded_file)
-                    filename_without_ext = os.path.splitext(uploaded_file.name)[0]
-                    
-                    # Use filename as product name
-                    product_name = filename_without_ext.replace('_', ' ').replace('-', ' ').title()
-                    
-                    # Default price
-                    default_price = 99.99
-                    
-                    # Store product
-                    success = store_product(
-                        index=pinecone_index,
-                        image=image,
-                        name=product_name,
-                        price=default_price,
-                        category=bulk_category,
-                        image_url=f"images/{uploaded_file.name}",
-                        additional_info="",
-                        karat="",
-                        weight=0.0,
-                        design="",
-                        style="",
-                        product_url=""
-                    )
-                    
-                    if success:
-                        success_count += 1
+            # Skip images that were already turned into products
+            pending = []
+            for uploaded_file in uploaded_files:
+                image_bytes = uploaded_file.getvalue()
+                if is_ingested(content_key(image_bytes)):
+                    skipped_count += 1
+                else:
+                    pending.append((uploaded_file, image_bytes))
+            
+            # Chunks of images described concurrently, with one batched embedding request each
+            for start in range(0, len(pending), BULK_UPLOAD_CHUNK):
+                chunk = pending[start:start + BULK_UPLOAD_CHUNK]
+                products = []
+                for uploaded_file, image_bytes in chunk:
+                    try:
+                        # Use filename as product name
+                        filename_without_ext = os.path.splitext(uploaded_file.name)[0]
+                        product_name = filename_without_ext.replace('_', ' ').replace('-', ' ').title()
                         
+                        products.append({
+                            "image": prepare_image(Image.open(uploaded_file)),
+                            "name": product_name,
+                            "price": 99.99,  # Default price
+                            "category": bulk_category,
+                            "image_bytes": image_bytes
+                        })
+                    except Exception as e:
+                        st.error(f"خطأ في معالجة {uploaded_file.name}: {e}")
+                
+                try:
+                    success_count += sum(store_products(pinecone_index, products))
                 except Exception as e:
-                    st.error(f"خطأ في معالجة {uploaded_file.name}: {e}")
+                    st.error(f"خطأ في معالجة الدفعة: {e}")
+                
+                # Update progress
+                progress_bar.progress((skipped_count + start + len(chunk)) / len(uploaded_files))
+            progress_bar.progress(1.0)
             
             st.success(f"✅ تم معالجة {success_count}/{len(uploaded_files)} منتج بنجاح!")
+            if skipped_count:
+                st.info(f"⏭️ تم تخطي {skipped_count} صورة مضافة مسبقاً")
             st.info("💡 نصيحة: استخدم 'عرض المنتجات' لمراجعة وتعديل التفاصيل المُولدة تلقائياً.")
 
 # Footer
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local vector index: recall@k against brute force, query latency
+and in-memory bytes per vector for float32, int8 and PQ storage
+Uses the catalog snapshot vectors when available, else synthetic clustered vectors
+
+    python benchmark_local_index.py --count 20000 --m 32 --ef-construction 200 --ef-search 64
+    python benchmark_local_index.py --dimension 1536 --variants "hnsw" "hnsw int8" "pq scan"
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from shared.ann_index import LocalANNIndex, _normalize
+
+
+def load_vectors(count, dimension, seed=0):
+    """Snapshot vectors when a snapshot exists, else clustered synthetic vectors"""
+    from shared.catalog_snapshot import CatalogSnapshot
+    snapshot = CatalogSnapshot()
+    if snapshot.exists() and len(snapshot):
+        vectors = [snapshot.vector(product_id) for product_id in snapshot.product_ids()]
+        vectors = np.vstack([v for v in vectors if v is not None and np.any(v)])
+        print(f"📦 Using {len(vectors)} snapshot vectors")
+        return _normalize(vectors)
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 100, 1), dimension))
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.3 * rng.normal(size=(count, dimension))
+    print(f"🎲 Using {count} synthetic vectors (d={dimension})")
+    return _normalize(vectors)
+
+
+def brute_force(vectors, queries, k):
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def measure(name, search, code_bytes, queries, truth, k):
+    """Recall@k, p50/p95 latency and vector memory of one search function"""
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found) & set(expected.tolist()))
+    recall = hits / (len(queries) * k)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"   {name:<24} recall@{k}={recall:.3f}  p50={p50:.2f}ms  p95={p95:.2f}ms  {code_bytes} B/vector")
+    return recall, p50, p95
+
+
+def local_index_variant(storage):
+    def build(vectors, args):
+        ann_index = LocalANNIndex(tempfile.mkdtemp(), vectors.shape[1], args.m, args.ef_construction, args.ef_search, storage)
+        start = time.perf_counter()
+        ann_index.build((str(i), vector) for i, vector in enumerate(vectors))
+        print(f"   {ann_index.storage} build: {time.perf_counter() - start:.2f}s")
+        return lambda query, k: [int(pid) for pid, _ in ann_index.search(query, k)], ann_index.code_size()
+    return build
+
+
+def brute_force_variant(vectors, args):
+    return lambda query, k: np.argsort(-(vectors @ query))[:k].tolist(), vectors.shape[1] * 4
+
+
+# Variants compared by the benchmark: name -> builder(vectors, args) returning
+# (search(query, k) -> row ids, bytes per vector held in memory)
+VARIANTS = {
+    "brute force": brute_force_variant,
+    "hnsw": local_index_variant("flat"),
+    "hnsw int8": local_index_variant("int8"),
+    "pq scan": local_index_variant("pq"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS))
+    args = parser.parse_args()
+
+    print("📊 Local vector index benchmark")
+    print("=" * 60)
+    vectors = load_vectors(args.count, args.dimension)
+    rng = np.random.default_rng(1)
+    queries = _normalize(vectors[rng.integers(len(vectors), size=args.queries)]
+                         + 0.1 * rng.normal(size=(args.queries, vectors.shape[1])))
+    truth = brute_force(vectors, queries, args.k)
+
+    print(f"\n⚙️ M={args.m} efConstruction={args.ef_construction} efSearch={args.ef_search}")
+    for name in args.variants:
+        search, code_bytes = VARIANTS[name](vectors, args)
+        measure(name, search, code_bytes, queries, truth, args.k)
+
+
+if __name__ == "__main__":
+    main()
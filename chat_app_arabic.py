@@ -2,7 +2,8 @@ import streamlit as st
 from PIL import Image
 from shared.config import init_apis
 from shared.database import search_by_text, search_by_image
-from shared.embeddings import expand_search_query, parse_query_expansion
+from shared.embeddings import expand_search_query, parse_query_expansion, prepare_image
+from shared.product_fragments import get_fragments
 
 # Page config
 st.set_page_config(
@@ -68,9 +69,7 @@ with col1:
                             st.write(f"**📝 الفئة:** {metadata.get('category', 'غير محدد')}")
                             
                             # Description
-                            description = metadata.get('description', '')
-                            if len(description) > 150:
-                                description = description[:150] + "..."
+                            description = get_fragments(result.id, metadata).detail_description
                             st.write(f"**🔍 الوصف:** {description}")
                             
                             # Match score
@@ -93,8 +92,8 @@ with col2:
     
     if uploaded_image:
         # Display uploaded image
-        image = Image.open(uploaded_image)
-        st.image(image, caption="الصورة المرفوعة", use_container_width=True)
+        image = prepare_image(Image.open(uploaded_image))
+        st.image(image.image, caption="الصورة المرفوعة", use_container_width=True)
         
         if st.button("🔍 ابحث بالصورة", type="primary"):
             with st.spinner("تحليل الصورة والبحث..."):
@@ -115,9 +114,7 @@ with col2:
                         st.write(f"**📝 الفئة:** {metadata.get('category', 'غير محدد')}")
                         
                         # Description (shorter for image results)
-                        description = metadata.get('description', '')
-                        if len(description) > 100:
-                            description = description[:100] + "..."
+                        description = get_fragments(result.id, metadata).list_description
                         st.write(f"**🔍 الوصف:** {description}")
                         
                         # Match score
@@ -1,11 +1,17 @@
 import streamlit as st
 from PIL import Image
 import json
+import time
 from datetime import datetime
 from shared.config import init_apis, TEXT_MODEL
 from shared.database import search_by_text, search_by_image, smart_search
-from shared.embeddings import get_image_description
-import openai
+from shared.embeddings import get_image_description, prepare_image
+from shared.context_builder import build_product_context, build_history_context
+from shared.query_parser import is_product_query
+from shared.product_fragments import get_fragments
+from shared.prompt_layout import build_messages
+from shared.llm_client import chat_completion
+from shared.usage_stats import record_usage, get_cached_token_ratio
 
 # Page config
 st.set_page_config(
@@ -36,17 +42,8 @@ except Exception as e:
 st.title("💎 مساعد متجر المجوهرات الذكي")
 st.markdown("### محادثة ذكية مع خبير المجوهرات")
 
-def get_chatbot_response(user_message, search_results=None, image_analysis=None):
-    """Generate chatbot response using OpenAI with strict RAG enforcement"""
-    try:
-        # Always search for products if we don't have search results already
-        if not search_results and should_search_products(user_message):
-            search_results = smart_search(pinecone_index, user_message, search_type="text", top_k=5)
-
-        # Build strict RAG system message
-        if search_results and len(search_results) > 0:
-            # RAG mode: Only use database knowledge
-            system_message = """أنت مساعد مبيعات ودود ومرحب في متجر مجوهرات! 💎
+# Static system prompts - kept constant so the cached request prefix can be reused
+RAG_SYSTEM_PROMPT = """أنت مساعد مبيعات ودود ومرحب في متجر مجوهرات! 💎
 
             شخصيتك:
             - مرحب وودود جداً مع كل عميل
@@ -65,31 +62,7 @@ def get_chatbot_response(user_message, search_results=None, image_analysis=None)
 
             تحدث باللغة العربية بأسلوب ودود ومتحمس!"""
 
-            # Add product database
-            products_info = "🏪 قاعدة بيانات منتجات المتجر:\n\n"
-            for idx, result in enumerate(search_results[:5], 1):
-                metadata = result.metadata
-                products_info += f"منتج #{idx}: {metadata.get('name', 'منتج')}\n"
-                products_info += f"- السعر: {metadata.get('price', 0):.2f} ريال\n"
-                products_info += f"- الفئة: {metadata.get('category', 'غير محدد')}\n"
-                if metadata.get('karat'):
-                    products_info += f"- العيار: {metadata.get('karat')}\n"
-                if metadata.get('weight', 0) > 0:
-                    products_info += f"- الوزن: {metadata.get('weight')} جرام\n"
-                if metadata.get('design'):
-                    products_info += f"- التصميم: {metadata.get('design')}\n"
-                if metadata.get('style'):
-                    products_info += f"- الستايل: {metadata.get('style')}\n"
-                if metadata.get('product_url'):
-                    products_info += f"- الرابط: {metadata.get('product_url')}\n"
-                products_info += f"- الوصف: {metadata.get('description', '')}\n"
-                products_info += f"- مدى التطابق مع البحث: {result.score * 100:.1f}%\n\n"
-
-            products_info += "\n💫 هذه هي مجموعة منتجاتنا الرائعة المتطابقة مع طلبك. استخدم هذه المعلومات فقط وكن متحمساً في عرضها!"
-
-        else:
-            # No products found or general question
-            system_message = """أنت مساعد مبيعات ودود ومتحمس في متجر مجوهرات! 💎
+GENERAL_SYSTEM_PROMPT = """أنت مساعد مبيعات ودود ومتحمس في متجر مجوهرات! 💎
 
             الموقف الحالي:
             - لم نجد منتجات تطابق تماماً طلب العميل في مجموعتنا الحالية
@@ -108,36 +81,53 @@ def get_chatbot_response(user_message, search_results=None, image_analysis=None)
             - اختتم بعرض مساعدة إضافية
 
             تحدث بالعربية بأسلوب دافئ ومرحب!"""
+
+def get_chatbot_response(user_message, search_results=None, image_analysis=None):
+    """Generate chatbot response using OpenAI with strict RAG enforcement"""
+    try:
+        # Always search for products if we don't have search results already
+        if not search_results and should_search_products(user_message):
+            search_results = smart_search(pinecone_index, user_message, search_type="text", top_k=5)
+
+        # Build strict RAG system message
+        if search_results and len(search_results) > 0:
+            # RAG mode: Only use database knowledge
+            system_message = RAG_SYSTEM_PROMPT
+
+            # Add product database (compact table within the token budget)
+            product_table, _ = build_product_context(search_results, max_products=5)
+            products_info = f"🏪 قاعدة بيانات منتجات المتجر:\n\n{product_table}\n"
+
+            products_info += "\n💫 هذه هي مجموعة منتجاتنا الرائعة المتطابقة مع طلبك. استخدم هذه المعلومات فقط وكن متحمساً في عرضها!"
+
+        else:
+            # No products found or general question
+            system_message = GENERAL_SYSTEM_PROMPT
             products_info = "💝 هذه فرصة رائعة لتقديم المساعدة والنصائح حول المجوهرات بأسلوب ودود!"
 
-        messages = [
-            {"role": "system", "content": system_message},
-            {"role": "system", "content": products_info}
-        ]
-
-        # Add recent conversation history (only last 4 to save tokens)
-        recent_messages = st.session_state.messages[-4:] if len(st.session_state.messages) > 4 else st.session_state.messages
-        for msg in recent_messages:
-            if msg["role"] in ["user", "assistant"]:
-                # Truncate long messages to save tokens
-                content = msg["content"]
-                if len(content) > 200:
-                    content = content[:200] + "..."
-                messages.append({"role": msg["role"], "content": content})
-
-        # Add image analysis if available
+        # Recent conversation history (only last 4, packed into the token budget)
+        history = build_history_context(st.session_state.messages[-4:])
+
+        # Per-turn product data and image analysis go after the static prefix
+        context_blocks = [products_info]
         if image_analysis:
-            messages.append({"role": "system", "content": f"📸 تحليل الصورة المرفوعة: {image_analysis}"})
+            context_blocks.append(f"📸 تحليل الصورة المرفوعة: {image_analysis}")
 
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
+        messages = build_messages(
+            system_message,
+            history=history,
+            context=context_blocks,
+            user_message=user_message
+        )
 
-        response = openai.chat.completions.create(
+        started = time.time()
+        response = chat_completion(
             model=TEXT_MODEL,
             messages=messages,
             max_tokens=400,
             temperature=0.3  # Lower temperature for more consistent responses
         )
+        record_usage("chatbot_response", response, time.time() - started)
 
         return response.choices[0].message.content, search_results
 
@@ -146,26 +136,7 @@ def get_chatbot_response(user_message, search_results=None, image_analysis=None)
 
 def should_search_products(message):
     """Determine if the user message requires product search"""
-    search_keywords = [
-        # Intent words
-        "ابحث", "أبحث", "أريد", "أطلب", "اعرض", "أعرض", "وريني", "أوريني",
-        "عندكن", "عندكم", "متوفر", "موجود", "يوجد", "عرضوا", "لديكم", "لديكن",
-
-        # Products (singular and plural)
-        "خاتم", "خواتم", "عقد", "عقود", "قلادة", "قلائد", "سلسلة", "سلاسل",
-        "أقراط", "قرط", "أساور", "سوار", "اسورة", "دبوس", "دبابيس", "طقم", "أطقم",
-
-        # Materials
-        "ذهب", "ذهبي", "ذهبية", "فضة", "فضي", "فضية", "ماس", "ألماس",
-        "لؤلؤ", "زمرد", "ياقوت", "بلاتين",
-
-        # Occasions and style
-        "للزفاف", "للخطوبة", "للمناسبة", "هدية", "بتصميم", "بشكل",
-        "عصري", "كلاسيكي", "بسيط", "فاخر", "أنيق"
-    ]
-
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in search_keywords)
+    return is_product_query(message)
 
 # Chat interface
 st.markdown("---")
@@ -188,8 +159,8 @@ uploaded_image = st.file_uploader(
 )
 
 if uploaded_image:
-    image = Image.open(uploaded_image)
-    st.image(image, caption="الصورة المرفوعة", width=200)
+    image = prepare_image(Image.open(uploaded_image))
+    st.image(image.image, caption="الصورة المرفوعة", width=200)
 
     if st.button("🔍 تحليل الصورة"):
         with st.spinner("تحليل الصورة..."):
@@ -265,27 +236,16 @@ def display_products(products):
             metadata = result.metadata
 
             with st.container():
-                st.markdown(f"**{metadata.get('name', 'منتج')}**")
-                st.markdown(f"💰 **{metadata.get('price', 0):.2f} ريال**")
-                st.markdown(f"📂 {metadata.get('category', 'غير محدد')}")
-
-                # Show additional details
-                details = []
-                if metadata.get('karat'):
-                    details.append(f"العيار: {metadata.get('karat')}")
-                if metadata.get('weight', 0) > 0:
-                    details.append(f"الوزن: {metadata.get('weight')} جرام")
-                if metadata.get('design'):
-                    details.append(f"التصميم: {metadata.get('design')}")
-
-                if details:
-                    st.markdown(f"🔹 {' | '.join(details)}")
-
-                # Description (truncated)
-                description = metadata.get('description', '')
-                if len(description) > 80:
-                    description = description[:80] + "..."
-                st.markdown(f"📝 {description}")
+                # Pre-rendered text (cached per product version)
+                fragments = get_fragments(result.id, metadata)
+                st.markdown(f"**{fragments.name}**")
+                st.markdown(f"💰 **{fragments.price_text}**")
+                st.markdown(f"📂 {fragments.category}")
+
+                if fragments.card_details:
+                    st.markdown(f"🔹 {fragments.card_details}")
+
+                st.markdown(f"📝 {fragments.card_description}")
 
                 # Match score
                 st.markdown(f"🎯 تطابق: {result.score * 100:.1f}%")
@@ -350,6 +310,7 @@ st.sidebar.markdown("---")
 st.sidebar.markdown("**📊 إحصائيات الجلسة**")
 st.sidebar.metric("عدد الرسائل", len(st.session_state.messages))
 st.sidebar.metric("وقت بدء الجلسة", datetime.now().strftime("%H:%M"))
+st.sidebar.metric("نسبة التوكنات المخزنة مؤقتاً", f"{get_cached_token_ratio() * 100:.0f}%")
 
 # Footer
 st.markdown("---")
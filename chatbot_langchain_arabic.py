@@ -1,12 +1,28 @@
 import streamlit as st
 from PIL import Image
 import json
+import time
 from datetime import datetime
-from shared.config import init_apis, TEXT_MODEL
+from shared.config import init_apis, TEXT_MODEL, VERIFICATION_MAX_COMPLETION_TOKENS, VERIFICATION_REASONING_EFFORT
+from shared.context_builder import build_product_context, build_history_context
+from shared.product_fragments import get_fragments
+from shared.conversation_state import get_conversation_state
+from shared.clarification import clarification_questions, get_facet_distribution
+from shared.followups import answer_followup
+from shared.intent_router import route_intent, RoutedMessage
+from shared.llm_client import chat_completion
+from shared.prompt_layout import build_messages
+from shared.singleflight import singleflight, text_key
+from shared.usage_stats import record_usage, record_failure
+from shared.verification import VERIFICATION_RESPONSE_FORMAT, build_verification_prompt, parse_handles, select_by_handles
 # from shared.langchain_rag import init_langchain_rag  # No longer needed
-from shared.embeddings import get_image_description
+from shared.embeddings import get_image_description, prepare_image
+from shared.visual_search import search_similar_images
+from shared.cascade import run_cascade, run_all, check_cancelled
+from shared.database import search_products
+from shared.query_parser import parse_query
+from shared.description_parser import parse_image_description, build_simplified_query, is_confident
 # from shared.database import search_by_image  # No longer needed - using optimized search
-import openai
 
 # Page config
 st.set_page_config(
@@ -135,62 +151,35 @@ def category_based_filter(query: str, results: list) -> list:
         return results[:5]
 
 def llm_filter_results(query: str, results: list, openai_client) -> list:
-    """Use LLM to intelligently filter search results for relevance"""
+    """Use LLM to intelligently filter search results for relevance
+    (candidates are numbered 1..N; the model returns the matching numbers)"""
     try:
         if not results:
             return []
 
-        # Format results for verification
-        results_text = ""
-        for i, result in enumerate(results):
-            metadata = result.metadata
-            results_text += f"ID: {result.id}\n"
-            results_text += f"Name: {metadata.get('name', 'N/A')}\n"
-            results_text += f"Category: {metadata.get('category', 'N/A')}\n"
-            results_text += f"Description: {metadata.get('description', 'N/A')[:100]}...\n"
-            results_text += f"Score: {result.score:.3f}\n\n"
-
-        verification_prompt = f"""
-Query: "{query}"
-
-Products:
-{results_text}
-
-Rules:
-- خاتم queries → only خواتم category
-- عقد queries → only عقود category
-- أقراط queries → only أقراط category
-- أساور queries → only أساور category
-
-Return JSON list of matching product IDs: ["id1", "id2"] or []
-"""
-
-        response = openai_client.chat.completions.create(
-            model="gpt-5-nano-2025-08-07",
-            messages=[{"role": "user", "content": verification_prompt}],
-            max_completion_tokens=2000
-        )
-
-        # Parse response to get filtered IDs
-        response_text = response.choices[0].message.content.strip()
-
-        # If LLM returned empty response, use category-based fallback
-        if not response_text:
+        def verify():
+            started = time.time()
+            response = chat_completion(
+                model="gpt-5-nano-2025-08-07",
+                messages=[{"role": "user", "content": build_verification_prompt(query, results)}],
+                response_format=VERIFICATION_RESPONSE_FORMAT,
+                reasoning_effort=VERIFICATION_REASONING_EFFORT,
+                max_completion_tokens=VERIFICATION_MAX_COMPLETION_TOKENS
+            )
+            record_usage("verification", response, time.time() - started)
+            return response
+
+        # Sessions verifying the same query and candidates at once share one call
+        response = singleflight("verification", (text_key(query), tuple(r.id for r in results)), verify)
+
+        # Map the returned handles back to the search results
+        handles = parse_handles((response.choices[0].message.content or "").strip(), len(results))
+        if handles is None:
+            record_failure("verification", "unparseable output")
             print("LLM verification failed, using category-based fallback")
             return category_based_filter(query, results)
 
-        try:
-            import json
-            filtered_ids = json.loads(response_text)
-            if not isinstance(filtered_ids, list):
-                filtered_ids = []
-        except Exception as e:
-            print(f"JSON parsing failed: {e}, using category-based fallback")
-            return category_based_filter(query, results)
-
-        # Filter original results by verified IDs
-        filtered_results = [r for r in results if r.id in filtered_ids]
-        return filtered_results
+        return select_by_handles(results, handles)
 
     except Exception as e:
         st.error(f"Error in LLM filtering: {e}")
@@ -198,65 +187,91 @@ Return JSON list of matching product IDs: ["id1", "id2"] or []
         fallback_results = [r for r in results if r.score >= 0.4][:5]
         return fallback_results
 
+def find_matching_products(query: str) -> list:
+    """Embed the query, search Pinecone and verify with the LLM (no session side effects)
+    Returns None when the query could not be embedded"""
+    from shared.embeddings import get_text_embedding
+    query_embedding = get_text_embedding(query)
+
+    if not query_embedding:
+        return None
+    check_cancelled()  # Inside a cascade whose winner is already known: skip the rest
+
+    # Vector search (local ANN or Pinecone), pre-filtered by budget/karat/weight constraints
+    decent_results = search_products(
+        pinecone_index,
+        query_embedding,
+        top_k=8,  # Reduced from 15 to avoid overwhelming LLM
+        min_score=0.3,
+        constraints=parse_query(query),
+        query_text=query
+    )
+
+    if not decent_results:
+        return []
+    check_cancelled()
+
+    # LLM verification filter (intelligent)
+    return llm_filter_results(query, decent_results, openai_client)
+
 def search_jewelry_products(query: str, conversation_history: list = None) -> str:
     """Search for jewelry products using direct Pinecone + LLM verification"""
     try:
         if not pinecone_index:
             return "نظام البحث غير متاح حالياً."
 
-        # Get text embedding for the query
-        from shared.embeddings import get_text_embedding
-        query_embedding = get_text_embedding(query)
-
-        if not query_embedding:
-            return "فشل في معالجة الاستعلام."
+        return search_result_content(query, find_matching_products(query))
 
-        # Search Pinecone directly
-        pinecone_results = pinecone_index.query(
-            vector=query_embedding,
-            top_k=8,  # Reduced from 15 to avoid overwhelming LLM
-            include_metadata=True
-        )
-
-        # Basic similarity filter first (fast)
-        decent_results = [r for r in pinecone_results.matches if r.score >= 0.3]
-
-        if not decent_results:
-            return "NO_RESULTS_NEED_CLARIFICATION"
-
-        # LLM verification filter (intelligent)
-        filtered_results = llm_filter_results(query, decent_results, openai_client)
-
-        if not filtered_results:
-            return "NO_RESULTS_NEED_CLARIFICATION"
+    except Exception as e:
+        return f"حدث خطأ في البحث: {e}"
 
-        # Format results for LLM context
-        final_results = filtered_results[:5]  # Top 5 verified results
-        products_info = f"تم العثور على {len(final_results)} منتج مطابق في المخزون:\n\n"
+def search_result_content(query: str, filtered_results) -> str:
+    """Tool result for a finished search (remembers shown products in the conversation state)"""
+    if filtered_results is None:
+        return "فشل في معالجة الاستعلام."
+
+    if not filtered_results:
+        return "NO_RESULTS_NEED_CLARIFICATION"
+
+    return format_search_results(query, filtered_results)
+
+def execute_tool_calls(tool_calls: list) -> list:
+    """Run every tool call of an assistant turn and return the tool results in call order
+    Searches run concurrently, one worker each; state updates then apply in call order"""
+    calls = [(tool_call.function.name, json.loads(tool_call.function.arguments)) for tool_call in tool_calls]
+    queries = [arguments.get("query", "") for name, arguments in calls if name == "search_jewelry_products"]
+    found = iter(run_all([lambda query=query: find_matching_products(query) for query in queries]) if pinecone_index else [])
+
+    results = []
+    for name, arguments in calls:
+        if name == "search_jewelry_products":
+            if not pinecone_index:
+                results.append("نظام البحث غير متاح حالياً.")
+                continue
+            matches = next(found)
+            if isinstance(matches, Exception):
+                results.append(f"حدث خطأ في البحث: {matches}")
+            else:
+                results.append(search_result_content(arguments.get("query", ""), matches))
+        elif name == "ask_clarifying_questions":
+            results.append(ask_clarifying_questions(arguments.get("reason", ""), arguments.get("questions", [])))
+        else:
+            results.append(f"أداة غير معروفة: {name}")
+    return results
 
-        for i, result in enumerate(final_results, 1):
-            metadata = result.metadata
-            products_info += f"{i}. {metadata.get('name', 'منتج')}\n"
-            products_info += f"   السعر: {metadata.get('price', 0):.2f} ريال\n"
-            products_info += f"   الفئة: {metadata.get('category', 'غير محدد')}\n"
-            if metadata.get('karat'):
-                products_info += f"   العيار: {metadata.get('karat')}\n"
-            if metadata.get('weight', 0) > 0:
-                products_info += f"   الوزن: {metadata.get('weight')} جرام\n"
-            if metadata.get('design'):
-                products_info += f"   التصميم: {metadata.get('design')}\n"
-            if metadata.get('product_url'):
-                products_info += f"   الرابط: {metadata.get('product_url')}\n"
-            products_info += f"   الوصف: {metadata.get('description', '')[:150]}...\n"
-            products_info += f"   مستوى التطابق: {result.score * 100:.1f}%\n\n"
+def format_search_results(query: str, results: list) -> str:
+    """Format matched products as LLM context and remember them in the conversation state"""
+    # Compact table within the token budget
+    product_table, final_results = build_product_context(results, max_products=5)
+    products_info = f"تم العثور على {len(final_results)} منتج مطابق في المخزون:\n\n{product_table}\n"
 
-        # Add instruction for LLM
-        products_info += "\nتعليمات: تحدث بأسلوب دافئ ومرحب وودود. اذكر هذه المنتجات في إجابتك مع الأسعار والتفاصيل المهمة. تأكد من إدراج الرابط إذا كان متوفراً. تذكر: أنت تحافظ على سياق المحادثة وتربط إجابتك بما تم مناقشته سابقاً."
+    # Remember what was shown so follow-ups can refer back to it
+    get_conversation_state().update_from_results(query, final_results)
 
-        return products_info
+    # Add instruction for LLM
+    products_info += "\nتعليمات: تحدث بأسلوب دافئ ومرحب وودود. اذكر هذه المنتجات في إجابتك مع الأسعار والتفاصيل المهمة. تأكد من إدراج الرابط إذا كان متوفراً. تذكر: أنت تحافظ على سياق المحادثة وتربط إجابتك بما تم مناقشته سابقاً."
 
-    except Exception as e:
-        return f"حدث خطأ في البحث: {e}"
+    return products_info
 
 def ask_clarifying_questions(reason: str, questions: list) -> str:
     """Handle clarifying questions for vague queries"""
@@ -275,30 +290,40 @@ def ask_clarifying_questions(reason: str, questions: list) -> str:
     except Exception as e:
         return f"عذراً، حدث خطأ: {e}"
 
-def get_ai_response_for_image_search(image_description: str, conversation_history: list) -> str:
+def get_ai_response_for_image_search(image_description: str, conversation_history: list, visual_matches: list = None) -> str:
     """Special function for image search with fallback strategies"""
     try:
         # Get OpenAI client
         openai_client, pinecone_index = init_apis()
 
-        # Try multiple search strategies
-        search_result = search_jewelry_products(image_description, conversation_history)
-
-        # If no results found, try simplified search
-        if search_result == "NO_RESULTS_NEED_CLARIFICATION":
-            # Create simplified version for backward compatibility
-            simplified_query = simplify_image_description(image_description, openai_client)
-            search_result = search_jewelry_products(simplified_query, conversation_history)
-
-        # If still no results, return appropriate message
-        if search_result == "NO_RESULTS_NEED_CLARIFICATION":
+        # Visually similar products from the local index need no text search
+        if visual_matches:
+            search_query, matches = image_description, visual_matches
+        else:
+            # Primary search and the simplified-query fallback run concurrently
+            simplified = {}
+
+            def simplified_search():
+                simplified["query"] = simplify_image_description(image_description, openai_client)
+                check_cancelled()
+                return find_matching_products(simplified["query"])
+
+            stage, matches = run_cascade([
+                lambda: find_matching_products(image_description),
+                simplified_search
+            ])
+            search_query = simplified.get("query", image_description) if stage == 1 else image_description
+
+        # If no results found, return appropriate message
+        if not matches:
             return "لم أتمكن من العثور على قطع مشابهة للصورة التي رفعتها في مجموعتنا الحالية. 😔\n\nيمكنك تجربة:\n• رفع صورة أخرى أو بزاوية مختلفة\n• وصف القطعة التي تبحث عنها نصياً\n• تصفح مجموعتنا للعثور على قطع مشابهة 💎"
 
         # If results found, create response
+        search_result = format_search_results(search_query, matches)
         image_query = f"وصف الصورة: {image_description}\n\nنتائج البحث:\n{search_result}"
 
         # Create simple response for image analysis
-        response = openai_client.chat.completions.create(
+        response = chat_completion(
             model="gpt-5-nano-2025-08-07",
             messages=[
                 {"role": "system", "content": "أنت مساعد مبيعات ودود في متجر مجوهرات. حلل الصورة المرفوعة واعرض المنتجات المشابهة بحماس. اذكر التشابه في التصميم أو المواد أو الطراز. كن ودود ومتحمس لكن دقيق في الوصف."},
@@ -313,6 +338,12 @@ def get_ai_response_for_image_search(image_description: str, conversation_histor
 
 def simplify_image_description(detailed_description: str, openai_client) -> str:
     """Create simplified description for backward compatibility with old database entries"""
+    # Deterministic extraction from the "النوع: ..." vision output
+    parsed = parse_image_description(detailed_description)
+    if is_confident(parsed):
+        return build_simplified_query(parsed)
+
+    # Low confidence: let the LLM compress the description
     try:
         simplification_prompt = f"""
 خذ هذا الوصف المفصل واختصره إلى وصف بسيط يتوافق مع قاعدة البيانات القديمة:
@@ -329,7 +360,7 @@ def simplify_image_description(detailed_description: str, openai_client) -> str:
 أجب باللغة العربية فقط بجملة واحدة قصيرة.
 """
 
-        response = openai_client.chat.completions.create(
+        response = chat_completion(
             model="gpt-5-nano-2025-08-07",
             messages=[{"role": "user", "content": simplification_prompt}]
         )
@@ -338,108 +369,58 @@ def simplify_image_description(detailed_description: str, openai_client) -> str:
         return simplified
 
     except Exception:
-        # Fallback: extract basic info manually
-        description_lower = detailed_description.lower()
-        if "عقد" in description_lower:
-            jewelry_type = "عقد"
-        elif "خاتم" in description_lower:
-            jewelry_type = "خاتم"
-        elif "أقراط" in description_lower:
-            jewelry_type = "أقراط"
-        elif "سوار" in description_lower:
-            jewelry_type = "سوار"
-        else:
-            jewelry_type = "مجوهرات"
-
-        if "ذهب" in description_lower:
-            material = "ذهب"
-        elif "فضة" in description_lower:
-            material = "فضة"
-        else:
-            material = ""
-
-        return f"{jewelry_type} {material}".strip()
-
-def get_ai_response_with_tools(user_message: str, conversation_history: list) -> str:
-    """Get AI response with access to search tools and full conversation context"""
-    try:
-        # Define the search tool
-        search_tool = {
-            "type": "function",
-            "function": {
-                "name": "search_jewelry_products",
-                "description": "Search for jewelry products in the store inventory when customer asks about specific products or wants to see what's available",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "Search query for jewelry products"
-                        }
-                    },
-                    "required": ["query"]
+        # Fallback: whatever the extractor found
+        return build_simplified_query(parsed)
+
+# Tool schemas are module constants so the request prefix stays byte-stable
+SEARCH_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "search_jewelry_products",
+        "description": "Search for jewelry products in the store inventory when customer asks about specific products or wants to see what's available",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Search query for jewelry products"
                 }
-            }
+            },
+            "required": ["query"]
         }
-
-        # Define the clarification tool
-        ask_clarification_tool = {
-            "type": "function",
-            "function": {
-                "name": "ask_clarifying_questions",
-                "description": "Ask clarifying questions when the customer's request is too vague or lacks important details for a good search",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "reason": {
-                            "type": "string",
-                            "description": "Why clarification is needed"
-                        },
-                        "questions": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "List of clarifying questions to ask"
-                        }
-                    },
-                    "required": ["reason", "questions"]
+    }
+}
+
+CLARIFICATION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "ask_clarifying_questions",
+        "description": "Ask clarifying questions when the customer's request is too vague or lacks important details for a good search",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "reason": {
+                    "type": "string",
+                    "description": "Why clarification is needed"
+                },
+                "questions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of clarifying questions to ask"
                 }
-            }
+            },
+            "required": ["reason", "questions"]
         }
+    }
+}
+
+CHAT_TOOLS = [SEARCH_TOOL, CLARIFICATION_TOOL]
 
-        # Build conversation context summary FIRST
-        context_summary = ""
-        if conversation_history:
-            recent_history = conversation_history[-4:] if len(conversation_history) > 4 else conversation_history
-            if recent_history:
-                context_summary = "📋 ملخص المحادثة السابقة:\n"
-                for msg in recent_history:
-                    if msg["role"] == "user":
-                        context_summary += f"العميل قال: {msg['content']}\n"
-                    elif msg["role"] == "assistant":
-                        context_summary += f"أنت أجبت: {msg['content'][:100]}...\n"
-
-                # Extract key information
-                mentioned_products = []
-                for msg in recent_history:
-                    content = msg['content'].lower()
-                    if any(product in content for product in ['خاتم', 'عقد', 'سلسلة', 'أقراط', 'سوار']):
-                        mentioned_products.append(msg['content'][:150])
-
-                if mentioned_products:
-                    context_summary += f"\n🎯 المنتجات التي تم ذكرها:\n"
-                    for product in mentioned_products[-2:]:  # Last 2 product mentions
-                        context_summary += f"- {product}\n"
-
-        # Prepare messages with CONTEXT FIRST
-        messages = [
-            {
-                "role": "system",
-                "content": f"""أنت مساعد مبيعات ذكي وودود في متجر مجوهرات.
-
-{context_summary}
+CHAT_SYSTEM_PROMPT = """أنت مساعد مبيعات ذكي وودود في متجر مجوهرات.
 
 🔗 CRITICAL: إذا سأل العميل عن "السعر" أو "الألوان" أو "متوفر" بدون تحديد المنتج،
-يجب أن تربط السؤال بآخر منتج ذكرته في المحادثة أعلاه.
+يجب أن تربط السؤال بآخر منتج ذكرته في المحادثة أو في "حالة المحادثة" المرفقة.
+إذا كانت المعلومة المطلوبة موجودة في "آخر المنتجات المعروضة" أجب منها مباشرة بدون بحث جديد.
 
 قواعد أساسية:
 1. راجع المحادثة السابقة أولاً قبل أي شيء
@@ -447,6 +428,7 @@ def get_ai_response_with_tools(user_message: str, conversation_history: list) ->
 3. لديك أداتان مهمتان:
    - search_jewelry_products: للبحث عن منتجات محددة
    - ask_clarifying_questions: لطرح أسئلة توضيحية عند الحاجة
+   - للمقارنة بين أنواع مختلفة (مثل "قارن بين الخواتم والأساور") استدعِ search_jewelry_products مرة لكل نوع في نفس الرد
 4. لا تخترع معلومات - استخدم فقط ما في البحث أو المحادثة
 5. كن ودوداً ومتحمساً
 
@@ -486,82 +468,92 @@ def get_ai_response_with_tools(user_message: str, conversation_history: list) ->
 
 ⚠️ CRITICAL: If customer says ONLY "ring", "خاتم", "necklace", "عقد", "earrings", or "أقراط" without any additional details, you MUST use ask_clarifying_questions tool!
 
-🎯 مثال: إذا ذكرت خواتم سابقاً وسأل "كم السعر؟" → أجب عن أسعار الخواتم من المحادثة السابقة."""
-            }
-        ]
+🎯 مثال: إذا ذكرت خواتم سابقاً وسأل "كم السعر؟" → أجب عن أسعار الخواتم من "آخر المنتجات المعروضة"."""
 
-        # Add recent conversation history
-        recent_history = conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
-        for msg in recent_history:
-            if msg["role"] in ["user", "assistant"]:
-                messages.append({"role": msg["role"], "content": msg["content"]})
-
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
-
-        # Call OpenAI with function calling
-        response = openai.chat.completions.create(
-            model="gpt-5-nano-2025-08-07",
-            messages=messages,
-            tools=[search_tool, ask_clarification_tool],
-            tool_choice="auto",  # Let AI decide when to use tools
-            temperature=1.0
+def get_ai_response_with_tools(user_message: str, conversation_history: list) -> str:
+    """Get AI response with access to search tools and full conversation context"""
+    try:
+        # Update the rolling conversation state once per turn
+        conversation_state = get_conversation_state()
+        conversation_state.update_from_message(user_message)
+
+        # Fast path: attribute follow-ups about the products just shown need no LLM call
+        followup_answer = answer_followup(user_message, conversation_state)
+        if followup_answer:
+            return followup_answer
+
+        # Static prompt first, then raw recent history, then the compact state
+        messages = build_messages(
+            CHAT_SYSTEM_PROMPT,
+            history=build_history_context(conversation_history[-4:]),
+            context=conversation_state.to_prompt(),
+            user_message=user_message
         )
 
-        response_message = response.choices[0].message
+        # Clear-cut turns (type + detail → search, type or detail alone → clarify) are routed locally
+        response_message = route_intent(user_message, conversation_state)
+        if response_message is None:
+            # Call OpenAI with function calling
+            started = time.time()
+            response = chat_completion(
+                model="gpt-5-nano-2025-08-07",
+                messages=messages,
+                tools=CHAT_TOOLS,
+                tool_choice="auto",  # Let AI decide when to use tools
+                temperature=1.0
+            )
+            record_usage("tool_decision", response, time.time() - started)
+
+            response_message = response.choices[0].message
 
         # Check if AI wants to use tools
         if response_message.tool_calls:
-            for tool_call in response_message.tool_calls:
-                function_args = json.loads(tool_call.function.arguments)
-
-                if tool_call.function.name == "search_jewelry_products":
-                    # Extract search query
-                    search_query = function_args.get("query", "")
-
-                    # Perform search
-                    search_result = search_jewelry_products(search_query, conversation_history)
-
-                    # Check if search failed and needs clarification
-                    if search_result == "NO_RESULTS_NEED_CLARIFICATION":
-                        # Automatically trigger clarification instead of showing failure
-                        default_questions = [
-                            "ما نوع المجوهرات التي تبحث عنها؟ (خاتم، عقد، أقراط، سوار)",
-                            "ما المناسبة؟ (زواج، خطوبة، هدية، استعمال يومي)",
-                            "ما المادة المفضلة؟ (ذهب، فضة، أحجار كريمة)",
-                            "ما النمط المفضل؟ (بسيط، فاخر، عصري، كلاسيكي)"
-                        ]
-                        return ask_clarifying_questions(
-                            "أريد أن أساعدك في العثور على القطعة المثالية! 💎",
-                            default_questions
-                        )
-
-                    # Add tool result to conversation
-                    messages.append(response_message)
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": search_result
-                    })
-
-                    # Get final response with search results
-                    final_response = openai.chat.completions.create(
-                        model="gpt-5-nano-2025-08-07",
-                        messages=messages,
-                        temperature=1.0
-                    )
-
-                    return final_response.choices[0].message.content
-
-                elif tool_call.function.name == "ask_clarifying_questions":
-                    # Extract clarification parameters
-                    reason = function_args.get("reason", "")
-                    questions = function_args.get("questions", [])
-
-                    # Generate clarification response
-                    clarification_result = ask_clarifying_questions(reason, questions)
-
-                    return clarification_result
+            tool_calls = response_message.tool_calls
+            search_calls = [tool_call for tool_call in tool_calls if tool_call.function.name == "search_jewelry_products"]
+
+            # A turn that only asks for clarification is answered with the questions directly
+            if not search_calls:
+                function_args = json.loads(tool_calls[0].function.arguments)
+                return ask_clarifying_questions(function_args.get("reason", ""), function_args.get("questions", []))
+
+            # All tool calls of the turn run concurrently (comparisons search each type at once)
+            tool_results = execute_tool_calls(tool_calls)
+
+            # Check if every search failed and needs clarification
+            search_results = [result for tool_call, result in zip(tool_calls, tool_results) if tool_call in search_calls]
+            if all(result == "NO_RESULTS_NEED_CLARIFICATION" for result in search_results):
+                # Automatically trigger clarification instead of showing failure
+                # (questions for the facets the query left open, options from the catalog)
+                search_query = json.loads(search_calls[0].function.arguments).get("query", "")
+                questions = clarification_questions(
+                    parse_query(search_query), conversation_state, get_facet_distribution(), limit=4
+                ) or clarification_questions({}, limit=4)
+                return ask_clarifying_questions(
+                    "أريد أن أساعدك في العثور على القطعة المثالية! 💎",
+                    questions
+                )
+
+            # Add every tool result to conversation
+            messages.append(response_message.to_dict() if isinstance(response_message, RoutedMessage) else response_message)
+            for tool_call, result in zip(tool_calls, tool_results):
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": "لم يتم العثور على منتجات مطابقة لهذا البحث في المخزون." if result == "NO_RESULTS_NEED_CLARIFICATION" else result
+                })
+
+            # One final response over all search results (same tools keep the cached prefix)
+            started = time.time()
+            final_response = chat_completion(
+                model="gpt-5-nano-2025-08-07",
+                messages=messages,
+                tools=CHAT_TOOLS,
+                tool_choice="none",
+                temperature=1.0
+            )
+            record_usage("final_answer", final_response, time.time() - started)
+
+            return final_response.choices[0].message.content
 
         # No tool call needed, return direct response
         return response_message.content
@@ -580,27 +572,16 @@ def display_products(products):
             metadata = result['metadata']
 
             with st.container():
-                st.markdown(f"**{metadata.get('name', 'منتج')}**")
-                st.markdown(f"💰 **{metadata.get('price', 0):.2f} ريال**")
-                st.markdown(f"📂 {metadata.get('category', 'غير محدد')}")
-
-                # Show additional details
-                details = []
-                if metadata.get('karat'):
-                    details.append(f"العيار: {metadata.get('karat')}")
-                if metadata.get('weight', 0) > 0:
-                    details.append(f"الوزن: {metadata.get('weight')} جرام")
-                if metadata.get('design'):
-                    details.append(f"التصميم: {metadata.get('design')}")
-
-                if details:
-                    st.markdown(f"🔹 {' | '.join(details)}")
-
-                # Description (truncated)
-                description = metadata.get('description', '')
-                if len(description) > 100:
-                    description = description[:100] + "..."
-                st.markdown(f"📝 {description}")
+                # Pre-rendered text (cached per product version)
+                fragments = get_fragments(result['id'], metadata)
+                st.markdown(f"**{fragments.name}**")
+                st.markdown(f"💰 **{fragments.price_text}**")
+                st.markdown(f"📂 {fragments.category}")
+
+                if fragments.card_details:
+                    st.markdown(f"🔹 {fragments.card_details}")
+
+                st.markdown(f"📝 {fragments.list_description}")
 
                 # Match score
                 if 'score' in result:
@@ -640,11 +621,14 @@ elif st.session_state.active_tab == "image":
     )
 
     if uploaded_image:
-        image = Image.open(uploaded_image)
-        st.image(image, caption="الصورة المرفوعة", width=300)
+        image = prepare_image(Image.open(uploaded_image))
+        st.image(image.image, caption="الصورة المرفوعة", width=300)
 
         if st.button("🔍 تحليل الصورة وابحث عن مشابهة", type="primary"):
             with st.spinner("تحليل الصورة والبحث..."):
+                # Visual nearest neighbors in-process (None when the local encoder is not installed)
+                visual_matches = search_similar_images(image)
+
                 # Analyze the image
                 description = get_image_description(image)
 
@@ -661,7 +645,7 @@ elif st.session_state.active_tab == "image":
                     st.write("- درجة الحرارة للاستجابة: 0.5")
 
                 # Use specialized image search function
-                bot_response = get_ai_response_for_image_search(description, st.session_state.messages)
+                bot_response = get_ai_response_for_image_search(description, st.session_state.messages, visual_matches)
 
                 # Display results
                 st.markdown(bot_response)
@@ -2,10 +2,12 @@ import streamlit as st
 from PIL import Image
 import json
 from shared.config import init_apis
-from shared.langchain_rag import init_langchain_rag
-from shared.embeddings import get_image_description
+from shared.context_builder import build_product_context, build_history_context
+from shared.product_fragments import get_fragments
+from shared.catalog_service import get_catalog_service
+from shared.llm_client import chat_completion
+from shared.embeddings import get_image_description, prepare_image
 from shared.database import search_by_image
-import openai
 
 # Page config
 st.set_page_config(
@@ -22,28 +24,15 @@ if "messages" not in st.session_state:
         "content": "مرحباً! أنا مساعدك الذكي لمتجر المجوهرات 💎\n\n🤖 **مدعوم بـ Function Calling**\n\nأستطيع أن أقرر متى أبحث في المخزون وأجيب على استفساراتك بذكاء.\n\nاسألني أي شيء عن المجوهرات!"
     })
 
-if "rag_system" not in st.session_state:
-    st.session_state.rag_system = None
-
-# Initialize APIs and RAG
+# Initialize APIs and the shared catalog service (one per process, not per session)
 try:
     openai_client, pinecone_index = init_apis()
 
-    if st.session_state.rag_system is None:
-        with st.spinner("تحضير نظام البحث الذكي..."):
-            st.session_state.rag_system = init_langchain_rag(
-                pinecone_index,
-                st.secrets["OPENAI_API_KEY"]
-            )
-
-        if st.session_state.rag_system:
-            st.success("🚀 نظام البحث الذكي جاهز!")
-        else:
-            st.error("❌ فشل في تهيئة نظام البحث")
-            st.stop()
+    with st.spinner("تحضير نظام البحث الذكي..."):
+        catalog_service = get_catalog_service(pinecone_index, st.secrets["OPENAI_API_KEY"])
 
 except Exception as e:
-    st.error(f"خطأ في الاتصال: {e}")
+    st.error(f"❌ فشل في تهيئة نظام البحث: {e}")
     st.stop()
 
 st.title("💎 مساعد متجر المجوهرات الذكي")
@@ -71,26 +60,14 @@ search_tool = {
 def search_jewelry_products(query: str, conversation_history: list = None) -> str:
     """Search for jewelry products and return formatted results"""
     try:
-        if st.session_state.rag_system:
-            _, results = st.session_state.rag_system.conversational_search(query, conversation_history)
+        if catalog_service:
+            # Retrieval only: the final answer is written by the tool-calling model
+            results = catalog_service.search(query)
 
             if results:
-                # Format results for LLM context
-                products_info = f"تم العثور على {len(results)} منتج في المخزون:\n\n"
-                for i, result in enumerate(results, 1):
-                    metadata = result['metadata']
-                    products_info += f"{i}. {metadata.get('name', 'منتج')}\n"
-                    products_info += f"   السعر: {metadata.get('price', 0):.2f} ريال\n"
-                    products_info += f"   الفئة: {metadata.get('category', 'غير محدد')}\n"
-                    if metadata.get('karat'):
-                        products_info += f"   العيار: {metadata.get('karat')}\n"
-                    if metadata.get('weight', 0) > 0:
-                        products_info += f"   الوزن: {metadata.get('weight')} جرام\n"
-                    if metadata.get('design'):
-                        products_info += f"   التصميم: {metadata.get('design')}\n"
-                    if metadata.get('product_url'):
-                        products_info += f"   الرابط: {metadata.get('product_url')}\n"
-                    products_info += f"   الوصف: {metadata.get('description', '')[:150]}...\n\n"
+                # Format results for LLM context (compact table within the token budget)
+                product_table, included = build_product_context(results)
+                products_info = f"تم العثور على {len(included)} منتج في المخزون:\n\n{product_table}\n\n"
 
                 # Store results - but don't always show them as cards
                 st.session_state.last_search_results = results
@@ -145,22 +122,18 @@ def get_ai_response_with_tools(user_message: str, conversation_history: list) ->
             }
         ]
 
-        # Add conversation history (last 6 messages)
-        recent_history = conversation_history[-6:] if len(conversation_history) > 6 else conversation_history
+        # Add conversation history (last 6 messages, packed into the token budget)
+        recent_history = build_history_context(conversation_history[-6:])
         st.write(f"🔍 DEBUG: Processing {len(recent_history)} history messages")
         for msg in recent_history:
-            if msg["role"] in ["user", "assistant"]:
-                content = msg["content"]
-                if len(content) > 200:
-                    content = content[:200] + "..."
-                messages.append({"role": msg["role"], "content": content})
-                st.write(f"📝 Added to context: {msg['role']}: {content[:50]}...")
+            messages.append(msg)
+            st.write(f"📝 Added to context: {msg['role']}: {msg['content'][:50]}...")
 
         # Add current user message
         messages.append({"role": "user", "content": user_message})
 
         # Call OpenAI with function calling
-        response = openai.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=messages,
             tools=[search_tool],
@@ -191,7 +164,7 @@ def get_ai_response_with_tools(user_message: str, conversation_history: list) ->
                     })
 
                     # Get final response with search results
-                    final_response = openai.chat.completions.create(
+                    final_response = chat_completion(
                         model="gpt-4",
                         messages=messages,
                         temperature=0.3
@@ -223,27 +196,16 @@ def display_products(products):
             metadata = result['metadata']
 
             with st.container():
-                st.markdown(f"**{metadata.get('name', 'منتج')}**")
-                st.markdown(f"💰 **{metadata.get('price', 0):.2f} ريال**")
-                st.markdown(f"📂 {metadata.get('category', 'غير محدد')}")
-
-                # Additional details
-                details = []
-                if metadata.get('karat'):
-                    details.append(f"العيار: {metadata.get('karat')}")
-                if metadata.get('weight', 0) > 0:
-                    details.append(f"الوزن: {metadata.get('weight')} جرام")
-                if metadata.get('design'):
-                    details.append(f"التصميم: {metadata.get('design')}")
-
-                if details:
-                    st.markdown(f"🔹 {' | '.join(details)}")
-
-                # Description
-                description = metadata.get('description', '')
-                if len(description) > 100:
-                    description = description[:100] + "..."
-                st.markdown(f"📝 {description}")
+                # Pre-rendered text (cached per product version)
+                fragments = get_fragments(result['id'], metadata)
+                st.markdown(f"**{fragments.name}**")
+                st.markdown(f"💰 **{fragments.price_text}**")
+                st.markdown(f"📂 {fragments.category}")
+
+                if fragments.card_details:
+                    st.markdown(f"🔹 {fragments.card_details}")
+
+                st.markdown(f"📝 {fragments.list_description}")
 
                 # Score
                 if 'score' in result:
@@ -277,8 +239,8 @@ uploaded_image = st.file_uploader(
 )
 
 if uploaded_image:
-    image = Image.open(uploaded_image)
-    st.image(image, caption="الصورة المرفوعة", width=200)
+    image = prepare_image(Image.open(uploaded_image))
+    st.image(image.image, caption="الصورة المرفوعة", width=200)
 
     if st.button("🔍 تحليل الصورة"):
         with st.spinner("تحليل الصورة..."):
@@ -8,6 +8,8 @@ sys.path.append('/home/hussein/shop-assistant')
 
 from shared.config import init_apis
 from shared.embeddings import get_text_embedding
+from shared.product_fragments import touch_product
+from shared.catalog_snapshot import record_change
 import json
 
 def fix_corrupted_descriptions():
@@ -70,6 +72,7 @@ def fix_corrupted_descriptions():
                     # Update metadata
                     updated_metadata = item['metadata'].copy()
                     updated_metadata['description'] = fixed_description
+                    touch_product(item['id'], updated_metadata)  # New version: cached fragments re-render
 
                     # Update in Pinecone
                     pinecone_index.upsert(vectors=[{
@@ -77,6 +80,7 @@ def fix_corrupted_descriptions():
                         "values": new_embedding,
                         "metadata": updated_metadata
                     }])
+                    record_change("upsert", item['id'], updated_metadata, new_embedding)  # Local snapshot and image search
 
                     print(f"✅ Fixed: {item['name']}")
                     print(f"   New description: {fixed_description[:100]}...")
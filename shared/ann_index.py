@@ -0,0 +1,400 @@
+"""
+Local HNSW approximate-nearest-neighbor index (faiss)
+Serves the same queries as `search_products` without a Pinecone round trip,
+for catalogs too large to scan. Inserts and deletes are applied in memory and
+appended to a journal; deletes are tombstones skipped at search time and
+removed by compaction. The graph is checkpointed to disk and other processes
+pick up changes by replaying the journal
+
+Vectors can be held as quantized codes instead of float32: scalar int8 inside
+the graph, or product-quantization codes scanned with asymmetric distances (a
+graph built on PQ distances loses too much recall). The quantized pass ranks a
+wider candidate list, which is re-scored exactly against the full-precision
+vectors in a memory-mapped file shared by every process through the page cache
+
+Each checkpoint writes its graph, full-precision vectors and journal under new
+file names and then replaces labels.json, which names them, so readers never
+pair a graph with another checkpoint's labels or vector rows. The row number
+of every vector in the vectors file is its faiss label; adds journal that row
+and drop any row left over from an add that never reached the journal
+
+Run `python -m shared.ann_index` to build the index from the catalog snapshot
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+import faiss
+import numpy as np
+from .catalog_indexes import ProductMatch
+from .catalog_snapshot import get_catalog_snapshot
+from .config import (
+    ANN_INDEX_DIR, ANN_HNSW_M, ANN_EF_CONSTRUCTION, ANN_EF_SEARCH,
+    ANN_COMPACT_TOMBSTONE_RATIO, ANN_JOURNAL_MAX_ENTRIES, EMBEDDING_DIMENSION,
+    ANN_STORAGE, ANN_PQ_COMPRESSION, ANN_PQ_MIN_TRAINING, ANN_RERANK_FACTOR
+)
+
+LABELS_FILE = "labels.json"  # Checkpoint manifest: labels, tombstones and the files below
+GRAPH_FILE = "hnsw.faiss"
+JOURNAL_FILE = "journal.jsonl"
+VECTORS_FILE = "vectors.f32"  # Full-precision rows, row number = faiss label
+CHECKPOINT_PREFIXES = ("hnsw-", "vectors-", "journal-")
+
+
+def _checkpoint_files(data: dict) -> dict:
+    """Files of a checkpoint (fixed names for indexes written before generations)"""
+    return {
+        "graph": data.get("graph", GRAPH_FILE),
+        "vectors": data.get("vectors", VECTORS_FILE),
+        "journal": data.get("journal", JOURNAL_FILE)
+    }
+
+
+def _normalize(vectors) -> np.ndarray:
+    """Unit-length float32 rows so inner product equals cosine similarity"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.where(norms > 0, norms, 1.0))
+
+
+class LocalANNIndex:
+    """HNSW graph over product vectors with tombstoned deletes and a change journal"""
+
+    def __init__(self, directory: str = ANN_INDEX_DIR, dimension: int = EMBEDDING_DIMENSION,
+                 m: int = ANN_HNSW_M, ef_construction: int = ANN_EF_CONSTRUCTION, ef_search: int = ANN_EF_SEARCH,
+                 storage: str = ANN_STORAGE):
+        self.directory = directory
+        self.dimension = dimension
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.requested_storage = storage
+        self.storage = storage  # May fall back to a simpler encoding at build time
+        self.lock = threading.RLock()
+        self.index = None
+        self._vectors = None  # mmap of VECTORS_FILE
+        self.labels: List[str] = []  # faiss label -> product ID
+        self.label_by_id = {}
+        self.deleted = set()
+        self._selector = None
+        self._journal_position = 0
+        self._journal_entries = 0
+        self._files = _checkpoint_files({})
+        self._manifest_mtime = None
+        self.load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path(LABELS_FILE))
+
+    def __len__(self):
+        return len(self.label_by_id)
+
+    def _new_index(self, vectors: np.ndarray):
+        """Empty graph for the configured storage, trained on the build vectors"""
+        self.storage = self.requested_storage
+        pq_subvectors = max(self.dimension * 4 // ANN_PQ_COMPRESSION, 1)
+        if self.storage == "pq" and (len(vectors) < ANN_PQ_MIN_TRAINING or self.dimension % pq_subvectors):
+            self.storage = "int8"  # Too few vectors to train the codebooks
+        if self.storage != "flat" and not len(vectors):
+            self.storage = "flat"  # Nothing to train on
+
+        if self.storage == "pq":
+            index = faiss.IndexPQ(self.dimension, pq_subvectors, 8, faiss.METRIC_INNER_PRODUCT)
+        elif self.storage == "int8":
+            index = faiss.IndexHNSWSQ(self.dimension, faiss.ScalarQuantizer.QT_8bit, self.m, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWFlat(self.dimension, self.m, faiss.METRIC_INNER_PRODUCT)
+        if self.storage != "pq":
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+        if self.storage != "flat":
+            index.train(vectors)
+        return index
+
+    def code_size(self) -> int:
+        """Bytes per vector code held in memory (graph links excluded)"""
+        if self.index is None:
+            return 0
+        return self.index.code_size if self.storage == "pq" else faiss.downcast_index(self.index.storage).code_size
+
+    def _full_vectors(self, rows: int) -> np.ndarray:
+        """Full-precision vectors, remapped when the file has grown past `rows`"""
+        if self._vectors is None or len(self._vectors) < rows:
+            path = self._path(self._files["vectors"])
+            if not os.path.exists(path) or not os.path.getsize(path):
+                return np.zeros((0, self.dimension), dtype=np.float32)
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, self.dimension)
+        return self._vectors
+
+    # Persistence
+
+    def build(self, items: Iterable[Tuple[str, object]]):
+        """Build a fresh graph from (product_id, vector) pairs and checkpoint it"""
+        with self.lock:
+            product_ids, vectors = [], []
+            for product_id, vector in items:
+                if vector is not None and np.any(vector):
+                    product_ids.append(product_id)
+                    vectors.append(vector)
+            vectors = _normalize(vectors) if vectors else np.zeros((0, self.dimension), dtype=np.float32)
+
+            self.index = self._new_index(vectors)
+            if len(vectors):
+                self.index.add(vectors)
+            # Vectors of the new checkpoint; published with the graph and labels by save()
+            os.makedirs(self.directory, exist_ok=True)
+            vectors_file = f"vectors-{time.time_ns()}.f32"
+            with open(self._path(vectors_file), "wb") as f:
+                f.write(vectors.tobytes())
+            self._vectors = None
+            self.labels = product_ids
+            self.label_by_id = {product_id: label for label, product_id in enumerate(product_ids)}
+            self.deleted = set()
+            self._selector = None
+            self.save(vectors_file)
+
+    def save(self, vectors_file: Optional[str] = None):
+        """Checkpoint the graph and labels under new files with an empty journal, then switch labels.json to them"""
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            generation = time.time_ns()
+            previous = dict(self._files)
+            files = dict(previous, graph=f"hnsw-{generation}.faiss", journal=f"journal-{generation}.jsonl")
+            if vectors_file:
+                files["vectors"] = vectors_file
+            faiss.write_index(self.index, self._path(files["graph"]))
+            open(self._path(files["journal"]), "w").close()
+            with open(self._path(f"{LABELS_FILE}.tmp"), "w", encoding="utf-8") as f:
+                json.dump({"labels": self.labels, "deleted": sorted(self.deleted), "storage": self.storage, **files}, f)
+            os.replace(self._path(f"{LABELS_FILE}.tmp"), self._path(LABELS_FILE))
+            self._files = files
+            self._journal_position = 0
+            self._journal_entries = 0
+            self._manifest_mtime = os.path.getmtime(self._path(LABELS_FILE))
+            self._remove_stale_files(set(files.values()) | set(previous.values()))
+
+    def _remove_stale_files(self, keep: set):
+        """Delete checkpoint files older than the current and previous checkpoints (readers may still use those)"""
+        for name in os.listdir(self.directory):
+            stale = name.startswith(CHECKPOINT_PREFIXES) or name in (GRAPH_FILE, VECTORS_FILE, JOURNAL_FILE)
+            if stale and name not in keep:
+                os.remove(self._path(name))
+
+    def load(self):
+        """Read the checkpointed graph and replay the journal"""
+        with self.lock:
+            if not self.exists():
+                return
+            manifest_mtime = os.path.getmtime(self._path(LABELS_FILE))
+            with open(self._path(LABELS_FILE), encoding="utf-8") as f:
+                data = json.load(f)
+            self._files = _checkpoint_files(data)
+            self.index = faiss.read_index(self._path(self._files["graph"]))
+            self.labels = data["labels"]
+            self.deleted = set(data["deleted"])
+            self.storage = data.get("storage", "flat")
+            if self.storage != "pq":
+                self.index.hnsw.efSearch = self.ef_search
+            self._vectors = None
+            self.label_by_id = {product_id: label for label, product_id in enumerate(self.labels) if label not in self.deleted}
+            self._selector = None
+            self._journal_position = 0
+            self._journal_entries = 0
+            self._manifest_mtime = manifest_mtime
+            self._replay_journal()
+
+    def refresh(self):
+        """Pick up changes written by other processes"""
+        with self.lock:
+            if not self.exists():
+                return
+            if os.path.getmtime(self._path(LABELS_FILE)) != self._manifest_mtime:
+                self.load()
+            else:
+                self._replay_journal()
+
+    def _replay_journal(self):
+        path = self._path(self._files["journal"])
+        if not os.path.exists(path) or os.path.getsize(path) <= self._journal_position:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._journal_position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written entry; read it next time
+                entry = json.loads(line)
+                if entry["op"] == "add" and entry.get("row", len(self.labels)) != len(self.labels):
+                    print(f"[ann_index] journal row {entry['row']} does not match label {len(self.labels)}; waiting for a checkpoint")
+                    break
+                self._journal_position += len(line)
+                self._journal_entries += 1
+                if entry["op"] == "delete":
+                    self._delete(entry["id"])
+                else:
+                    self._add(entry["id"], entry["values"])
+
+    def _journal(self, entry: dict):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with open(self._path(self._files["journal"]), "ab") as f:
+            f.write(line)
+        self._journal_position += len(line)
+        self._journal_entries += 1
+
+    # Mutations
+
+    def _add(self, product_id: str, vector):
+        self._delete(product_id)  # Re-inserting replaces the old vector
+        self.index.add(_normalize(vector))
+        self.labels.append(product_id)
+        self.label_by_id[product_id] = len(self.labels) - 1
+
+    def _delete(self, product_id: str):
+        label = self.label_by_id.pop(product_id, None)
+        if label is not None:
+            self.deleted.add(label)
+            self._selector = None
+
+    def add(self, product_id: str, vector):
+        """Insert or replace one product vector"""
+        with self.lock:
+            self.refresh()
+            # Full-precision row first, so readers replaying the journal can re-score it.
+            # Its row must equal the new label: drop rows of adds that never reached the journal
+            row = len(self.labels)
+            path = self._path(self._files["vectors"])
+            row_bytes = row * self.dimension * 4
+            with open(path, "ab") as f:
+                if f.tell() != row_bytes:
+                    self._vectors = None  # Never keep a mapping across a truncation
+                    f.truncate(row_bytes)
+                f.write(_normalize(vector).tobytes())
+            self._journal({"op": "add", "id": product_id, "values": [float(v) for v in vector], "row": row})
+            self._add(product_id, vector)
+            self._maintain()
+
+    def delete(self, product_id: str):
+        """Tombstone one product (removed from the graph at the next compaction)"""
+        with self.lock:
+            self.refresh()
+            self._journal({"op": "delete", "id": product_id})
+            self._delete(product_id)
+            self._maintain()
+
+    def tombstone_ratio(self) -> float:
+        return len(self.deleted) / len(self.labels) if self.labels else 0.0
+
+    def _maintain(self):
+        if self.tombstone_ratio() > ANN_COMPACT_TOMBSTONE_RATIO:
+            self.compact()
+        elif self._journal_entries >= ANN_JOURNAL_MAX_ENTRIES:
+            self.save()
+
+    def compact(self):
+        """Rebuild the graph from live vectors only, dropping tombstones"""
+        with self.lock:
+            full_vectors = self._full_vectors(len(self.labels))
+            live = [(product_id, np.array(full_vectors[label])) for product_id, label in self.label_by_id.items()]
+            self.build(live)
+
+    # Queries
+
+    def _search_params(self, ef_search: int):
+        if not self.deleted:
+            return faiss.SearchParametersHNSW(efSearch=ef_search)
+        if self._selector is None:
+            batch = faiss.IDSelectorBatch(np.array(sorted(self.deleted), dtype=np.int64))
+            self._selector = (batch, faiss.IDSelectorNot(batch))  # Keep both alive for faiss
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=self._selector[1])
+
+    def search(self, query_vector, top_k: int = 10, min_score: float = 0.0,
+               ef_search: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(product_id, cosine score) pairs, best first"""
+        query = _normalize(query_vector)
+        with self.lock:
+            if self.index is None or not self.label_by_id:
+                return []
+            # Quantized codes only rank candidates; exact scores come from the full-precision rows
+            candidates = top_k if self.storage == "flat" else top_k * ANN_RERANK_FACTOR
+            if self.storage == "pq":
+                # The code scan has no selector support: over-fetch and drop tombstones here
+                scores, labels = self.index.search(query, min(candidates + len(self.deleted), len(self.labels)))
+                live = np.array([label >= 0 and label not in self.deleted for label in labels[0]], dtype=bool)
+                scores, labels = scores[0][live][:candidates], labels[0][live][:candidates]
+            else:
+                ef_search = max(ef_search or self.ef_search, candidates)
+                scores, labels = self.index.search(query, candidates, params=self._search_params(ef_search))
+                scores, labels = scores[0][labels[0] >= 0], labels[0][labels[0] >= 0]
+            if self.storage != "flat" and len(labels):
+                scores = self._full_vectors(int(labels.max()) + 1)[labels] @ query[0]
+            order = np.argsort(-scores, kind="stable")[:top_k]
+            return [
+                (self.labels[labels[i]], float(scores[i]))
+                for i in order
+                if scores[i] >= min_score
+            ]
+
+
+_ann_index: Optional[LocalANNIndex] = None
+_ann_lock = threading.Lock()
+
+
+def get_ann_index() -> Optional[LocalANNIndex]:
+    """Return the process-wide index, or None when it has not been built"""
+    global _ann_index
+    if _ann_index is None:
+        with _ann_lock:
+            if _ann_index is None and os.path.exists(os.path.join(ANN_INDEX_DIR, LABELS_FILE)):
+                _ann_index = LocalANNIndex()
+    if _ann_index is not None:
+        _ann_index.refresh()
+    return _ann_index
+
+
+def ann_search(query_vector, top_k: int = 10, min_score: float = 0.3) -> Optional[List]:
+    """
+    Local ANN search with hydrated metadata (same shape as Pinecone matches)
+    Returns None when the local index is not built or the snapshot holding the
+    metadata is not loaded, so callers query Pinecone
+    """
+    ann_index = get_ann_index()
+    if ann_index is None or not len(ann_index):
+        return None
+    snapshot = get_catalog_snapshot()
+    if snapshot.loaded_at is None:
+        return None
+    matches = []
+    for product_id, score in ann_index.search(query_vector, top_k, min_score):
+        metadata = snapshot.get(product_id)
+        if metadata is not None:  # Deleted from the catalog
+            matches.append(ProductMatch(product_id, score, metadata))
+    return matches
+
+
+def ann_insert(product_id: str, vector):
+    """Add a product to the local index (no-op until it has been built)"""
+    ann_index = get_ann_index()
+    if ann_index is not None:
+        ann_index.add(product_id, vector)
+
+
+def ann_delete(product_id: str):
+    ann_index = get_ann_index()
+    if ann_index is not None:
+        ann_index.delete(product_id)
+
+
+def build_from_snapshot(directory: str = ANN_INDEX_DIR) -> int:
+    """Build the graph from the vectors in the local catalog snapshot"""
+    snapshot = get_catalog_snapshot()
+    ann_index = LocalANNIndex(directory)
+    ann_index.build((product_id, snapshot.vector(product_id)) for product_id in snapshot.product_ids())
+    return len(ann_index)
+
+
+if __name__ == "__main__":
+    print(f"Indexed {build_from_snapshot()} products into {ANN_INDEX_DIR}")
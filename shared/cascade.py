@@ -0,0 +1,139 @@
+"""
+Concurrent fallback cascades
+Runs a primary stage and its fallbacks at the same time instead of one after
+the other, returns the highest-priority acceptable result under a deadline
+and cancels whatever is still pending. run_all runs independent tasks (e.g.
+the tool calls of one assistant turn) concurrently and keeps every result
+
+Stages that are already running are not interrupted: an upstream request in
+progress always completes and is paid for. Once the cascade has returned (or
+run_all has hit its deadline), a stage stops at its next check_cancelled()
+call, so stages should call it between upstream calls
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, List, Optional, Tuple, Union
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from .config import CASCADE_DEADLINE_SECONDS
+
+
+class StageCancelled(Exception):
+    """Raised by check_cancelled inside a stage whose result is no longer needed"""
+
+
+_stage = threading.local()
+
+
+def check_cancelled():
+    """Stop the current stage if its cascade has finished (no-op outside cascades)"""
+    cancel = getattr(_stage, "cancel", None)
+    if cancel is not None and cancel.is_set():
+        raise StageCancelled()
+
+
+def _with_script_context(fn: Callable, ctx, cancel: threading.Event) -> Callable:
+    """Attach the Streamlit session context so stages may use st.* from worker threads,
+    and the cancellation event read by check_cancelled"""
+    def run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        _stage.cancel = cancel
+        try:
+            return fn()
+        finally:
+            _stage.cancel = None
+    return run
+
+
+def run_cascade(
+    stages: List[Callable[[], Any]],
+    is_acceptable: Callable[[Any], bool] = bool,
+    deadline: float = CASCADE_DEADLINE_SECONDS
+) -> Tuple[Optional[int], Any]:
+    """
+    Start all stages concurrently (stages[0] has the highest priority)
+    Returns (stage index, result) as soon as the best stage that can still win
+    has an acceptable result, or (None, None) when none does before the deadline
+    """
+    ctx = get_script_run_ctx()
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="cascade")
+    futures = [executor.submit(_with_script_context(stage, ctx, cancel)) for stage in stages]
+    results = {}
+    end = time.monotonic() + deadline
+
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # Deadline reached
+
+            for future in done:
+                position = futures.index(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[cascade] stage {position} failed: {e}")
+                    continue
+                if is_acceptable(result):
+                    results[position] = result
+
+            # Return once no higher-priority stage is still running
+            for position, future in enumerate(futures):
+                if position in results:
+                    return position, results[position]
+                if not future.done():
+                    break
+
+        if results:
+            best = min(results)
+            return best, results[best]
+        return None, None
+
+    finally:
+        # Drop stages that have not started; running ones stop at their next check_cancelled()
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_all(
+    tasks: List[Callable[[], Any]],
+    deadline: float = CASCADE_DEADLINE_SECONDS
+) -> List[Union[Any, Exception]]:
+    """
+    Run independent tasks concurrently, one worker each
+    Returns their results in task order; a task that failed or missed the
+    deadline yields its exception (TimeoutError) instead
+    """
+    if not tasks:
+        return []
+    if len(tasks) == 1:
+        try:
+            return [tasks[0]()]
+        except Exception as e:
+            return [e]
+
+    ctx = get_script_run_ctx()
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="tasks")
+    futures = [executor.submit(_with_script_context(task, ctx, cancel)) for task in tasks]
+    try:
+        wait(futures, timeout=deadline)
+        results = []
+        for position, future in enumerate(futures):
+            if not future.done():
+                print(f"[cascade] task {position} missed the deadline")
+                results.append(TimeoutError(f"task {position} missed the deadline"))
+            elif future.exception() is not None:
+                print(f"[cascade] task {position} failed: {future.exception()}")
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+    finally:
+        # Tasks that missed the deadline stop at their next check_cancelled()
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,269 @@
+"""
+Secondary indexes over the catalog snapshot
+Sorted price and weight arrays answer range lookups by binary search, and one
+bitmap per karat (and category) answers equality filters. The resulting
+candidate set pre-filters vector search, so budget-bounded queries score only
+the products that satisfy the constraints
+"""
+
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from .catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+from .config import PRIMARY_DIMENSION, PRIMARY_RERANK_FACTOR, HYBRID_ALPHA
+from .embeddings import shorten_embedding
+from .query_parser import normalize_arabic
+from .sparse_vectors import encode_query, hybrid_scale, supports_sparse
+
+SCAN_CHUNK_ROWS = 4096  # Mapped vector rows read at a time, bounding the transient copy
+FILTER_KEYS = ["min_price", "max_price", "karat", "min_weight", "max_weight"]
+
+
+class ProductMatch:
+    """Search hit with the same attributes as a Pinecone match"""
+
+    def __init__(self, id: str, score: float, metadata: Dict):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+
+def has_filters(constraints: Optional[Dict]) -> bool:
+    """True when the parsed query has hard numeric or karat constraints"""
+    return bool(constraints) and any(constraints.get(key) is not None for key in FILTER_KEYS)
+
+
+def pinecone_filter(constraints: Dict) -> Dict:
+    """Same constraints as a Pinecone metadata filter (server-side pre-filter)"""
+    conditions = {}
+    for field in ["price", "weight"]:
+        bounds = {}
+        if constraints.get(f"min_{field}") is not None:
+            bounds["$gte"] = float(constraints[f"min_{field}"])
+        if constraints.get(f"max_{field}") is not None:
+            bounds["$lte"] = float(constraints[f"max_{field}"])
+        if bounds:
+            conditions[field] = bounds
+    if constraints.get("karat"):
+        conditions["karat"] = {"$eq": constraints["karat"]}
+    return conditions
+
+
+class CatalogIndexes:
+    """
+    Sorted arrays and bitmaps built from one snapshot revision
+    Rows refer into the pinned snapshot state (its mapped columns, or the overlay
+    for changed products); vectors and metadata are read from it on demand
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.revision = snapshot.revision
+        self.state = snapshot.state
+        self.ids: List[str] = list(self.state.product_ids())
+        count = len(self.ids)
+        columns = self.state.columns
+        self.dimension = columns["vectors"].shape[1] if "vectors" in columns else 0
+        # Column row per product; -1 for products served from the overlay
+        self.base_rows = np.array([-1 if product_id in self.state.overlay else self.state.row_by_id[product_id]
+                                   for product_id in self.ids], dtype=np.int64)
+        base = np.flatnonzero(self.base_rows >= 0)
+        overlaid = np.flatnonzero(self.base_rows < 0)
+
+        prices = np.zeros(count, dtype=np.float64)
+        weights = np.zeros(count, dtype=np.float64)
+        norms = np.zeros(count, dtype=np.float32)
+        karat_codes = np.full(count, -1, dtype=np.int64)
+        category_codes = np.full(count, -1, dtype=np.int64)
+        if len(base):
+            rows = self.base_rows[base]
+            prices[base] = columns["price"][rows]
+            weights[base] = columns["weight"][rows]
+            karat_codes[base] = columns["karat"][rows]
+            category_codes[base] = columns["category"][rows]
+            for start in range(0, len(base), SCAN_CHUNK_ROWS):
+                chunk = base[start:start + SCAN_CHUNK_ROWS]
+                norms[chunk] = np.linalg.norm(columns["vectors"][self.base_rows[chunk]], axis=1)
+
+        karats, categories = {}, {}
+        for row in overlaid:
+            metadata, vector = self.state.overlay[self.ids[row]]
+            prices[row] = float(metadata.get("price", 0) or 0)
+            weights[row] = float(metadata.get("weight", 0) or 0)
+            karats[row], categories[row] = metadata.get("karat"), metadata.get("category")
+            if vector is not None:
+                norms[row] = np.linalg.norm(vector)
+
+        self.has_vectors = bool(count) and bool(np.all(norms > 0))
+        self.norms = np.where(norms > 0, norms, 1.0)
+        self.price_order = np.argsort(prices, kind="stable")
+        self.sorted_prices = prices[self.price_order]
+        self.weight_order = np.argsort(weights, kind="stable")
+        self.sorted_weights = weights[self.weight_order]
+        self.karat_bitmaps = self._bitmaps(karat_codes, karats, count)
+        self.category_bitmaps = self._bitmaps(category_codes, categories, count)
+
+    def _bitmaps(self, codes: np.ndarray, overlay_values: Dict[int, str], count: int) -> Dict[str, np.ndarray]:
+        """One bitmap per normalized value, from the interned column codes plus overlay rows"""
+        bitmaps: Dict[str, np.ndarray] = {}
+
+        def mark(value, rows):
+            if value:
+                key = normalize_arabic(value)
+                if key not in bitmaps:
+                    bitmaps[key] = np.zeros(count, dtype=bool)
+                bitmaps[key][rows] = True
+
+        for code in np.unique(codes[codes >= 0]):
+            mark(self.state.strings[code], codes == code)
+        for row, value in overlay_values.items():
+            mark(value, row)
+        return bitmaps
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Vectors of the given rows, gathered from the mapped column and the overlay"""
+        vectors = np.zeros((len(rows), self.dimension), dtype=np.float32)
+        base_rows = self.base_rows[rows]
+        from_columns = base_rows >= 0
+        if from_columns.any():
+            vectors[from_columns] = self.state.columns["vectors"][base_rows[from_columns]]
+        for i in np.flatnonzero(~from_columns):
+            vector = self.state.overlay[self.ids[rows[i]]][1]
+            if vector is not None:
+                vectors[i] = vector
+        return vectors
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _range_mask(order: np.ndarray, sorted_values: np.ndarray, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        start = np.searchsorted(sorted_values, low, side="left") if low is not None else 0
+        end = np.searchsorted(sorted_values, high, side="right") if high is not None else len(sorted_values)
+        mask = np.zeros(len(sorted_values), dtype=bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def candidates(self, constraints: Dict) -> np.ndarray:
+        """Boolean mask of the products matching every hard constraint"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if constraints.get("min_price") is not None or constraints.get("max_price") is not None:
+            mask &= self._range_mask(self.price_order, self.sorted_prices, constraints.get("min_price"), constraints.get("max_price"))
+        if constraints.get("min_weight") is not None or constraints.get("max_weight") is not None:
+            mask &= self._range_mask(self.weight_order, self.sorted_weights, constraints.get("min_weight"), constraints.get("max_weight"))
+        if constraints.get("karat"):
+            mask &= self.karat_bitmaps.get(normalize_arabic(constraints["karat"]), np.zeros(len(self.ids), dtype=bool))
+        return mask
+
+    def search(self, query_vector, constraints: Dict, top_k: int = 10, min_score: float = 0.0) -> List[ProductMatch]:
+        """Cosine similarity over the pre-filtered candidates only"""
+        rows = np.flatnonzero(self.candidates(constraints))
+        if not len(rows):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = np.concatenate([self.vectors(rows[start:start + SCAN_CHUNK_ROWS]) @ query
+                                 for start in range(0, len(rows), SCAN_CHUNK_ROWS)])
+        scores /= self.norms[rows] * (np.linalg.norm(query) or 1.0)
+        best = np.argsort(-scores)[:top_k]
+        return [
+            ProductMatch(self.ids[rows[i]], float(scores[i]), self.state.get(self.ids[rows[i]]))
+            for i in best if scores[i] >= min_score
+        ]
+
+
+_indexes: Optional[CatalogIndexes] = None
+_indexes_lock = threading.Lock()
+
+
+def get_catalog_indexes(index=None) -> CatalogIndexes:
+    """Return the process-wide indexes, rebuilt when the snapshot changes"""
+    global _indexes
+    snapshot = get_catalog_snapshot(index)
+    with _indexes_lock:
+        if _indexes is None or _indexes.revision != snapshot.revision:
+            _indexes = CatalogIndexes(snapshot)
+    return _indexes
+
+
+def rerank_full_vectors(matches, query_vector, top_k: int, snapshot: Optional[CatalogSnapshot] = None) -> List[ProductMatch]:
+    """Re-score short-vector matches with the full vectors of the local snapshot
+    (matches without a local vector keep their Pinecone score)"""
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = np.linalg.norm(query) or 1.0
+    reranked = []
+    for match in matches:
+        vector = snapshot.vector(match.id)
+        score = match.score
+        if vector is not None and len(vector) == len(query) and np.any(vector):
+            score = float(np.dot(vector, query) / (np.linalg.norm(vector) * query_norm))
+        reranked.append(ProductMatch(match.id, score, match.metadata))
+    reranked.sort(key=lambda match: match.score, reverse=True)
+    return reranked[:top_k]
+
+
+def hydrate_matches(index, matches, snapshot: Optional[CatalogSnapshot] = None) -> List[ProductMatch]:
+    """Attach metadata to ID/score matches from the local snapshot;
+    products missing locally are fetched from Pinecone in one call"""
+    if snapshot is None:
+        snapshot = get_catalog_snapshot(index)  # Builds a missing or old-format snapshot once
+    metadata_by_id = {match.id: snapshot.get(match.id) for match in matches}
+    missing = [product_id for product_id, metadata in metadata_by_id.items() if metadata is None]
+    if missing:
+        fetched = index.fetch(ids=missing).vectors
+        for product_id in missing:
+            if product_id in fetched:
+                metadata_by_id[product_id] = dict(fetched[product_id].metadata or {})
+    return [
+        ProductMatch(match.id, match.score, metadata_by_id[match.id])
+        for match in matches
+        if metadata_by_id.get(match.id) is not None  # Deleted since the query
+    ]
+
+
+def primary_query(index, query_vector, top_k: int = 10, filter: Optional[Dict] = None,
+                  query_text: Optional[str] = None, min_score: float = 0.0) -> List[ProductMatch]:
+    """
+    Pinecone query with the vector size stored in the index, returning IDs and
+    scores only; metadata is hydrated locally for the final top_k
+    In v2 mode the short vector fetches PRIMARY_RERANK_FACTOR x candidates,
+    re-ranked with the full query vector. With hybrid search on (dotproduct
+    indexes only), the query text's sparse lexical vector is sent in the same
+    request and min_score, tuned for dense cosine scores, is scaled by HYBRID_ALPHA
+    """
+    reduced = PRIMARY_DIMENSION < len(query_vector)
+    vector = shorten_embedding(query_vector) if reduced else query_vector
+    kwargs = {"filter": filter} if filter else {}
+
+    hybrid = False
+    if query_text and supports_sparse(index):
+        sparse = encode_query(query_text)
+        if sparse["indices"]:
+            hybrid = True
+            vector, kwargs["sparse_vector"] = hybrid_scale(vector, sparse, HYBRID_ALPHA)
+
+    results = index.query(
+        vector=vector,
+        top_k=top_k * PRIMARY_RERANK_FACTOR if reduced and not hybrid else top_k,
+        include_metadata=False,
+        **kwargs
+    )
+    # Hybrid scores already blend both legs; a dense-only rerank would drop the lexical one
+    matches = rerank_full_vectors(results.matches, query_vector, top_k) if reduced and not hybrid else results.matches
+    if hybrid:
+        min_score *= HYBRID_ALPHA  # alpha * dense + (1 - alpha) * sparse: a dense match without lexical overlap
+    return hydrate_matches(index, [match for match in matches if match.score >= min_score])
+
+
+def filtered_search(index, query_vector, constraints: Dict, top_k: int = 10, min_score: float = 0.0,
+                    query_text: Optional[str] = None) -> List:
+    """
+    Vector search restricted to products matching the price/weight/karat constraints
+    Uses the local indexes when the snapshot carries vectors, else a Pinecone metadata filter
+    """
+    indexes = get_catalog_indexes(index)
+    if indexes.has_vectors:
+        return indexes.search(query_vector, constraints, top_k, min_score)
+
+    return primary_query(index, query_vector, top_k, filter=pinecone_filter(constraints), query_text=query_text,
+                         min_score=min_score)
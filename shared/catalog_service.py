@@ -0,0 +1,71 @@
+"""
+Process-wide catalog and retrieval service
+One copy of the hybrid retriever (vector + BM25) and of the catalog snapshot
+is shared by every Streamlit session in the process instead of one per
+session. Each app runs in its own process; they share the memory-mapped
+snapshot files through the OS page cache
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+import streamlit as st
+from .catalog_snapshot import get_catalog_snapshot
+from .config import CATALOG_REFRESH_SECONDS
+from .langchain_rag import ArabicJewelryRAG
+from .singleflight import singleflight, text_key
+
+
+class CatalogService:
+    """Thread-safe query API over the shared catalog"""
+
+    def __init__(self, pinecone_index, openai_api_key: str):
+        self.pinecone_index = pinecone_index
+        self.snapshot = get_catalog_snapshot(pinecone_index)
+        self.rag = ArabicJewelryRAG(pinecone_index, openai_api_key)
+        self.revision = self.snapshot.revision
+        self.refreshed_at = time.monotonic()
+        self.rebuild_lock = threading.Lock()
+
+    def _refresh_if_stale(self):
+        """Rebuild the retriever after catalog changes (at most once per CATALOG_REFRESH_SECONDS)"""
+        if time.monotonic() - self.refreshed_at < CATALOG_REFRESH_SECONDS:
+            return
+        if not self.rebuild_lock.acquire(blocking=False):
+            return  # Another session is already rebuilding; keep serving the current retriever
+        try:
+            self.refreshed_at = time.monotonic()
+            self.snapshot.refresh()
+            if self.snapshot.revision != self.revision:
+                revision = self.snapshot.revision
+                # Build the new retriever aside and swap it in with one assignment
+                self.rag = ArabicJewelryRAG(self.pinecone_index, self.rag.openai_api_key)
+                self.revision = revision
+        finally:
+            self.rebuild_lock.release()
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+        """Hybrid product search (retrievers are read-only, so sessions query concurrently)"""
+        self._refresh_if_stale()
+        # Concurrent identical searches from other sessions share one retrieval
+        return singleflight("catalog_search", (self.revision, text_key(query), max_results),
+                            lambda: self.rag.search(query, max_results=max_results))
+
+    def conversational_search(self, query: str, conversation_history: List = None) -> tuple:
+        """Search and generate the conversational answer"""
+        results = self.search(query)
+        return self.rag.answer_from_results(query, results, conversation_history)
+
+    def get_product(self, product_id: str) -> Optional[Dict]:
+        """Product metadata from the local snapshot"""
+        return self.snapshot.get(product_id)
+
+    def product_count(self) -> int:
+        return len(self.snapshot)
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog_service(_pinecone_index, openai_api_key: str) -> CatalogService:
+    """Return the process-wide catalog service (built once, shared by all sessions)
+    Failures are raised rather than cached, so the next session retries"""
+    return CatalogService(_pinecone_index, openai_api_key)
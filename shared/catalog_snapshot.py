@@ -0,0 +1,359 @@
+"""
+Compact columnar catalog snapshot
+Products are stored on disk as memory-mapped columns: float arrays for price
+and weight, int32 codes into an interned string table for the short text
+fields, one description blob with offsets and a float32 vector block. Loading
+is a handful of mmap calls, and changes made after the snapshot was written
+are replayed from an append-only change log. Each rebuild writes its files
+into a new generation directory and then switches the manifest to it, so a
+reader never maps a mix of old and new columns
+
+Run `python -m shared.catalog_snapshot` to rebuild the snapshot from Pinecone
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from .config import CATALOG_SNAPSHOT_DIR, CATALOG_FETCH_LIMIT, EMBEDDING_DIMENSION, PRIMARY_DIMENSION
+
+# Short text fields stored as codes into the string table
+STRING_FIELDS = ["name", "category", "karat", "design", "style", "product_url", "image_url", "image_key", "catalog_version"]
+NUMERIC_FIELDS = ["price", "weight"]
+SNAPSHOT_FORMAT = 2  # Bumped when the columns change; older snapshots are rebuilt
+
+MANIFEST_FILE = "manifest.json"
+STRINGS_FILE = "strings.json"
+DESCRIPTIONS_FILE = "descriptions.bin"
+CHANGE_LOG_FILE = "changes.jsonl"
+GENERATION_PREFIX = "gen-"
+
+
+def _column_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.npy")
+
+
+def _save_array(directory: str, name: str, array: np.ndarray):
+    np.save(_column_path(directory, name), array)
+
+
+def _generation_dir(directory: str, manifest: Dict) -> str:
+    """Directory holding the files of the manifest's generation (the snapshot directory for old snapshots)"""
+    return os.path.join(directory, manifest.get("generation", ""))
+
+
+def _remove_old_generations(directory: str, keep: List[str]):
+    """Delete generations older than the current and previous ones (readers may still map the previous)"""
+    for name in os.listdir(directory):
+        if name.startswith(GENERATION_PREFIX) and name not in keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(products: List[Tuple[str, Dict, Optional[List[float]]]], directory: str = CATALOG_SNAPSHOT_DIR):
+    """Write (id, metadata, vector) rows as a columnar snapshot and reset the change log"""
+    os.makedirs(directory, exist_ok=True)
+
+    strings: List[str] = []
+    string_codes: Dict[str, int] = {}
+
+    def intern(value) -> int:
+        value = str(value or "")
+        if value not in string_codes:
+            string_codes[value] = len(strings)
+            strings.append(value)
+        return string_codes[value]
+
+    count = len(products)
+    ids = np.zeros(count, dtype=np.int32)
+    codes = {field: np.zeros(count, dtype=np.int32) for field in STRING_FIELDS}
+    numbers = {field: np.zeros(count, dtype=np.float64) for field in NUMERIC_FIELDS}
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    vectors = np.zeros((count, EMBEDDING_DIMENSION), dtype=np.float32)
+    blob = bytearray()
+
+    for row, (product_id, metadata, values) in enumerate(products):
+        ids[row] = intern(product_id)
+        for field in STRING_FIELDS:
+            codes[field][row] = intern(metadata.get(field, ""))
+        for field in NUMERIC_FIELDS:
+            numbers[field][row] = float(metadata.get(field, 0) or 0)
+        blob.extend((metadata.get("description") or "").encode("utf-8"))
+        offsets[row + 1] = len(blob)
+        if values is not None and len(values) == EMBEDDING_DIMENSION:
+            vectors[row] = values
+
+    # Column files go into a fresh generation; the manifest switch publishes them all at once
+    generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+    generation_dir = os.path.join(directory, generation)
+    os.makedirs(generation_dir)
+    _save_array(generation_dir, "ids", ids)
+    for field in STRING_FIELDS:
+        _save_array(generation_dir, field, codes[field])
+    for field in NUMERIC_FIELDS:
+        _save_array(generation_dir, field, numbers[field])
+    _save_array(generation_dir, "description_offsets", offsets)
+    _save_array(generation_dir, "vectors", vectors)
+    with open(os.path.join(generation_dir, DESCRIPTIONS_FILE), "wb") as f:
+        f.write(bytes(blob))
+    with open(os.path.join(generation_dir, STRINGS_FILE), "w", encoding="utf-8") as f:
+        json.dump(strings, f, ensure_ascii=False)
+
+    previous = None
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            previous = json.load(f).get("generation")
+
+    # Manifest last: readers only switch to the new files once it is in place
+    _write_atomic(os.path.join(directory, CHANGE_LOG_FILE), b"")
+    manifest = {
+        "count": count, "dimension": EMBEDDING_DIMENSION, "format": SNAPSHOT_FORMAT,
+        "created_at": time.time(), "generation": generation
+    }
+    _write_atomic(manifest_path, json.dumps(manifest).encode("utf-8"))
+    _remove_old_generations(directory, keep=[generation, previous])
+
+
+def record_change(op: str, product_id: str, metadata: Optional[Dict] = None, values: Optional[List[float]] = None,
+                  directory: str = CATALOG_SNAPSHOT_DIR):
+    """Append an upsert/delete to the change log (no-op until a snapshot exists)"""
+    if not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return
+    entry = {"op": op, "id": product_id}
+    if metadata is not None:
+        entry["metadata"] = metadata
+    if values is not None:
+        entry["values"] = [float(value) for value in values]
+    with open(os.path.join(directory, CHANGE_LOG_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class _SnapshotState:
+    """One published view of the catalog: mapped columns plus the changes replayed on top
+    Never mutated once published; refreshes build a new state and swap it in"""
+
+    def __init__(self, strings: Optional[List[str]] = None, columns: Optional[Dict[str, np.ndarray]] = None,
+                 descriptions=b"", row_by_id: Optional[Dict[str, int]] = None, count: int = 0, loaded_at=None,
+                 overlay: Optional[Dict[str, Tuple[Dict, Optional[np.ndarray]]]] = None, deleted=None):
+        self.strings = strings or []
+        self.columns = columns or {}
+        self.descriptions = descriptions
+        self.row_by_id = row_by_id or {}
+        self.count = count
+        self.loaded_at = loaded_at
+        self.overlay = overlay or {}
+        self.deleted = frozenset(deleted or ())
+
+    def with_changes(self, entries: List[Dict]) -> "_SnapshotState":
+        """New state with change-log entries applied (copy on write; the base columns are shared)"""
+        overlay, deleted = dict(self.overlay), set(self.deleted)
+        for entry in entries:
+            product_id = entry["id"]
+            if entry["op"] == "delete":
+                overlay.pop(product_id, None)
+                deleted.add(product_id)
+            else:
+                values = entry.get("values")
+                overlay[product_id] = (entry.get("metadata", {}), np.asarray(values, dtype=np.float32) if values else None)
+                deleted.discard(product_id)
+        return _SnapshotState(self.strings, self.columns, self.descriptions, self.row_by_id, self.count,
+                              self.loaded_at, overlay, deleted)
+
+    def row_metadata(self, row: int) -> Dict:
+        metadata = {field: self.strings[self.columns[field][row]] for field in STRING_FIELDS}
+        for field in NUMERIC_FIELDS:
+            metadata[field] = float(self.columns[field][row])
+        start, end = self.columns["description_offsets"][row], self.columns["description_offsets"][row + 1]
+        metadata["description"] = bytes(self.descriptions[start:end]).decode("utf-8")
+        return metadata
+
+    def product_ids(self) -> Iterator[str]:
+        for product_id in self.row_by_id:
+            if product_id not in self.deleted and product_id not in self.overlay:
+                yield product_id
+        yield from self.overlay
+
+    def get(self, product_id: str) -> Optional[Dict]:
+        if product_id in self.overlay:
+            return dict(self.overlay[product_id][0])
+        if product_id in self.deleted or product_id not in self.row_by_id:
+            return None
+        return self.row_metadata(self.row_by_id[product_id])
+
+    def vector(self, product_id: str) -> Optional[np.ndarray]:
+        if product_id in self.overlay:
+            return self.overlay[product_id][1]
+        if product_id in self.deleted or product_id not in self.row_by_id:
+            return None
+        return self.columns["vectors"][self.row_by_id[product_id]]
+
+
+class CatalogSnapshot:
+    """
+    Read side of the snapshot: memory-mapped columns plus the replayed change log
+    Readers take the current state once per call, so a concurrent refresh or
+    reload (one attribute swap) never mixes rows of two generations
+    """
+
+    def __init__(self, directory: str = CATALOG_SNAPSHOT_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()  # Serializes refreshes; readers do not take it
+        self._state = _SnapshotState()
+        self.revision = 0  # Bumped whenever the visible catalog changes
+        self._log_position = 0
+        self._manifest_mtime = None
+        self.load()
+
+    # The current state; pin it to read one generation consistently
+    state = property(lambda self: self._state)
+
+    # Fields of the current state
+    strings = property(lambda self: self._state.strings)
+    columns = property(lambda self: self._state.columns)
+    descriptions = property(lambda self: self._state.descriptions)
+    row_by_id = property(lambda self: self._state.row_by_id)
+    count = property(lambda self: self._state.count)
+    loaded_at = property(lambda self: self._state.loaded_at)
+    overlay = property(lambda self: self._state.overlay)
+    deleted = property(lambda self: self._state.deleted)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, MANIFEST_FILE))
+
+    def load(self):
+        """Map the snapshot files; cheap regardless of catalog size"""
+        with self.lock:
+            if not self.exists():
+                return
+            with open(os.path.join(self.directory, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._manifest_mtime = os.path.getmtime(os.path.join(self.directory, MANIFEST_FILE))
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                print(f"[catalog_snapshot] {self.directory} has an old format; rebuilt on first use with an index")
+                return
+            generation_dir = _generation_dir(self.directory, manifest)
+            with open(os.path.join(generation_dir, STRINGS_FILE), encoding="utf-8") as f:
+                strings = json.load(f)
+
+            names = ["ids", "description_offsets", "vectors"] + STRING_FIELDS + NUMERIC_FIELDS
+            columns = {name: np.load(_column_path(generation_dir, name), mmap_mode="r") for name in names}
+            descriptions_path = os.path.join(generation_dir, DESCRIPTIONS_FILE)
+            descriptions = np.memmap(descriptions_path, dtype=np.uint8, mode="r") if os.path.getsize(descriptions_path) else b""
+            row_by_id = {strings[code]: row for row, code in enumerate(columns["ids"])}
+
+            self._state = _SnapshotState(strings, columns, descriptions, row_by_id, manifest["count"], manifest["created_at"])
+            self._log_position = 0
+            self.revision += 1
+        self.refresh()
+
+    def refresh(self):
+        """Replay change-log entries written since the last refresh"""
+        log_path = os.path.join(self.directory, CHANGE_LOG_FILE)
+        with self.lock:
+            if not os.path.exists(log_path) or not self.exists():
+                return
+            if os.path.getmtime(os.path.join(self.directory, MANIFEST_FILE)) != self._manifest_mtime:
+                needs_reload = True  # The snapshot was rebuilt and the log reset
+            elif self.loaded_at is None:
+                return  # Old format: nothing loaded to apply changes to
+            else:
+                needs_reload = False
+                entries = []
+                with open(log_path, "rb") as f:
+                    f.seek(self._log_position)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # Partially written entry; read it next time
+                        self._log_position += len(line)
+                        entries.append(json.loads(line))
+                if entries:
+                    self._state = self._state.with_changes(entries)
+                    self.revision += len(entries)
+        if needs_reload:
+            self.load()
+
+    def __len__(self):
+        return sum(1 for _ in self.product_ids())
+
+    def product_ids(self) -> Iterator[str]:
+        return self._state.product_ids()
+
+    def get(self, product_id: str) -> Optional[Dict]:
+        """Metadata of one product, or None when it is not in the catalog"""
+        return self._state.get(product_id)
+
+    def vector(self, product_id: str) -> Optional[np.ndarray]:
+        return self._state.vector(product_id)
+
+    def products(self) -> Iterator[Tuple[str, Dict]]:
+        """Iterate (id, metadata) over the current catalog"""
+        state = self._state
+        for product_id in list(state.product_ids()):
+            metadata = state.get(product_id)
+            if metadata is not None:
+                yield product_id, metadata
+
+    def compact(self):
+        """Fold the change log into a new base snapshot"""
+        rows = [(product_id, metadata, self.vector(product_id)) for product_id, metadata in self.products()]
+        write_snapshot(rows, self.directory)
+        self.load()
+
+
+V2_SNAPSHOT_HINT = "the v2 index holds short vectors only; build the v2 snapshot with python -m shared.embedding_migration"
+
+
+def build_snapshot(index, directory: str = CATALOG_SNAPSHOT_DIR) -> int:
+    """Fetch the catalog from Pinecone once and write it as a snapshot
+    Refused in v2 mode: a snapshot without full vectors would disable reranking and the ANN index"""
+    if PRIMARY_DIMENSION != EMBEDDING_DIMENSION:
+        raise ValueError(V2_SNAPSHOT_HINT)
+    results = index.query(
+        vector=[0.0] * PRIMARY_DIMENSION,  # Dummy vector
+        top_k=CATALOG_FETCH_LIMIT,
+        include_metadata=True,
+        include_values=True
+    )
+    rows = [(match.id, dict(match.metadata or {}), match.values) for match in results.matches]
+    write_snapshot(rows, directory)
+    return len(rows)
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot(index=None) -> CatalogSnapshot:
+    """
+    Return the process-wide snapshot, refreshed from the change log
+    Builds it from Pinecone on first use when an index is given (except in v2 mode)
+    """
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = CatalogSnapshot()
+            if _snapshot.loaded_at is None and PRIMARY_DIMENSION != EMBEDDING_DIMENSION:
+                print(f"[catalog_snapshot] no snapshot in {CATALOG_SNAPSHOT_DIR}; {V2_SNAPSHOT_HINT}")
+        if _snapshot.loaded_at is None and index is not None and PRIMARY_DIMENSION == EMBEDDING_DIMENSION:
+            build_snapshot(index)
+            _snapshot.load()
+    _snapshot.refresh()
+    return _snapshot
+
+
+if __name__ == "__main__":
+    from .config import init_apis
+
+    _, pinecone_index = init_apis()
+    start = time.time()
+    print(f"Wrote {build_snapshot(pinecone_index)} products to {CATALOG_SNAPSHOT_DIR} in {time.time() - start:.2f}s")
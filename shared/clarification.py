@@ -0,0 +1,172 @@
+"""
+Template-based clarifying questions
+Picks the facets a vague request is still missing (type, material, style,
+occasion, budget) and renders Arabic questions whose options come from the
+catalog snapshot: a facet is asked about only when the customer's category
+actually splits on it, most informative facet first. Without a snapshot the
+fixed option lists are used
+"""
+
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+from .query_parser import CATEGORY_SINGULAR, parse_query
+
+FACETS = ["category", "material", "style", "occasion", "budget"]
+MAX_OPTIONS = 4
+
+QUESTION_TEMPLATES = {
+    "category": "ما نوع المجوهرات التي تبحث عنها؟ ({options})",
+    "material": "ما المادة المفضلة؟ ({options})",
+    "style": "ما النمط المفضل؟ ({options})",
+    "occasion": "ما المناسبة؟ ({options})",
+    "budget": "ما الميزانية التقريبية؟ ({options})"
+}
+
+# Options used when there is no catalog snapshot to draw them from
+DEFAULT_OPTIONS = {
+    "category": ["خاتم", "عقد", "أقراط", "سوار"],
+    "material": ["ذهب", "فضة", "أحجار كريمة"],
+    "style": ["بسيط", "فاخر", "عصري", "كلاسيكي"],
+    "occasion": ["زواج", "خطوبة", "هدية", "استعمال يومي"],
+    "budget": ["أقل من 1000 ريال", "1000 - 3000 ريال", "أكثر من 3000 ريال"]
+}
+
+
+def _product_facets(metadata: Dict) -> Dict[str, Optional[str]]:
+    """Material, style and occasion of a product, parsed from its fields with the query vocabulary"""
+    text = " ".join(str(metadata.get(field) or "") for field in ["name", "karat", "design", "style", "description"])
+    facets = parse_query(text)
+    material = facets["material"]
+    if not material:
+        karat = str(metadata.get("karat") or "")
+        material = "ذهب" if "قيراط" in karat else "فضة" if "فضة" in karat else "بلاتين" if "بلاتين" in karat else None
+    return {"material": material, "style": facets["style"], "occasion": facets["occasion"]}
+
+
+class FacetDistribution:
+    """Per-category facet value counts and prices of one snapshot revision"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.revision = snapshot.revision
+        self.products = 0
+        self.counts: Dict[Optional[str], Dict[str, Counter]] = {}
+        self.prices: Dict[Optional[str], List[float]] = {}
+        for _, metadata in snapshot.products():
+            facets = _product_facets(metadata)
+            facets["category"] = metadata.get("category") or None
+            self.products += 1
+            # None holds the whole catalog, used while the type is still unknown
+            for category in [None] + ([facets["category"]] if facets["category"] else []):
+                counts = self.counts.setdefault(category, {facet: Counter() for facet in ["category", "material", "style", "occasion"]})
+                for facet, counter in counts.items():
+                    if facets[facet]:
+                        counter[facets[facet]] += 1
+                if metadata.get("price"):
+                    self.prices.setdefault(category, []).append(float(metadata["price"]))
+
+    def __len__(self):
+        return self.products
+
+    def options(self, facet: str, category: Optional[str]) -> Tuple[List[str], float]:
+        """The most common values of a facet within the category, and how evenly they split it
+        (normalized entropy: 0 when one value covers everything)"""
+        if facet == "budget":
+            return self._budget_options(category)
+        counter = self.counts.get(category, {}).get(facet, Counter())
+        values = [value for value, _ in counter.most_common(MAX_OPTIONS)]
+        if facet == "category":
+            values = [CATEGORY_SINGULAR.get(value, value) for value in values]
+        return values, _evenness(list(counter.values()))
+
+    def _budget_options(self, category: Optional[str]) -> Tuple[List[str], float]:
+        prices = self.prices.get(category, [])
+        if len(prices) < 3:
+            return [], 0.0
+        low, high = (_round_price(value) for value in np.percentile(prices, [33, 67]))
+        if not 0 < low < high:
+            return [], 0.0
+        options = [f"أقل من {low:,.0f} ريال", f"{low:,.0f} - {high:,.0f} ريال", f"أكثر من {high:,.0f} ريال"]
+        return options, _evenness([sum(p < low for p in prices), sum(low <= p <= high for p in prices), sum(p > high for p in prices)])
+
+
+def _evenness(counts: List[int]) -> float:
+    total = sum(counts)
+    if total == 0 or len(counts) < 2:
+        return 0.0
+    entropy = -sum(count / total * math.log(count / total) for count in counts if count)
+    return entropy / math.log(len(counts))
+
+
+def _round_price(value: float) -> float:
+    """Two significant digits, so ranges read like a shop's price bands"""
+    if value <= 0:
+        return 0.0
+    step = 10 ** max(int(math.log10(value)) - 1, 0)
+    return round(value / step) * step
+
+
+_distribution: Optional[FacetDistribution] = None
+_distribution_lock = threading.Lock()
+
+
+def get_facet_distribution(snapshot: Optional[CatalogSnapshot] = None) -> Optional[FacetDistribution]:
+    """Process-wide distribution, recomputed when the snapshot changes; None without a catalog"""
+    global _distribution
+    if snapshot is None:
+        snapshot = get_catalog_snapshot()
+    if snapshot.loaded_at is None:
+        return None
+    with _distribution_lock:
+        if _distribution is None or _distribution.revision != snapshot.revision:
+            _distribution = FacetDistribution(snapshot)
+        distribution = _distribution
+    return distribution if len(distribution) else None
+
+
+def known_facets(constraints: Dict, state=None) -> Dict[str, bool]:
+    """Which facets the message or the earlier turns already answered"""
+    preferences = getattr(state, "preferences", {}) or {}
+
+    def known(key):
+        return bool(constraints.get(key) or preferences.get(key))
+
+    return {
+        "category": known("category"),
+        "material": known("material") or known("karat"),
+        "style": known("style"),
+        "occasion": known("occasion"),
+        "budget": any(value is not None for value in [
+            constraints.get("min_price"), constraints.get("max_price"),
+            getattr(state, "min_price", None), getattr(state, "max_price", None)
+        ])
+    }
+
+
+def clarification_questions(constraints: Dict, state=None, distribution: Optional[FacetDistribution] = None,
+                            limit: int = 3) -> List[str]:
+    """
+    Questions for the missing facets: the jewelry type first, then the facets that
+    split the customer's category most evenly. Empty when nothing is missing
+    """
+    known = known_facets(constraints, state)
+    missing = [facet for facet in FACETS if not known[facet]]
+    defaults = [QUESTION_TEMPLATES[facet].format(options="، ".join(DEFAULT_OPTIONS[facet])) for facet in missing][:limit]
+    if distribution is None:
+        return defaults
+
+    preferences = getattr(state, "preferences", {}) or {}
+    category = constraints.get("category") or preferences.get("category")
+    if category not in distribution.counts:
+        category = None
+    ranked = []
+    for position, facet in enumerate(missing):
+        options, evenness = distribution.options(facet, category)
+        if facet == "category":
+            options, evenness = options or DEFAULT_OPTIONS["category"], 2.0  # The type is always asked first
+        if len(options) >= 2 and evenness > 0:
+            ranked.append((-evenness, position, QUESTION_TEMPLATES[facet].format(options="، ".join(options))))
+    return [question for _, _, question in sorted(ranked)][:limit] or defaults
@@ -2,37 +2,176 @@ import streamlit as st
 import openai
 from pinecone import Pinecone, ServerlessSpec
 
-# Initialize APIs
-def init_apis():
-    """Initialize OpenAI and Pinecone clients"""
-    openai.api_key = st.secrets["OPENAI_API_KEY"]
-    
-    pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
-    index_name = st.secrets["PINECONE_INDEX_NAME"]
-    
-    # Create index if it doesn't exist
+def _open_index(pc, index_name, dimension):
+    """Open a Pinecone index, creating it if it doesn't exist"""
     try:
         index = pc.Index(index_name)
     except:
         # Create index with appropriate dimensions
         pc.create_index(
             name=index_name,
-            dimension=1536,  # OpenAI embedding dimension
-            metric='cosine',
+            dimension=dimension,
+            metric='dotproduct',  # Unit-length embeddings: same ranking as cosine, and accepts sparse vectors
             spec=ServerlessSpec(
                 cloud='aws',
                 region='us-east-1'
             )
         )
         index = pc.Index(index_name)
+    try:
+        _index_metrics[id(index)] = pc.describe_index(index_name).metric
+    except Exception as e:
+        print(f"[config] could not read the metric of {index_name}: {e}")
+    return index
+
+_index_metrics = {}  # id(index) -> similarity metric, recorded when the index is opened
+
+def index_metric(index):
+    """Similarity metric of a Pinecone index ("cosine", "dotproduct", ...), None when unknown"""
+    key = id(index)
+    if key not in _index_metrics:
+        try:
+            stats = index.describe_index_stats()
+            _index_metrics[key] = stats.get("metric") if isinstance(stats, dict) else getattr(stats, "metric", None)
+        except Exception as e:
+            print(f"[config] could not read the index metric: {e}")
+            _index_metrics[key] = None
+    return _index_metrics[key]
+
+def _v2_index_name():
+    return st.secrets.get("PINECONE_V2_INDEX_NAME") or f"{st.secrets['PINECONE_INDEX_NAME']}-v2"
+
+# Initialize APIs
+def init_apis():
+    """Initialize OpenAI and Pinecone clients (the index read in the current EMBEDDING_MODE)"""
+    openai.api_key = st.secrets["OPENAI_API_KEY"]
+    
+    pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
+    
+    if EMBEDDING_MODE == "v2":
+        index = _open_index(pc, _v2_index_name(), PRIMARY_DIMENSION)
+    else:
+        index = _open_index(pc, st.secrets["PINECONE_INDEX_NAME"], EMBEDDING_DIMENSION)
     
     return openai, index
 
+_secondary_index = None
+
+def init_secondary_index():
+    """The v2 index written alongside the legacy one in dual_write mode (None otherwise)"""
+    global _secondary_index
+    if EMBEDDING_MODE != "dual_write":
+        return None
+    if _secondary_index is None:
+        pc = Pinecone(api_key=st.secrets["PINECONE_API_KEY"])
+        _secondary_index = _open_index(pc, _v2_index_name(), V2_PRIMARY_DIMENSION)
+    return _secondary_index
+
+# Embedding generations
+# "legacy": ada-002 vectors in PINECONE_INDEX_NAME
+# "dual_write": read the legacy index, also write v2 vectors to PINECONE_V2_INDEX_NAME (migration)
+# "v2": short v2 vectors in PINECONE_V2_INDEX_NAME, top candidates re-ranked with the full local vectors
+EMBEDDING_MODE = "legacy"
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+V2_EMBEDDING_MODEL = "text-embedding-3-small"  # Accepts `dimensions`; prefixes of its vectors are embeddings too
+V2_PRIMARY_DIMENSION = 256
+PRIMARY_RERANK_FACTOR = 4  # Short-vector candidates fetched per result for the full-vector rerank
+
 # Constants
-EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_MODEL = V2_EMBEDDING_MODEL if EMBEDDING_MODE == "v2" else LEGACY_EMBEDDING_MODEL  # Model of the index being read
+EMBEDDING_DIMENSION = 1536  # Full vectors (both models): local snapshot, ANN index and reranking
+PRIMARY_DIMENSION = V2_PRIMARY_DIMENSION if EMBEDDING_MODE == "v2" else EMBEDDING_DIMENSION  # Vectors in the Pinecone index
 VISION_MODEL = "gpt-5-nano-2025-08-07"
 TEXT_MODEL = "gpt-5-nano-2025-08-07"
 
 # Image processing settings
 MAX_IMAGE_SIZE = (800, 800)
 THUMBNAIL_SIZE = (200, 200)
+MASTER_MAX_SIZE = (2048, 2048)  # Stored master rendition; larger uploads are draft-decoded down to it
+
+# Prompt context budgets (tokens)
+PRODUCT_CONTEXT_TOKENS = 900
+HISTORY_CONTEXT_TOKENS = 400
+HISTORY_MESSAGE_TOKENS = 80
+DESCRIPTION_TOKENS = 40
+TOKENIZER_ENCODING = "o200k_base"
+
+# OpenAI client limits
+LLM_MAX_CONNECTIONS = 20
+LLM_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_REQUESTS_PER_SECOND = 8.0
+LLM_BURST = 16
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_RETRY_MAX_DELAY = 8.0
+LLM_DEADLINE_SECONDS = 60.0
+EMBEDDING_DEADLINE_SECONDS = 15.0
+DEFAULT_MODEL_CONCURRENCY = 4
+MODEL_CONCURRENCY = {
+    TEXT_MODEL: 8,
+    EMBEDDING_MODEL: 16
+}
+EMBEDDING_BATCH_SIZE = 100  # Texts per embedding request in bulk jobs
+LLM_BATCH_WINDOW = 8  # Bulk requests kept in flight on the async client
+BULK_UPLOAD_CHUNK = 16  # Images described concurrently per bulk-upload step
+
+# Local image store (content-addressed renditions)
+IMAGE_STORE_DIR = "images"
+IMAGE_STORE_PORT = 8502
+IMAGE_STORE_HOST = "127.0.0.1"  # Interface the image server binds to
+IMAGE_STORE_BASE_URL = f"http://localhost:{IMAGE_STORE_PORT}"  # Public address of the image server, stored in image_url
+IMAGE_CACHE_MAX_AGE = 31536000  # Content-addressed files never change
+
+# Optional local visual search (CLIP-style ONNX image encoder)
+VISUAL_ENCODER_PATH = "models/clip_image_encoder.onnx"
+VISUAL_INDEX_DIR = "visual_index"
+VISUAL_INPUT_SIZE = 224
+VISUAL_MIN_SCORE = 0.75
+VISUAL_TOP_K = 8
+VISUAL_COMPACT_MIN_ROWS = 100  # Replaced/removed rows kept before the vectors file is compacted
+
+# Concurrent fallback cascades
+CASCADE_DEADLINE_SECONDS = 45.0
+
+# Rule-based image description simplification (LLM only below this confidence)
+SIMPLIFY_MIN_CONFIDENCE = 0.6
+
+# Rendered product fragment cache (entries)
+FRAGMENT_CACHE_SIZE = 5000
+
+# Local columnar catalog snapshot
+CATALOG_SNAPSHOT_DIR = "catalog_snapshot_v2" if EMBEDDING_MODE == "v2" else "catalog_snapshot"
+V2_CATALOG_SNAPSHOT_DIR = "catalog_snapshot_v2"  # Written by the dual_write backfill
+CATALOG_FETCH_LIMIT = 1000
+
+# Shared catalog service: minimum seconds between retriever rebuilds
+CATALOG_REFRESH_SECONDS = 60
+
+# Precomputed embeddings for the canonical query vocabulary
+TERM_EMBEDDINGS_PATH = "term_embeddings.npz"
+CATEGORY_CENTROID_MIN_SCORE = 0.8
+
+# Local HNSW approximate-nearest-neighbor index (faiss)
+ANN_INDEX_DIR = "ann_index_v2" if EMBEDDING_MODE == "v2" else "ann_index"
+ANN_HNSW_M = 32  # Graph degree: higher = better recall, more memory
+ANN_EF_CONSTRUCTION = 200  # Build-time beam width
+ANN_EF_SEARCH = 64  # Query-time beam width: the recall/latency knob
+ANN_COMPACT_TOMBSTONE_RATIO = 0.2  # Rebuild when this share of labels is deleted
+ANN_JOURNAL_MAX_ENTRIES = 500  # Checkpoint the graph after this many journaled changes
+ANN_STORAGE = "int8"  # "flat" (float32 graph), "int8" (graph, 4x smaller) or "pq" (code scan, ANN_PQ_COMPRESSION x smaller)
+ANN_PQ_COMPRESSION = 16  # float32 bytes per PQ code byte (1536-d -> 384 one-byte sub-quantizers)
+ANN_PQ_MIN_TRAINING = 10000  # PQ codebooks need this many vectors; smaller catalogs use int8
+ANN_RERANK_FACTOR = 10  # Quantized first pass returns top_k * this candidates for exact re-scoring
+
+# Hybrid sparse-dense search in one Pinecone query (dotproduct indexes only, e.g. the v2 index;
+# cosine indexes stay dense-only). Hybrid scores are alpha * dense + (1 - alpha) * sparse, so
+# min_score thresholds tuned for dense scores are scaled by HYBRID_ALPHA in hybrid queries
+HYBRID_SEARCH_ENABLED = False  # When on, text searches skip the local ANN index and the in-process BM25
+HYBRID_ALPHA = 0.8  # Dense weight; the sparse lexical vector gets 1 - alpha
+SPARSE_VOCAB_PATH = "sparse_vocab.json"
+SPARSE_BM25_K1 = 1.2
+SPARSE_BM25_B = 0.75
+
+# LLM verification of search results (positional handles 1..N, structured output)
+VERIFICATION_MAX_COMPLETION_TOKENS = 200  # Includes reasoning tokens; a handle list needs a few dozen
+VERIFICATION_REASONING_EFFORT = "minimal"
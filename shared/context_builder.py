@@ -0,0 +1,174 @@
+"""
+Token-budgeted prompt context for product results and conversation history
+Counts tokens locally and packs the most relevant items into a fixed budget
+so prompt size stays predictable per turn
+"""
+
+from typing import Dict, List, Optional, Tuple
+from .config import (
+    PRODUCT_CONTEXT_TOKENS, HISTORY_CONTEXT_TOKENS, HISTORY_MESSAGE_TOKENS,
+    DESCRIPTION_TOKENS, TOKENIZER_ENCODING
+)
+
+_encoder = None
+_encoder_loaded = False
+
+# Rough Arabic characters-per-token ratio used when the tokenizer is unavailable
+_FALLBACK_CHARS_PER_TOKEN = 2.5
+
+PRODUCT_TABLE_HEADER = "# | الاسم | السعر | الفئة | العيار | الوزن | التصميم | الرابط | الوصف"
+
+
+def _get_encoder():
+    """Load the tokenizer once; tiktoken downloads its BPE file on first use"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"Tokenizer unavailable, using length estimate: {e}")
+            _encoder = None
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return max(1, int(len(text) / _FALLBACK_CHARS_PER_TOKEN + 0.5))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens, marking the cut with an ellipsis"""
+    if not text or max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    encoder = _get_encoder()
+    if encoder is not None:
+        truncated = encoder.decode(encoder.encode(text)[:max_tokens])
+    else:
+        truncated = text[:int(max_tokens * _FALLBACK_CHARS_PER_TOKEN)]
+    return truncated.rstrip() + "…"
+
+
+def result_parts(result) -> Tuple[str, float, Dict]:
+    """Return (id, score, metadata) for both Pinecone matches and result dicts"""
+    if isinstance(result, dict):
+        return result.get('id', ''), result.get('score', 0) or 0, result.get('metadata', {}) or {}
+    return getattr(result, 'id', ''), getattr(result, 'score', 0) or 0, getattr(result, 'metadata', {}) or {}
+
+
+def _product_row(index: int, product_id: str, metadata: Dict, description_tokens: int) -> str:
+    """Product table row, from the rendered-fragment cache for the standard widths"""
+    # Imported here: product_fragments depends on the token helpers above
+    from .product_fragments import get_fragments
+
+    if description_tokens == DESCRIPTION_TOKENS:
+        return f"{index} | {get_fragments(product_id, metadata).context_row}"
+    if description_tokens <= 0:
+        return f"{index} | {get_fragments(product_id, metadata).context_row_short}"
+    return _format_product_row(index, metadata, description_tokens)
+
+
+def _format_product_row(index: int, metadata: Dict, description_tokens: int) -> str:
+    """Format one compact product table row"""
+    price = metadata.get('price', 0) or 0
+    weight = metadata.get('weight', 0) or 0
+    description = " ".join((metadata.get('description') or "").split())
+
+    fields = [
+        str(index),
+        metadata.get('name') or 'منتج',
+        f"{float(price):.2f} ريال",
+        metadata.get('category') or '-',
+        metadata.get('karat') or '-',
+        f"{weight} جرام" if weight > 0 else '-',
+        metadata.get('design') or '-',
+        metadata.get('product_url') or '-',
+        truncate_to_tokens(description, description_tokens) or '-'
+    ]
+    return " | ".join(fields)
+
+
+def build_product_context(
+    results: List,
+    max_tokens: int = PRODUCT_CONTEXT_TOKENS,
+    description_tokens: int = DESCRIPTION_TOKENS,
+    max_products: Optional[int] = None
+) -> Tuple[str, List]:
+    """
+    Pack search results into a compact product table within a token budget
+    Results are ordered by relevance score and deduplicated by ID and by name/price
+    Returns: (table_text, included_results)
+    """
+    ranked = sorted(results or [], key=lambda r: result_parts(r)[1], reverse=True)
+
+    lines = [PRODUCT_TABLE_HEADER]
+    used_tokens = count_tokens(PRODUCT_TABLE_HEADER)
+    included = []
+    seen = set()
+
+    for result in ranked:
+        if max_products and len(included) >= max_products:
+            break
+
+        product_id, _, metadata = result_parts(result)
+        name_key = (metadata.get('name', ''), metadata.get('price', 0))
+        if product_id in seen or name_key in seen:
+            continue
+
+        row = _product_row(len(included) + 1, product_id, metadata, description_tokens)
+        row_tokens = count_tokens(row) + 1
+        if used_tokens + row_tokens > max_tokens:
+            # Try again without the description before giving up on this product
+            row = _product_row(len(included) + 1, product_id, metadata, 0)
+            row_tokens = count_tokens(row) + 1
+            if used_tokens + row_tokens > max_tokens:
+                break
+
+        lines.append(row)
+        used_tokens += row_tokens
+        included.append(result)
+        seen.add(product_id)
+        seen.add(name_key)
+
+    if not included:
+        return "", []
+    return "\n".join(lines), included
+
+
+def build_history_context(
+    history: List[Dict],
+    max_tokens: int = HISTORY_CONTEXT_TOKENS,
+    message_tokens: int = HISTORY_MESSAGE_TOKENS
+) -> List[Dict]:
+    """Pack the most recent user/assistant messages into a token budget (oldest first)"""
+    packed = []
+    used_tokens = 0
+
+    for msg in reversed(history or []):
+        if msg.get("role") not in ["user", "assistant"]:
+            continue
+
+        content = truncate_to_tokens(msg.get("content", ""), message_tokens)
+        tokens = count_tokens(content) + 4  # role/formatting overhead
+        if used_tokens + tokens > max_tokens:
+            break
+
+        packed.append({"role": msg["role"], "content": content})
+        used_tokens += tokens
+
+    packed.reverse()
+    return packed
+
+
+def format_history_text(history: List[Dict]) -> str:
+    """Render packed history as plain "role: content" lines"""
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
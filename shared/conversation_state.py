@@ -0,0 +1,136 @@
+"""
+Rolling per-session conversation state
+Keeps a structured summary (last shown products, active category, material,
+style, occasion and budget) that is updated once per turn instead of being
+re-derived from raw messages
+"""
+
+import streamlit as st
+from typing import Dict, List, Optional
+from .context_builder import result_parts
+from .query_parser import parse_query
+
+PREFERENCE_LABELS = [
+    ("category", "الفئة"),
+    ("material", "المادة"),
+    ("style", "الستايل"),
+    ("occasion", "المناسبة"),
+    ("karat", "العيار")
+]
+
+
+class ConversationState:
+    """Structured summary of what the customer asked for and was shown"""
+
+    MAX_PRODUCTS = 5
+
+    def __init__(self):
+        self.preferences: Dict[str, Optional[str]] = {key: None for key, _ in PREFERENCE_LABELS}
+        self.min_price: Optional[float] = None
+        self.max_price: Optional[float] = None
+        self.last_query = ""
+        self.last_products: List[Dict] = []
+        self.turns = 0
+
+    def update_from_message(self, message: str) -> Dict:
+        """Fold the constraints of a new user message into the state"""
+        constraints = parse_query(message)
+
+        # A different jewelry type starts a new search: facets and budget of the old one
+        # are dropped unless this message states them again ("أريد سوار" after "خاتم ذهب")
+        new_category = constraints.get("category")
+        old_category = self.preferences.get("category")
+        if new_category and old_category and new_category != old_category:
+            self.preferences = {key: None for key, _ in PREFERENCE_LABELS}
+            self.min_price = None
+            self.max_price = None
+
+        for key, _ in PREFERENCE_LABELS:
+            if constraints.get(key):
+                self.preferences[key] = constraints[key]
+        if constraints.get("min_price") is not None:
+            self.min_price = constraints["min_price"]
+        if constraints.get("max_price") is not None:
+            self.max_price = constraints["max_price"]
+
+        self.turns += 1
+        return constraints
+
+    def update_from_results(self, query: str, results: List):
+        """Remember the products that were just shown to the customer"""
+        self.last_query = query
+        self.last_products = []
+        for result in results[:self.MAX_PRODUCTS]:
+            product_id, _, metadata = result_parts(result)
+            self.last_products.append({
+                "id": product_id,
+                "name": metadata.get("name", ""),
+                "price": metadata.get("price", 0),
+                "category": metadata.get("category", ""),
+                "karat": metadata.get("karat", ""),
+                "weight": metadata.get("weight", 0),
+                "design": metadata.get("design", ""),
+                "style": metadata.get("style", ""),
+                "product_url": metadata.get("product_url", "")
+            })
+
+        if self.last_products and not self.preferences.get("category"):
+            self.preferences["category"] = self.last_products[0]["category"] or None
+
+    def to_prompt(self) -> str:
+        """Serialize the state as a compact context block for the LLM"""
+        lines = []
+
+        preferences = [f"{label}: {self.preferences[key]}" for key, label in PREFERENCE_LABELS if self.preferences.get(key)]
+        if self.min_price is not None or self.max_price is not None:
+            low = f"{self.min_price:.0f}" if self.min_price is not None else "0"
+            high = f"{self.max_price:.0f}" if self.max_price is not None else "∞"
+            preferences.append(f"الميزانية: {low}-{high} ريال")
+        if preferences:
+            lines.append("🎯 طلب العميل: " + " | ".join(preferences))
+
+        if self.last_products:
+            lines.append(f"🛍️ آخر المنتجات المعروضة (بحث: {self.last_query}):")
+            for i, product in enumerate(self.last_products, 1):
+                details = [product["name"] or "منتج", f"{float(product['price'] or 0):.2f} ريال"]
+                if product["karat"]:
+                    details.append(product["karat"])
+                if product["weight"]:
+                    details.append(f"{product['weight']} جرام")
+                if product["product_url"]:
+                    details.append(product["product_url"])
+                lines.append(f"{i}. " + " | ".join(details))
+
+        if not lines:
+            return ""
+        return "📋 حالة المحادثة:\n" + "\n".join(lines)
+
+    def to_dict(self) -> Dict:
+        """Serialize the state to a plain dict"""
+        return {
+            "preferences": dict(self.preferences),
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "last_query": self.last_query,
+            "last_products": [dict(product) for product in self.last_products],
+            "turns": self.turns
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ConversationState":
+        """Restore a state serialized with to_dict"""
+        state = cls()
+        state.preferences.update(data.get("preferences", {}))
+        state.min_price = data.get("min_price")
+        state.max_price = data.get("max_price")
+        state.last_query = data.get("last_query", "")
+        state.last_products = list(data.get("last_products", []))
+        state.turns = data.get("turns", 0)
+        return state
+
+
+def get_conversation_state() -> ConversationState:
+    """Return the conversation state of the current Streamlit session"""
+    if "conversation_state" not in st.session_state:
+        st.session_state.conversation_state = ConversationState()
+    return st.session_state.conversation_state
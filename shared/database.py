@@ -1,41 +1,53 @@
 import streamlit as st
 import uuid
-from .embeddings import get_image_description, get_text_embedding
+from .config import (
+    init_secondary_index, V2_EMBEDDING_MODEL, V2_PRIMARY_DIMENSION, V2_CATALOG_SNAPSHOT_DIR, PRIMARY_DIMENSION,
+    HYBRID_SEARCH_ENABLED
+)
+from .embeddings import (
+    get_image_description, get_image_descriptions, get_text_embedding, get_text_embeddings, prepare_image, shorten_embedding
+)
+from .image_store import store_image, rendition_url, mark_ingested, unmark_ingested
+from .catalog_snapshot import record_change
+from .catalog_indexes import has_filters, filtered_search, primary_query
+from .ann_index import ann_search, ann_insert, ann_delete
+from .product_fragments import get_fragments, invalidate_fragments, touch_product
+from .visual_search import index_product_image, remove_product_image, search_similar_images
+from .query_parser import parse_query
+from .singleflight import singleflight, text_key, vector_key
+from .sparse_vectors import encode_product, supports_sparse
+from .term_embeddings import detect_category
 
-def store_product(index, image, name, price, category, image_url=None, additional_info="", karat="", weight=0.0, design="", style="", product_url=""):
-    """Store a product in Pinecone with embeddings"""
+def store_product(index, image, name, price, category, image_url=None, additional_info="", karat="", weight=0.0, design="", style="", product_url="", image_bytes=None,
+                  ai_description=None, embedding=None):
+    """Store a product in Pinecone with embeddings (and its image in the local store when image_bytes is given);
+    bulk uploads pass the image description and embedding computed for the whole batch"""
     try:
         # Generate unique ID
         product_id = str(uuid.uuid4())
         
-        # Get description from image
-        ai_description = get_image_description(image)
-        
-        # Combine AI description with additional info
-        if additional_info.strip():
-            description = f"{ai_description}\n\nتفاصيل إضافية: {additional_info.strip()}"
-        else:
-            description = ai_description
+        # Save the uploaded image once under its content hash
+        image_key = ""
+        if image_bytes:
+            image = prepare_image(image)
+            image_key = store_image(image_bytes, image)
+            image_url = rendition_url(image_key, "large")
         
-        # Add jewelry details to description for better search
-        jewelry_details = []
-        if karat: jewelry_details.append(f"العيار: {karat}")
-        if weight > 0: jewelry_details.append(f"الوزن: {weight} جرام")
-        if design: jewelry_details.append(f"التصميم: {design}")
-        if style: jewelry_details.append(f"الستايل: {style}")
-        
-        if jewelry_details:
-            description += f"\n\nمواصفات: {' | '.join(jewelry_details)}"
+        # Get description from image
+        if ai_description is None:
+            ai_description = get_image_description(image)
+        description = product_description(ai_description, additional_info, karat, weight, design, style)
         
         # Get embedding from description
-        embedding = get_text_embedding(description)
+        if embedding is None:
+            embedding = get_text_embedding(description)
         
         if embedding is None:
             st.error("فشل في توليد التضمين")
             return False
         
-        # Prepare metadata
-        metadata = {
+        # Prepare metadata (stamped with a new catalog version)
+        metadata = touch_product(product_id, {
             "name": name,
             "price": float(price),
             "category": category,
@@ -45,16 +57,48 @@ def store_product(index, image, name, price, category, image_url=None, additiona
             "weight": float(weight) if weight > 0 else 0.0,
             "design": design,
             "style": style,
-            "product_url": product_url
-        }
+            "product_url": product_url,
+            "image_key": image_key
+        })
+        
+        # Sparse lexical vector for hybrid search, stored next to the dense one in dotproduct indexes
+        sparse_values = encode_product(metadata) if HYBRID_SEARCH_ENABLED else None
+        sparse_field = {"sparse_values": sparse_values} if sparse_values and sparse_values["indices"] else {}
         
-        # Store in Pinecone
+        # Store in Pinecone (short vector in v2 mode; the full one is kept locally for reranking)
         index.upsert(vectors=[{
             "id": product_id,
-            "values": embedding,
-            "metadata": metadata
+            "values": shorten_embedding(embedding),
+            "metadata": metadata,
+            **(sparse_field if supports_sparse(index) else {})
         }])
         
+        # Dual-write migration: the same product in the v2 index and its local snapshot
+        secondary_index = init_secondary_index()
+        if secondary_index is not None:
+            v2_embedding = get_text_embedding(description, model=V2_EMBEDDING_MODEL)
+            if v2_embedding is not None:
+                secondary_index.upsert(vectors=[{
+                    "id": product_id,
+                    "values": shorten_embedding(v2_embedding, V2_PRIMARY_DIMENSION),
+                    "metadata": metadata,
+                    **(sparse_field if supports_sparse(secondary_index) else {})
+                }])
+                record_change("upsert", product_id, metadata, v2_embedding, directory=V2_CATALOG_SNAPSHOT_DIR)
+        
+        if image_key:
+            mark_ingested(image_key, product_id)
+        
+        # Let local catalog snapshots pick up the new product
+        record_change("upsert", product_id, metadata, embedding)
+        ann_insert(product_id, embedding)
+        
+        # Render the product's text fragments once at ingest
+        get_fragments(product_id, metadata)
+        
+        # Local visual index (no-op when the image encoder is not installed)
+        index_product_image(product_id, image)
+        
         st.success(f"✅ تم حفظ: {name}")
         return True
         
@@ -62,27 +106,73 @@ def store_product(index, image, name, price, category, image_url=None, additiona
         st.error(f"خطأ في حفظ المنتج: {e}")
         return False
 
-def search_products(index, query_embedding, top_k=10, min_score=0.3):
-    """Search for similar products using embedding"""
+def product_description(ai_description, additional_info="", karat="", weight=0.0, design="", style=""):
+    """Text embedded for a product: the image description plus the admin's details"""
+    # Combine AI description with additional info
+    if additional_info.strip():
+        description = f"{ai_description}\n\nتفاصيل إضافية: {additional_info.strip()}"
+    else:
+        description = ai_description
+    
+    # Add jewelry details to description for better search
+    jewelry_details = []
+    if karat: jewelry_details.append(f"العيار: {karat}")
+    if weight > 0: jewelry_details.append(f"الوزن: {weight} جرام")
+    if design: jewelry_details.append(f"التصميم: {design}")
+    if style: jewelry_details.append(f"الستايل: {style}")
+    
+    if jewelry_details:
+        description += f"\n\nمواصفات: {' | '.join(jewelry_details)}"
+    return description
+
+def store_products(index, products):
+    """
+    Store a batch of products (each a dict of store_product keyword arguments)
+    The image descriptions run concurrently and the description embeddings go
+    out as one batched request; returns each product's success flag
+    """
+    for product in products:
+        product["image"] = prepare_image(product["image"])
+    ai_descriptions = get_image_descriptions([product["image"] for product in products])
+    descriptions = [
+        product_description(ai_description, product.get("additional_info", ""), product.get("karat", ""),
+                            product.get("weight", 0.0), product.get("design", ""), product.get("style", ""))
+        for product, ai_description in zip(products, ai_descriptions)
+    ]
+    embeddings = get_text_embeddings(descriptions)
+    return [
+        store_product(index, ai_description=ai_description, embedding=embedding, **product)
+        for product, ai_description, embedding in zip(products, ai_descriptions, embeddings)
+    ]
+
+def search_products(index, query_embedding, top_k=10, min_score=0.3, constraints=None, query_text=None):
+    """Search for similar products using embedding (pre-filtered by price/weight/karat constraints;
+    hybrid with the query text's lexical vector when enabled)"""
     try:
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
+        # Identical searches in flight from other sessions share one result
+        key = (
+            vector_key(query_embedding), top_k, min_score,
+            tuple(sorted((constraints or {}).items())), text_key(query_text) if query_text else None
         )
-        
-        # Filter by minimum similarity score
-        filtered_results = [
-            result for result in results.matches 
-            if result.score >= min_score
-        ]
-        
-        return filtered_results
-        
+        return singleflight("search", key, lambda: _search_products(index, query_embedding, top_k, min_score, constraints, query_text))
+
     except Exception as e:
         st.error(f"خطأ في البحث عن المنتجات: {e}")
         return []
 
+def _search_products(index, query_embedding, top_k, min_score, constraints, query_text):
+    if has_filters(constraints):
+        return filtered_search(index, query_embedding, constraints, top_k, min_score, query_text)
+
+    # Local HNSW index when it has been built (None otherwise); dense-only, so hybrid text queries go to Pinecone
+    if not (query_text and supports_sparse(index)):
+        local_results = ann_search(query_embedding, top_k, min_score)
+        if local_results is not None:
+            return local_results
+
+    # Filtered by minimum similarity score (scaled for hybrid scores)
+    return primary_query(index, query_embedding, top_k, query_text=query_text, min_score=min_score)
+
 def search_by_text(index, text_query, top_k=10, min_score=0.3):
     """Search products by text query"""
     try:
@@ -92,15 +182,20 @@ def search_by_text(index, text_query, top_k=10, min_score=0.3):
         if embedding is None:
             return []
         
-        return search_products(index, embedding, top_k, min_score)
+        return search_products(index, embedding, top_k, min_score, constraints=parse_query(text_query), query_text=text_query)
         
     except Exception as e:
         st.error(f"خطأ في البحث النصي: {e}")
         return []
 
 def search_by_image(index, image, top_k=10, min_score=0.3):
-    """Search products by uploaded image using description (same as text search)"""
+    """Search products by uploaded image (local visual index, else description text search)"""
     try:
+        # Visual nearest neighbors in-process when the local encoder is available
+        visual_matches = search_similar_images(image, top_k)
+        if visual_matches:
+            return visual_matches
+
         # Get description from image
         description = get_image_description(image)
         st.info(f"🔍 البحث باستخدام: {description[:100]}...")
@@ -113,14 +208,10 @@ def search_by_image(index, image, top_k=10, min_score=0.3):
             # Try direct search with lower threshold
             embedding = get_text_embedding(description)
             if embedding:
-                raw_results = index.query(
-                    vector=embedding,
-                    top_k=15,
-                    include_metadata=True
-                )
-
-                st.write(f"**نتائج البحث الأولية: {len(raw_results.matches)} نتيجة**")
-                for i, result in enumerate(raw_results.matches[:10], 1):
+                raw_results = primary_query(index, embedding, top_k=15)
+
+                st.write(f"**نتائج البحث الأولية: {len(raw_results)} نتيجة**")
+                for i, result in enumerate(raw_results[:10], 1):
                     name = result.metadata.get('name', 'N/A')
                     score = result.score
                     desc = result.metadata.get('description', '')[:200]
@@ -140,30 +231,23 @@ def smart_search(index, query, search_type="text", top_k=10):
     try:
         if search_type == "text":
             # Detect category from query (but don't enforce it)
-            jewelry_categories = {
-                "خاتم": "خواتم", "خواتم": "خواتم",
-                "قلادة": "عقود", "عقد": "عقود", "عقود": "عقود",
-                "سلسلة": "عقود", "سلاسل": "عقود", "سلسال": "عقود",
-                "أقراط": "أقراط", "قرط": "أقراط",
-                "أساور": "أساور", "سوار": "أساور", "اسورة": "أساور",
-                "دبابيس": "دبابيس", "دبوس": "دبابيس",
-                "طقم": "طقم", "أطقم": "طقم"
-            }
-
-            detected_category = None
-            query_lower = query.lower()
-            for keyword, category in jewelry_categories.items():
-                if keyword in query_lower:
-                    detected_category = category
-                    break
+            constraints = parse_query(query)
+            detected_category = constraints["category"]
+
+            # One embedding for both thresholds (precomputed for vocabulary-only queries)
+            embedding = get_text_embedding(query)
+            if embedding is None:
+                return []
+            if not detected_category:
+                detected_category = detect_category(embedding)
 
             # PRIMARY: Semantic search with stricter thresholds
-            # Start with good threshold for quality matches
-            all_results = search_by_text(index, query, top_k * 3, min_score=0.5)
+            # Start with good threshold for quality matches (dense scores; scaled by HYBRID_ALPHA for hybrid queries)
+            all_results = search_products(index, embedding, top_k * 3, min_score=0.5, constraints=constraints, query_text=query)
 
             if not all_results:
                 # If no results, try moderate threshold
-                all_results = search_by_text(index, query, top_k * 2, min_score=0.35)
+                all_results = search_products(index, embedding, top_k * 2, min_score=0.35, constraints=constraints, query_text=query)
 
             if not all_results:
                 return []
@@ -222,7 +306,7 @@ def get_all_products(index, limit=100):
         # Note: This is a simple approach for demo
         # In production, you'd want pagination
         results = index.query(
-            vector=[0.0] * 1536,  # dummy vector
+            vector=[0.0] * PRIMARY_DIMENSION,  # dummy vector
             top_k=limit,
             include_metadata=True
         )
@@ -233,10 +317,21 @@ def get_all_products(index, limit=100):
         st.error(f"خطأ في الحصول على المنتجات: {e}")
         return []
 
-def delete_product(index, product_id):
+def delete_product(index, product_id, image_key=None):
     """Delete a product from the database"""
     try:
         index.delete(ids=[product_id])
+        secondary_index = init_secondary_index()
+        if secondary_index is not None:
+            secondary_index.delete(ids=[product_id])
+            record_change("delete", product_id, directory=V2_CATALOG_SNAPSHOT_DIR)
+        remove_product_image(product_id)
+        invalidate_fragments(product_id)
+        record_change("delete", product_id)
+        ann_delete(product_id)
+        if image_key:
+            # Allow the same image to be ingested again
+            unmark_ingested(image_key)
         st.success("تم حذف المنتج")
         return True
         
@@ -0,0 +1,86 @@
+"""
+Structured extraction from vision descriptions
+The vision prompt answers "<النوع>: <التصميم>", so type, shape and style can be
+read deterministically and turned into a short catalog-style query
+("خاتم فراشة كلاسيكي") without another LLM call
+"""
+
+import re
+from typing import Dict
+from .config import SIMPLIFY_MIN_CONFIDENCE
+from .query_parser import CATEGORY_TERMS, CATEGORY_SINGULAR, MATERIAL_TERMS, STYLE_TERMS, normalize_arabic, tokenize, match_term
+
+SHAPE_TERMS = {
+    "دائري": "دائري", "دائرية": "دائري", "دائره": "دائري", "حلقة": "دائري",
+    "مربع": "مربع", "مربعة": "مربع", "مستطيل": "مستطيل", "مستطيلة": "مستطيل",
+    "بيضاوي": "بيضاوي", "بيضاوية": "بيضاوي", "مثلث": "مثلث", "مثلثة": "مثلث",
+    "قلب": "قلب", "نجمة": "نجمة", "نجوم": "نجمة", "قطرة": "قطرة", "دمعة": "قطرة",
+    "فراشة": "فراشة", "زهرة": "زهرة", "وردة": "زهرة", "ورود": "زهرة", "ورقة": "ورقة", "أوراق": "ورقة",
+    "هلال": "هلال", "حلقات": "حلقات متشابكة", "متشابكة": "حلقات متشابكة", "عقدة": "عقدة"
+}
+
+# Design styles named by the vision prompt beyond the shared style vocabulary
+DESCRIPTION_STYLE_TERMS = dict(STYLE_TERMS, **{
+    "ديكو": "آرت ديكو", "طبيعي": "طبيعي", "طبيعية": "طبيعي", "مضفر": "مضفر", "مضفرة": "مضفر"
+})
+
+_TYPE_PREFIX = re.compile(r"^[\s*#\-\"«]*(?:النوع\s*[:：]\s*)?\**\s*([^\s:：*]+(?:\s+[^\s:：*]+)?)\s*\**\s*[:：]")
+
+
+def _vocab(terms: Dict[str, str]) -> Dict[str, str]:
+    return {normalize_arabic(surface): canonical for surface, canonical in terms.items()}
+
+
+_CATEGORY_VOCAB = _vocab(CATEGORY_TERMS)
+_MATERIAL_VOCAB = _vocab(MATERIAL_TERMS)
+_SHAPE_VOCAB = _vocab(SHAPE_TERMS)
+_STYLE_VOCAB = _vocab(DESCRIPTION_STYLE_TERMS)
+
+
+def parse_image_description(description: str) -> Dict:
+    """Extract type, material, shape and style with a confidence score in [0, 1]"""
+    text = description or ""
+    category = None
+    confidence = 0.0
+
+    # The jewelry type is the word before the first colon ("خاتم: ..." / "النوع: خاتم: ...")
+    prefix = _TYPE_PREFIX.match(text)
+    if prefix:
+        category = match_term(tokenize(prefix.group(1)), _CATEGORY_VOCAB)
+        if not category and normalize_arabic(prefix.group(1)).strip() == "النوع":
+            category = match_term(tokenize(text[prefix.end():])[:2], _CATEGORY_VOCAB)
+    if category:
+        confidence += 0.6
+    else:
+        # Type mentioned somewhere in the body is a weaker signal
+        category = match_term(tokenize(text), _CATEGORY_VOCAB)
+        if category:
+            confidence += 0.3
+
+    tokens = tokenize(text)
+    material = match_term(tokens, _MATERIAL_VOCAB)
+    shape = match_term(tokens, _SHAPE_VOCAB)
+    style = match_term(tokens, _STYLE_VOCAB)
+    confidence += 0.2 * bool(shape) + 0.2 * bool(style or material)
+
+    return {
+        "category": category,
+        "type": CATEGORY_SINGULAR.get(category) if category else None,
+        "material": material,
+        "shape": shape,
+        "style": style,
+        "confidence": round(min(confidence, 1.0), 2)
+    }
+
+
+def build_simplified_query(parsed: Dict) -> str:
+    """Short catalog-style query: type + material + shape + style"""
+    parts = [parsed.get("type") or "مجوهرات"]
+    for key in ["material", "shape", "style"]:
+        if parsed.get(key) and parsed[key] not in parts:
+            parts.append(parsed[key])
+    return " ".join(parts)
+
+
+def is_confident(parsed: Dict) -> bool:
+    return parsed.get("confidence", 0) >= SIMPLIFY_MIN_CONFIDENCE
@@ -0,0 +1,74 @@
+"""
+Backfill for the v2 embedding migration
+Re-embeds every product of the legacy index with V2_EMBEDDING_MODEL, upserts
+the short vectors into the v2 index and writes the full vectors to the v2
+catalog snapshot used for reranking. Safe to re-run: upserts are idempotent
+
+Cutover:
+1. Set EMBEDDING_MODE = "dual_write" so new products reach both indexes
+2. Run `python -m shared.embedding_migration`
+3. Set EMBEDDING_MODE = "v2", then rebuild the ANN index (`python -m shared.ann_index`)
+   and the term table (`python -m shared.term_embeddings`)
+"""
+
+from .catalog_snapshot import write_snapshot
+from .config import (
+    CATALOG_FETCH_LIMIT, EMBEDDING_DIMENSION, V2_EMBEDDING_MODEL, V2_PRIMARY_DIMENSION, V2_CATALOG_SNAPSHOT_DIR
+)
+from .embeddings import shorten_embedding
+from .llm_client import embed_batches
+from .sparse_vectors import get_sparse_vocabulary, product_lexical_text, supports_sparse
+
+BATCH_SIZE = 100
+
+
+def _embedding_text(metadata) -> str:
+    return metadata.get("description") or metadata.get("name") or "-"
+
+
+def _sparse_field(index, metadata) -> dict:
+    """Sparse lexical vector for hybrid search (existing products are already in the vocabulary)"""
+    if not supports_sparse(index):
+        return {}
+    sparse = get_sparse_vocabulary().encode_document(product_lexical_text(metadata), update=False)
+    return {"sparse_values": sparse} if sparse["indices"] else {}
+
+
+def backfill(legacy_index, v2_index, batch_size: int = BATCH_SIZE) -> int:
+    """Copy the catalog into the v2 index and snapshot; returns the product count"""
+    results = legacy_index.query(
+        vector=[0.0] * EMBEDDING_DIMENSION,  # Dummy vector (legacy vectors are full size)
+        top_k=CATALOG_FETCH_LIMIT,
+        include_metadata=True
+    )
+    matches = results.matches
+    batches = [matches[start:start + batch_size] for start in range(0, len(matches), batch_size)]
+    rows = []
+    # Several batch requests in flight on the async client; results arrive in batch order
+    embedded = embed_batches(V2_EMBEDDING_MODEL, ([_embedding_text(match.metadata or {}) for match in batch] for batch in batches))
+    for batch, vectors in zip(batches, embedded):
+        v2_index.upsert(vectors=[
+            {
+                "id": match.id,
+                "values": shorten_embedding(vector, V2_PRIMARY_DIMENSION),
+                "metadata": dict(match.metadata or {}),
+                **_sparse_field(v2_index, match.metadata or {})
+            }
+            for match, vector in zip(batch, vectors)
+        ])
+        rows.extend((match.id, dict(match.metadata or {}), vector) for match, vector in zip(batch, vectors))
+        print(f"Migrated {len(rows)}/{len(matches)} products")
+
+    write_snapshot(rows, V2_CATALOG_SNAPSHOT_DIR)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from .config import init_apis, init_secondary_index
+
+    _, pinecone_index = init_apis()
+    v2_index = init_secondary_index()
+    if v2_index is None:
+        print('Set EMBEDDING_MODE = "dual_write" before running the backfill')
+    else:
+        print(f"Backfilled {backfill(pinecone_index, v2_index)} products into the v2 index and {V2_CATALOG_SNAPSHOT_DIR}")
@@ -1,59 +1,72 @@
-import openai
 import base64
+import hashlib
 import io
+import numpy as np
 from PIL import Image
 import streamlit as st
-from .config import EMBEDDING_MODEL, VISION_MODEL, TEXT_MODEL, MAX_IMAGE_SIZE
+from .config import EMBEDDING_MODEL, PRIMARY_DIMENSION, VISION_MODEL, TEXT_MODEL, MAX_IMAGE_SIZE, EMBEDDING_BATCH_SIZE
+from .llm_client import chat_completion, create_embedding, embed_batches, get_llm_client
+from .query_parser import CATEGORY_NAMES, OTHER_OPTION
+from .singleflight import singleflight, text_key
+from .term_embeddings import lookup_embedding
 
-def resize_image(image, max_size=MAX_IMAGE_SIZE):
-    """Resize image while maintaining aspect ratio and handle format conversion"""
-    # Convert to RGB if necessary
-    if image.mode in ('RGBA', 'LA', 'P'):
+class PreparedImage:
+    """An image normalized once for all vision calls: RGB, resized and JPEG/base64 encoded"""
+
+    def __init__(self, image, jpeg_bytes, base64_data):
+        self.image = image
+        self.jpeg_bytes = jpeg_bytes
+        self.base64 = base64_data
+
+    @property
+    def data_url(self):
+        return f"data:image/jpeg;base64,{self.base64}"
+
+def to_rgb(image):
+    """Convert to RGB (flattening transparency onto white) with a single conversion"""
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA'):
         background = Image.new('RGB', image.size, (255, 255, 255))
-        if image.mode == 'P':
-            image = image.convert('RGBA')
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-    elif image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
     return image
 
-def image_to_base64(image):
-    """Convert PIL image to base64 string"""
-    # Convert RGBA to RGB if necessary
-    if image.mode in ('RGBA', 'LA', 'P'):
-        # Create a white background
-        background = Image.new('RGB', image.size, (255, 255, 255))
-        if image.mode == 'P':
-            image = image.convert('RGBA')
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-    elif image.mode != 'RGB':
-        image = image.convert('RGB')
-    
+def prepare_image(image, max_size=MAX_IMAGE_SIZE):
+    """Decode, normalize and encode an uploaded image once; consumers share the result"""
+    if isinstance(image, PreparedImage):
+        return image
+
+    # JPEG draft mode lets the decoder downscale by 1/2-1/8 while decoding,
+    # so a 12MP phone photo is never fully materialized (no-op once loaded)
+    if image.format == 'JPEG':
+        image.draft('RGB', max_size)
+
+    rgb_image = to_rgb(image)
+    if rgb_image is image:
+        rgb_image = image.copy()  # Never resize the caller's image in place
+    rgb_image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
     buffered = io.BytesIO()
-    image.save(buffered, format="JPEG", quality=85)
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
+    rgb_image.save(buffered, format="JPEG", quality=85)
+    jpeg_bytes = buffered.getvalue()
+    return PreparedImage(rgb_image, jpeg_bytes, base64.b64encode(jpeg_bytes).decode())
 
-def get_image_description(image):
-    """Get detailed description of jewelry image using GPT-4V"""
-    try:
-        # Resize and convert to base64
-        resized_image = resize_image(image.copy())
-        base64_image = image_to_base64(resized_image)
-        
-        response = openai.chat.completions.create(
-            model=VISION_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """ابدأ بتحديد نوع المجوهرات ثم صف التصميم والشكل البصري فقط:
+DEFAULT_IMAGE_DESCRIPTION = "قطعة مجوهرات جميلة"
+
+def _description_request(prepared):
+    """Chat completion arguments of the design-description vision call"""
+    return dict(
+        model=VISION_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": """ابدأ بتحديد نوع المجوهرات ثم صف التصميم والشكل البصري فقط:
 
 **FIRST: حدد النوع بدقة:**
 - خاتم (ring) - يُلبس في الإصبع
@@ -89,33 +102,55 @@ def get_image_description(image):
 ابدأ الوصف بنوع المجوهرات متبوعاً بنقطتين، ثم التصميم.
 لا تذكر المواد أو الألوان - ركز فقط على النوع والشكل والتصميم البصري.
 أجب باللغة العربية فقط."""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": prepared.data_url
                         }
-                    ]
-                }
-            ],
-            # max_tokens=300
-        )
+                    }
+                ]
+            }
+        ],
+        # max_tokens=300
+    )
+
+def get_image_description(image):
+    """Get detailed description of jewelry image using GPT-4V"""
+    try:
+        # Shared preprocessing: decoded, resized and encoded once per image
+        prepared = prepare_image(image)
+
+        # Concurrent uploads of the same image share one vision call
+        image_key = hashlib.sha1(prepared.jpeg_bytes).hexdigest()
+        response = singleflight("image_description", image_key, lambda: chat_completion(**_description_request(prepared)))
         
         return response.choices[0].message.content
         
     except Exception as e:
         st.error(f"خطأ في الحصول على وصف الصورة: {e}")
-        return "قطعة مجوهرات جميلة"
+        return DEFAULT_IMAGE_DESCRIPTION
+
+def get_image_descriptions(images):
+    """Descriptions of several images (bulk upload), requested concurrently on the async client"""
+    client = get_llm_client()
+    futures = [client.submit(client.chat_completion(**_description_request(prepare_image(image)))) for image in images]
+    descriptions = []
+    for future in futures:
+        try:
+            descriptions.append(future.result().choices[0].message.content)
+        except Exception as e:
+            st.error(f"خطأ في الحصول على وصف الصورة: {e}")
+            descriptions.append(DEFAULT_IMAGE_DESCRIPTION)
+    return descriptions
 
 def get_image_category(image):
     """Detect jewelry category from image using GPT-4V"""
     try:
-        # Resize and convert to base64
-        resized_image = resize_image(image.copy())
-        base64_image = image_to_base64(resized_image)
+        # Shared preprocessing: decoded, resized and encoded once per image
+        prepared = prepare_image(image)
         
-        response = openai.chat.completions.create(
+        response = chat_completion(
             model=VISION_MODEL,
             messages=[
                 {
@@ -139,7 +174,7 @@ def get_image_category(image):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": prepared.data_url
                             }
                         }
                     ]
@@ -149,7 +184,7 @@ def get_image_category(image):
         )
         
         category = response.choices[0].message.content.strip()
-        return category if category in ["خواتم", "عقود", "أقراط", "أساور", "دبابيس", "طقم", "أخرى"] else "أخرى"
+        return category if category in CATEGORY_NAMES + [OTHER_OPTION] else OTHER_OPTION
         
     except Exception as e:
         st.error(f"خطأ في تحديد فئة الصورة: {e}")
@@ -158,7 +193,7 @@ def get_image_category(image):
 def expand_search_query(query):
     """Use GPT-4 to expand search query with related terms"""
     try:
-        response = openai.chat.completions.create(
+        response = chat_completion(
             model=TEXT_MODEL,
             messages=[
                 {
@@ -199,19 +234,46 @@ def expand_search_query(query):
         st.error(f"خطأ في توسيع الاستعلام: {e}")
         return f"الأساسي: {query}\nذات صلة: {query}\nالفئة: مجوهرات"
 
-def get_text_embedding(text):
-    """Get OpenAI embedding for text"""
+def get_text_embedding(text, model=EMBEDDING_MODEL):
+    """Get the full OpenAI embedding for text (precomputed for vocabulary-only queries)"""
     try:
-        response = openai.embeddings.create(
-            model=EMBEDDING_MODEL,
+        if model == EMBEDDING_MODEL:
+            vector = lookup_embedding(text)
+            if vector is not None:
+                return vector
+
+        # Identical texts embedded concurrently by other sessions share one request
+        response = singleflight("embedding", (model, text_key(text)), lambda: create_embedding(
+            model=model,
             input=text
-        )
+        ))
         return response.data[0].embedding
         
     except Exception as e:
         st.error(f"خطأ في الحصول على تضمين النص: {e}")
         return None
 
+def get_text_embeddings(texts, model=EMBEDDING_MODEL):
+    """Embeddings of many texts (bulk jobs): batched requests in flight together on the async client;
+    None for texts whose batch failed"""
+    vectors = []
+    batches = [texts[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    try:
+        for batch_vectors in embed_batches(model, batches):
+            vectors.extend(batch_vectors)
+    except Exception as e:
+        st.error(f"خطأ في الحصول على تضمين النص: {e}")
+    return vectors + [None] * (len(texts) - len(vectors))
+
+def shorten_embedding(vector, dimension=PRIMARY_DIMENSION):
+    """First `dimension` components renormalized to unit length, the vector the API
+    returns for `dimensions=dimension` (no-op for vectors that are already short)"""
+    if vector is None or len(vector) <= dimension:
+        return vector
+    head = np.asarray(vector[:dimension], dtype=np.float64)
+    norm = np.linalg.norm(head)
+    return (head / norm if norm else head).tolist()
+
 def parse_query_expansion(expansion_text):
     """Parse the GPT-4 query expansion response"""
     try:
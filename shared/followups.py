@@ -0,0 +1,189 @@
+"""
+Direct answers for follow-up questions about products that were just shown
+Resolves references ("هذا الخاتم", "الأول", "كم سعره") against the session's
+last result set and answers price/karat/weight/link questions from cached
+metadata without any network call
+"""
+
+from typing import Dict, List, Optional
+from .conversation_state import ConversationState
+from .query_parser import CATEGORY_TERMS, FILLER_TERMS, parse_query, tokenize, normalize_arabic, token_variants
+
+# Attribute -> normalized word stems that ask for it
+ATTRIBUTE_STEMS = {
+    "price": ["سعر", "اسعار", "بكم", "ثمن", "تكلف", "تكلفه", "كلفه"],
+    "karat": ["عيار"],
+    "weight": ["وزن", "جرام", "غرام"],
+    "link": ["رابط", "لينك", "link"]
+}
+
+ATTRIBUTE_ORDER = ["price", "karat", "weight", "link"]
+
+ATTRIBUTE_LABELS = {
+    "price": "السعر",
+    "karat": "العيار",
+    "weight": "الوزن",
+    "link": "الرابط"
+}
+
+# Construct-state forms used before a product name ("سعر خاتم الياسمين")
+ATTRIBUTE_PREFIXES = {
+    "price": "سعر",
+    "karat": "عيار",
+    "weight": "وزن",
+    "link": "رابط"
+}
+
+ORDINALS = {
+    "اول": 0, "الاول": 0, "الاولي": 0, "اولا": 0,
+    "ثاني": 1, "الثاني": 1, "الثانيه": 1,
+    "ثالث": 2, "الثالث": 2, "الثالثه": 2,
+    "رابع": 3, "الرابع": 3, "الرابعه": 3,
+    "خامس": 4, "الخامس": 4, "الخامسه": 4,
+    "اخير": -1, "الاخير": -1, "الاخيره": -1
+}
+
+# Words too generic to identify a product by name
+_NAME_STOPWORDS = {normalize_arabic(word) for word in ["خاتم", "عقد", "قلادة", "سلسلة", "أقراط", "سوار", "طقم", "دبوس", "ذهب", "ذهبي", "ذهبية", "فضة", "فضي", "فضية", "مع", "من", "على", "في"]}
+
+# Question words, requests and demonstratives a simple follow-up may contain besides
+# attribute words and product references; any other word makes it an open question
+QUESTION_TERMS = [
+    "كم", "ما", "هو", "هي", "ماهو", "ماهي", "شو", "ايش", "إيش", "وش", "قديش", "اديش", "كيف",
+    "أرسل", "ارسل", "أرسلي", "ابعث", "اعطني", "أعطني", "عطني", "أعرف", "اعرف", "معرفة", "ممكن",
+    "هذا", "هذه", "هذي", "هاذا", "ذا", "ذلك", "تلك", "هاد", "هادا", "هاي",
+    "رقم", "لي", "لنا", "و", "يا", "المنتج", "القطعة", "القطع", "المنتجات"
+]
+_FOLLOWUP_VOCAB = {normalize_arabic(term) for term in QUESTION_TERMS + FILLER_TERMS + list(CATEGORY_TERMS)} | _NAME_STOPWORDS | set(ORDINALS)
+
+
+def detect_attributes(tokens: List[str]) -> List[str]:
+    """Return the product attributes asked about in the message"""
+    found = set()
+    for token in tokens:
+        for variant in token_variants(token):
+            for attribute, stems in ATTRIBUTE_STEMS.items():
+                if any(variant.startswith(stem) for stem in stems):
+                    found.add(attribute)
+    return [attribute for attribute in ATTRIBUTE_ORDER if attribute in found]
+
+
+def is_simple_followup(tokens: List[str], products: List[Dict]) -> bool:
+    """True when every word is an attribute, question word or reference to a shown product
+    ("هل السعر قابل للتفاوض؟" asks something else about the price)"""
+    name_words = {variant for product in products for token in tokenize(product.get("name", "")) for variant in token_variants(token)}
+    known = _FOLLOWUP_VOCAB | name_words
+    for token in tokens:
+        variants = token_variants(token)
+        if not any(
+            variant.isdigit() or variant in known
+            or any(variant.startswith(stem) for stems in ATTRIBUTE_STEMS.values() for stem in stems)
+            for variant in variants
+        ):
+            return False
+    return True
+
+
+def resolve_products(tokens: List[str], products: List[Dict], category: Optional[str] = None) -> List[Dict]:
+    """Resolve which of the last shown products the message refers to"""
+    if not products:
+        return []
+
+    # Ordinal references: "الأول", "الثاني", "الأخير"
+    for token in tokens:
+        for variant in token_variants(token):
+            if variant in ORDINALS:
+                position = ORDINALS[variant]
+                if position < len(products):
+                    return [products[position]]
+
+    # Explicit numbers: "رقم 2"
+    for previous, token in zip(tokens, tokens[1:]):
+        if previous == "رقم" and token.isdigit() and 1 <= int(token) <= len(products):
+            return [products[int(token) - 1]]
+
+    # Distinctive words from a product name: "خاتم الياسمين"
+    message_variants = {variant for token in tokens for variant in token_variants(token)}
+    named = []
+    for product in products:
+        name_tokens = {t for t in tokenize(product.get("name", "")) if t not in _NAME_STOPWORDS and len(t) > 2}
+        name_tokens |= {variant for t in name_tokens for variant in token_variants(t)[1:]}
+        if name_tokens & message_variants:
+            named.append(product)
+    if named:
+        return named
+
+    # Category references: "هذا الخاتم" -> the rings that were shown
+    if category:
+        return [product for product in products if product.get("category") == category]
+
+    return products
+
+
+def _format_value(attribute: str, product: Dict) -> Optional[str]:
+    if attribute == "price":
+        return f"{float(product.get('price') or 0):.2f} ريال" if product.get("price") else None
+    if attribute == "karat":
+        return product.get("karat") or None
+    if attribute == "weight":
+        return f"{product['weight']} جرام" if product.get("weight") else None
+    if attribute == "link":
+        return product.get("product_url") or None
+    return None
+
+
+def render_answer(attributes: List[str], products: List[Dict]) -> str:
+    """Render a templated Arabic answer for the requested attributes"""
+    lines = []
+
+    if len(products) == 1:
+        product = products[0]
+        name = product.get("name") or "المنتج"
+        for attribute in attributes:
+            value = _format_value(attribute, product)
+            if value:
+                lines.append(f"{ATTRIBUTE_PREFIXES[attribute]} {name}: {value}")
+            else:
+                lines.append(f"للأسف معلومة {ATTRIBUTE_LABELS[attribute]} غير متوفرة حالياً لـ {name}")
+    else:
+        labels = " و".join(ATTRIBUTE_LABELS[attribute] for attribute in attributes)
+        lines.append(f"إليك {labels} للمنتجات التي عرضتها عليك:")
+        for i, product in enumerate(products, 1):
+            values = []
+            for attribute in attributes:
+                value = _format_value(attribute, product)
+                values.append(value if value else f"{ATTRIBUTE_LABELS[attribute]} غير متوفر")
+            lines.append(f"{i}. {product.get('name') or 'منتج'}: {' | '.join(values)}")
+
+    lines.append("\nهل تود معرفة تفاصيل أخرى أو رؤية قطع مشابهة؟ 😊")
+    return "\n".join(lines)
+
+
+def answer_followup(message: str, state: ConversationState) -> Optional[str]:
+    """
+    Answer an attribute follow-up from the last shown products
+    Returns None when the message is not a simple follow-up (the LLM handles it)
+    """
+    if not state or not state.last_products:
+        return None
+
+    tokens = tokenize(message)
+    attributes = detect_attributes(tokens)
+    if not attributes or not is_simple_followup(tokens, state.last_products):
+        return None
+
+    # New search constraints mean this is a new request, not a follow-up
+    constraints = parse_query(message)
+    if any(constraints.get(key) for key in ["material", "style", "occasion", "vague", "karat"]):
+        return None
+    if any(constraints.get(key) is not None for key in ["min_price", "max_price", "min_weight", "max_weight"]):
+        return None
+    shown_categories = {product.get("category") for product in state.last_products}
+    if constraints.get("category") and constraints["category"] not in shown_categories:
+        return None
+
+    products = resolve_products(tokens, state.last_products, constraints.get("category"))
+    if not products:
+        return None
+
+    return render_answer(attributes, products)
@@ -0,0 +1,161 @@
+"""
+Local content-addressed image store
+Saves a normalized master plus MAX_IMAGE_SIZE and THUMBNAIL_SIZE renditions
+under paths derived from the SHA-256 of the uploaded bytes, so identical
+uploads are stored (and processed) only once
+
+Run `python -m shared.image_store` to serve the store over HTTP with
+long-lived cache headers
+"""
+
+import hashlib
+import io
+import os
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from PIL import Image
+from .config import (
+    IMAGE_STORE_DIR, IMAGE_STORE_PORT, IMAGE_STORE_HOST, IMAGE_STORE_BASE_URL, IMAGE_CACHE_MAX_AGE, MAX_IMAGE_SIZE,
+    THUMBNAIL_SIZE, MASTER_MAX_SIZE
+)
+from .embeddings import PreparedImage, prepare_image, to_rgb
+
+RENDITIONS = ("master", "large", "thumb")
+INGESTED_MARKER = "product_id"
+
+
+def content_key(data: bytes) -> str:
+    """Content hash used as the storage key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_dir(key: str) -> str:
+    return os.path.join(IMAGE_STORE_DIR, key[:2], key)
+
+
+def image_path(key: str, rendition: str = "large") -> str:
+    """Filesystem path of a rendition"""
+    return os.path.join(image_dir(key), f"{rendition}.jpg")
+
+
+def rendition_url(key: str, rendition: str = "large") -> str:
+    """Address of a rendition on the image server (`python -m shared.image_store`)"""
+    return f"{IMAGE_STORE_BASE_URL.rstrip('/')}/{key[:2]}/{key}/{rendition}.jpg"
+
+
+def has_image(key: str) -> bool:
+    """True when all renditions of the image are already stored"""
+    return all(os.path.exists(image_path(key, rendition)) for rendition in RENDITIONS)
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _encode(image, quality: int = 85) -> bytes:
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def _master_bytes(source_bytes: bytes) -> bytes:
+    """Master rendition: the upload itself when it is an RGB JPEG within MASTER_MAX_SIZE, else
+    decoded in JPEG draft mode (downscaled while decoding) and capped at that size"""
+    image = Image.open(io.BytesIO(source_bytes))  # Reads the header only
+    within = image.size[0] <= MASTER_MAX_SIZE[0] and image.size[1] <= MASTER_MAX_SIZE[1]
+    if image.format == "JPEG" and image.mode == "RGB" and within:
+        return source_bytes
+    if image.format == "JPEG":
+        image.draft("RGB", MASTER_MAX_SIZE)
+    master = to_rgb(image)
+    master.thumbnail(MASTER_MAX_SIZE, Image.Resampling.LANCZOS)
+    return _encode(master, quality=90)
+
+
+def store_image(source_bytes: bytes, prepared: Optional[PreparedImage] = None) -> str:
+    """Store master, large and thumbnail renditions; returns the content key"""
+    key = content_key(source_bytes)
+    if has_image(key):
+        return key
+
+    os.makedirs(image_dir(key), exist_ok=True)
+
+    # Master: RGB JPEG capped at MASTER_MAX_SIZE, never a full-resolution decode of a large upload
+    _write_atomic(image_path(key, "master"), _master_bytes(source_bytes))
+
+    # Large: reuse the payload already encoded for the vision call when available
+    if prepared is None or prepared.image.size[0] > MAX_IMAGE_SIZE[0] or prepared.image.size[1] > MAX_IMAGE_SIZE[1]:
+        prepared = prepare_image(Image.open(io.BytesIO(source_bytes)))  # Draft-decoded to MAX_IMAGE_SIZE
+    _write_atomic(image_path(key, "large"), prepared.jpeg_bytes)
+
+    thumbnail = prepared.image.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    _write_atomic(image_path(key, "thumb"), _encode(thumbnail))
+
+    return key
+
+
+def load_image(key: str, rendition: str = "large"):
+    """Open a stored rendition"""
+    return Image.open(image_path(key, rendition))
+
+
+def mark_ingested(key: str, product_id: str):
+    """Record which product was created from this image"""
+    _write_atomic(os.path.join(image_dir(key), INGESTED_MARKER), product_id.encode())
+
+
+def is_ingested(key: str) -> bool:
+    """True when a product was already created from this image"""
+    return os.path.exists(os.path.join(image_dir(key), INGESTED_MARKER))
+
+
+def unmark_ingested(key: str):
+    """Forget the product link (after the product was deleted)"""
+    marker = os.path.join(image_dir(key), INGESTED_MARKER)
+    if os.path.exists(marker):
+        os.remove(marker)
+
+
+class CachingImageHandler(SimpleHTTPRequestHandler):
+    """Serves rendition files only, with immutable cache headers (paths are content hashes)"""
+
+    RENDITION_FILES = {f"{rendition}.jpg" for rendition in RENDITIONS}
+
+    def send_head(self):
+        # Only rendition files: no directory listings and no marker files
+        if os.path.basename(self.path.split("?", 1)[0]) not in self.RENDITION_FILES:
+            self.send_error(404)
+            return None
+        return super().send_head()
+
+    def list_directory(self, path):
+        self.send_error(404)
+        return None
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        # Missing keys must not be cached: the image may be stored later
+        if getattr(self, "_status", None) == 200:
+            self.send_header("Cache-Control", f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable")
+        super().end_headers()
+
+
+def serve_image_store(host: str = IMAGE_STORE_HOST, port: int = IMAGE_STORE_PORT):
+    """Serve the image store renditions over HTTP"""
+    os.makedirs(IMAGE_STORE_DIR, exist_ok=True)
+    handler = functools.partial(CachingImageHandler, directory=IMAGE_STORE_DIR)
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {IMAGE_STORE_DIR} on {host}:{port} ({IMAGE_STORE_BASE_URL})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve_image_store()
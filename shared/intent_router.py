@@ -0,0 +1,105 @@
+"""
+Deterministic tool routing for chat turns
+Applies the chat prompt's decision rules locally: a jewelry type plus at least
+one detail (material, style, occasion, karat, budget) searches, a type or a
+detail alone asks for clarification. Facets remembered in the conversation
+state count, so "ذهب" after "خاتم" searches for a gold ring. Messages with
+words outside the shared vocabulary are left to the LLM router
+"""
+
+import json
+import uuid
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from .clarification import clarification_questions, get_facet_distribution
+from .conversation_state import ConversationState
+from .query_parser import CATEGORY_SINGULAR, INTENT_TERMS, normalize_arabic, parse_query, tokenize, token_variants, unrecognized_tokens
+
+SEARCH_TOOL_NAME = "search_jewelry_products"
+CLARIFICATION_TOOL_NAME = "ask_clarifying_questions"
+
+DETAIL_KEYS = ["material", "style", "occasion", "karat"]
+_INTENT_VOCAB = {normalize_arabic(term) for term in INTENT_TERMS}
+
+
+class RoutedMessage:
+    """Assistant message with one locally decided tool call, shaped like the API's message object"""
+
+    role = "assistant"
+    content = None
+
+    def __init__(self, name: str, arguments: Dict):
+        self.tool_calls = [SimpleNamespace(
+            id=f"call_local_{uuid.uuid4().hex[:16]}",
+            type="function",
+            function=SimpleNamespace(name=name, arguments=json.dumps(arguments, ensure_ascii=False))
+        )]
+
+    def to_dict(self) -> Dict:
+        """Chat message dict to append to the conversation before the tool result"""
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                }
+                for tool_call in self.tool_calls
+            ]
+        }
+
+
+def _has_product_signal(message: str, constraints: Dict) -> bool:
+    if constraints.get("category") or constraints.get("vague") or any(constraints.get(key) for key in DETAIL_KEYS):
+        return True
+    if any(constraints.get(key) is not None for key in ["min_price", "max_price", "min_weight", "max_weight"]):
+        return True
+    return any(variant in _INTENT_VOCAB for token in tokenize(message) for variant in token_variants(token))
+
+
+def _state_has_detail(state: ConversationState) -> bool:
+    return any(state.preferences.get(key) for key in DETAIL_KEYS) or state.min_price is not None or state.max_price is not None
+
+
+def build_search_query(message: str, constraints: Dict, state: ConversationState) -> str:
+    """The message completed with the type, facets and budget remembered from earlier turns"""
+    parts: List[str] = []
+    category = state.preferences.get("category")
+    if category and not constraints.get("category"):
+        parts.append(CATEGORY_SINGULAR.get(category, category))
+    for key in DETAIL_KEYS:
+        if state.preferences.get(key) and not constraints.get(key):
+            parts.append(state.preferences[key])
+    if state.max_price is not None and constraints.get("max_price") is None:
+        parts.append(f"أقل من {state.max_price:.0f} ريال")
+    if state.min_price is not None and constraints.get("min_price") is None:
+        parts.append(f"أكثر من {state.min_price:.0f} ريال")
+    return " ".join(parts + [message.strip()])
+
+
+def clarification_arguments(constraints: Dict, state: ConversationState) -> Dict:
+    """Reason and questions for the facets that are still missing (options from the catalog)"""
+    questions = clarification_questions(constraints, state, get_facet_distribution())
+    if not state.preferences.get("category"):
+        return {"reason": "لدينا تشكيلة واسعة، وأود أن أعرف ما الذي يناسبك بالضبط.", "questions": questions}
+    singular = CATEGORY_SINGULAR.get(state.preferences["category"], state.preferences["category"])
+    return {
+        "reason": f"لدينا تشكيلة متنوعة من {state.preferences['category']}، ولكي أعرض عليك الـ{singular} الأنسب:",
+        "questions": questions
+    }
+
+
+def route_intent(message: str, state: ConversationState) -> Optional[RoutedMessage]:
+    """
+    Tool call decided from the message and conversation state (updated with this message),
+    or None when the message needs the LLM router (open questions, unknown words, small talk)
+    """
+    constraints = parse_query(message)
+    if not _has_product_signal(message, constraints) or unrecognized_tokens(message):
+        return None
+
+    if state.preferences.get("category") and _state_has_detail(state):
+        return RoutedMessage(SEARCH_TOOL_NAME, {"query": build_search_query(message, constraints, state)})
+    return RoutedMessage(CLARIFICATION_TOOL_NAME, clarification_arguments(constraints, state))
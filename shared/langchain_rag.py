@@ -17,6 +17,13 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.chains import RetrievalQA
 from pinecone import Pinecone
 import openai
+from .config import EMBEDDING_MODEL, EMBEDDING_DIMENSION, PRIMARY_DIMENSION, CATALOG_FETCH_LIMIT
+from .catalog_indexes import primary_query
+from .embeddings import get_text_embedding
+from .context_builder import build_product_context, build_history_context, format_history_text
+from .catalog_snapshot import get_catalog_snapshot
+from .query_parser import expand_query_terms
+from .sparse_vectors import supports_sparse
 
 
 class ArabicJewelryRAG:
@@ -27,9 +34,10 @@ class ArabicJewelryRAG:
         self.pinecone_index = pinecone_index
         self.openai_api_key = openai_api_key
 
-        # Initialize embeddings - must match existing Pinecone index dimensions (1536)
+        # Initialize embeddings - must match the Pinecone index model and dimensions
         self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002",  # 1536 dimensions - matches existing index
+            model=EMBEDDING_MODEL,
+            dimensions=PRIMARY_DIMENSION if PRIMARY_DIMENSION < EMBEDDING_DIMENSION else None,
             openai_api_key=openai_api_key
         )
 
@@ -47,6 +55,8 @@ class ArabicJewelryRAG:
 
     def _setup_retriever(self):
         """Setup the hybrid retriever (vector + BM25)"""
+        if supports_sparse(self.pinecone_index):
+            return  # Keyword matching happens in Pinecone's sparse-dense query; no BM25 or catalog fetch
         try:
             # Get all documents from Pinecone
             docs = self._fetch_all_documents()
@@ -82,26 +92,29 @@ class ArabicJewelryRAG:
             st.error(f"❌ Failed to setup retriever: {e}")
 
     def _fetch_all_documents(self) -> List[Document]:
-        """Fetch all products as LangChain documents"""
+        """Fetch all products as LangChain documents (from the local catalog snapshot)"""
         try:
-            # Query Pinecone for all products
-            results = self.pinecone_index.query(
-                vector=[0.0] * 1536,  # Dummy vector
-                top_k=1000,  # Get many results
-                include_metadata=True
-            )
+            snapshot = get_catalog_snapshot(self.pinecone_index)
+            if snapshot.exists():
+                products = list(snapshot.products())
+            else:
+                # Query Pinecone for all products
+                results = self.pinecone_index.query(
+                    vector=[0.0] * PRIMARY_DIMENSION,  # Dummy vector
+                    top_k=CATALOG_FETCH_LIMIT,
+                    include_metadata=True
+                )
+                products = [(match.id, match.metadata) for match in results.matches]
 
             documents = []
-            for match in results.matches:
-                metadata = match.metadata
-
+            for product_id, metadata in products:
                 # Create rich text content for better search
                 content = self._create_document_content(metadata)
 
                 doc = Document(
                     page_content=content,
                     metadata={
-                        "id": match.id,
+                        "id": product_id,
                         "name": metadata.get("name", ""),
                         "category": metadata.get("category", ""),
                         "price": metadata.get("price", 0),
@@ -110,7 +123,7 @@ class ArabicJewelryRAG:
                         "design": metadata.get("design", ""),
                         "style": metadata.get("style", ""),
                         "product_url": metadata.get("product_url", ""),
-                        "score": getattr(match, 'score', 0)
+                        "score": 0
                     }
                 )
                 documents.append(doc)
@@ -159,12 +172,15 @@ class ArabicJewelryRAG:
     def search(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search for products using LangChain RAG"""
         try:
-            if not self.retriever:
-                return []
-
             # Enhanced query processing
             processed_query = self._enhance_query(query)
 
+            if supports_sparse(self.pinecone_index):
+                return self._hybrid_search(processed_query, max_results)
+
+            if not self.retriever:
+                return []
+
             # Retrieve relevant documents
             docs = self.retriever.get_relevant_documents(processed_query)
 
@@ -195,51 +211,60 @@ class ArabicJewelryRAG:
             st.error(f"Search error: {e}")
             return []
 
+    def _hybrid_search(self, query: str, max_results: int) -> List[Dict]:
+        """One sparse-dense Pinecone query instead of the vector + BM25 ensemble"""
+        embedding = get_text_embedding(query)
+        if embedding is None:
+            return []
+        return [
+            {
+                'id': match.id,
+                'score': match.score,
+                'metadata': {
+                    'name': match.metadata.get('name', ''),
+                    'category': match.metadata.get('category', ''),
+                    'price': match.metadata.get('price', 0),
+                    'karat': match.metadata.get('karat', ''),
+                    'weight': match.metadata.get('weight', 0),
+                    'design': match.metadata.get('design', ''),
+                    'style': match.metadata.get('style', ''),
+                    'product_url': match.metadata.get('product_url', ''),
+                    'description': self._create_document_content(match.metadata)
+                }
+            }
+            for match in primary_query(self.pinecone_index, embedding, max_results, query_text=query)
+        ]
+
     def _enhance_query(self, query: str) -> str:
         """Enhance query for better Arabic search"""
-        # Expand common Arabic jewelry terms
-        expansions = {
-            "سلاسل": "سلاسل عقود قلائد سلسلة قلادة عقد",
-            "خواتم": "خواتم خاتم دبل",
-            "اساور": "اساور سوار اسورة",
-            "اقراط": "اقراط قرط حلق",
-            "ذهب": "ذهب ذهبي ذهبية",
-            "فضة": "فضة فضي فضية",
-            "بسيط": "بسيط بساطة ناعم",
-            "فاخر": "فاخر فخم راقي أنيق"
-        }
-
-        enhanced_query = query
-        for term, expansion in expansions.items():
-            if term in query:
-                enhanced_query = f"{query} {expansion}"
-                break
-
-        return enhanced_query
+        # Expand the first jewelry term with its synonyms from the shared vocabulary
+        return expand_query_terms(query)
 
     def conversational_search(self, query: str, conversation_history: List = None) -> tuple:
         """
         Perform conversational search with context awareness
         Returns: (answer, search_results)
         """
-        try:
-            # Get search results
-            search_results = self.search(query, max_results=5)
+        # Get search results
+        search_results = self.search(query, max_results=5)
+        return self.answer_from_results(query, search_results, conversation_history)
 
+    def answer_from_results(self, query: str, search_results: List[Dict], conversation_history: List = None) -> tuple:
+        """
+        Generate the conversational answer for already retrieved results
+        Returns: (answer, search_results)
+        """
+        try:
             if not search_results:
                 return "عذراً، لا توجد منتجات مطابقة لطلبك في مخزوننا الحالي. جرب مصطلحات أخرى أو تصفح مجموعتنا.", []
 
             # Create context from search results
             context = self._create_context_from_results(search_results)
 
-            # Build conversation context
+            # Build conversation context within the history token budget
             conversation_context = ""
             if conversation_history:
-                recent_messages = conversation_history[-4:] if len(conversation_history) > 4 else conversation_history
-                for msg in recent_messages:
-                    if msg.get("role") in ["user", "assistant"]:
-                        content = msg.get("content", "")[:150]  # Limit length
-                        conversation_context += f"{msg['role']}: {content}\n"
+                conversation_context = format_history_text(build_history_context(conversation_history[-4:]))
 
             # Create conversational prompt
             prompt = ChatPromptTemplate.from_template("""
@@ -291,25 +316,8 @@ class ArabicJewelryRAG:
 
     def _create_context_from_results(self, results: List[Dict]) -> str:
         """Create formatted context from search results"""
-        context_parts = []
-
-        for i, result in enumerate(results, 1):
-            metadata = result['metadata']
-            url_info = f"- الرابط: {metadata.get('product_url')}" if metadata.get('product_url') else ""
-
-            context_parts.append(f"""
-المنتج {i}:
-- الاسم: {metadata.get('name', 'غير محدد')}
-- السعر: {metadata.get('price', 'غير محدد')} ريال
-- النوع: {metadata.get('category', 'غير محدد')}
-- العيار: {metadata.get('karat', 'غير محدد')}
-- الوزن: {metadata.get('weight', 'غير محدد')} جرام
-- التصميم: {metadata.get('design', 'غير محدد')}
-- الطراز: {metadata.get('style', 'غير محدد')}{url_info}
-- الوصف: {metadata.get('description', 'غير محدد')[:200]}...
-""")
-
-        return "\n".join(context_parts)
+        context, _ = build_product_context(results)
+        return context
 
 
 def init_langchain_rag(pinecone_index, openai_api_key: str) -> ArabicJewelryRAG:
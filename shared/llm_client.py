@@ -0,0 +1,196 @@
+"""
+Asynchronous OpenAI client layer
+One pooled HTTP connection pool per process, per-model concurrency limits,
+token-bucket rate limiting, jittered retries on 429/5xx and a deadline on
+every call. Synchronous shims keep the existing call sites working while bulk
+jobs and parallel stages use the async API
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
+import httpx
+import openai
+from .config import (
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_REQUESTS_PER_SECOND, LLM_BURST,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_DEADLINE_SECONDS,
+    EMBEDDING_DEADLINE_SECONDS, DEFAULT_MODEL_CONCURRENCY, MODEL_CONCURRENCY, LLM_BATCH_WINDOW
+)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError
+)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncLLMClient:
+    """Process-wide async OpenAI client running on a dedicated event loop"""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client-loop", daemon=True)
+        self._thread.start()
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _get_client(self) -> openai.AsyncOpenAI:
+        """Create the pooled client lazily (init_apis sets the API key first)"""
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(LLM_DEADLINE_SECONDS, connect=10.0)
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=openai.api_key,
+                http_client=http_client,
+                max_retries=0  # Retries are handled here with jitter
+            )
+        return self._client
+
+    def _limits(self, model: str):
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(MODEL_CONCURRENCY.get(model, DEFAULT_MODEL_CONCURRENCY))
+            self._buckets[model] = TokenBucket(LLM_REQUESTS_PER_SECOND, LLM_BURST)
+        return self._semaphores[model], self._buckets[model]
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        """Honor Retry-After when present, otherwise exponential backoff with full jitter"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def _call(self, model: str, request, deadline: float):
+        client = self._get_client()
+        semaphore, bucket = self._limits(model)
+
+        async def attempt_with_retries():
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                await bucket.acquire()
+                try:
+                    async with semaphore:
+                        return await request(client)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+                    print(f"[llm_client] {model}: {type(e).__name__}, retry {attempt + 1} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+        return await asyncio.wait_for(attempt_with_retries(), timeout=deadline)
+
+    async def _on_loop(self, coro):
+        """Run a coroutine on the client loop, awaiting it from any other loop"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def chat_completion(self, deadline: float = LLM_DEADLINE_SECONDS, **kwargs):
+        """Async chat completion (same keyword arguments as chat.completions.create)"""
+        return await self._on_loop(
+            self._call(kwargs["model"], lambda client: client.chat.completions.create(**kwargs), deadline)
+        )
+
+    async def embedding(self, deadline: float = EMBEDDING_DEADLINE_SECONDS, **kwargs):
+        """Async embedding request (same keyword arguments as embeddings.create)"""
+        return await self._on_loop(
+            self._call(kwargs["model"], lambda client: client.embeddings.create(**kwargs), deadline)
+        )
+
+    def run(self, coro):
+        """Block the calling thread until a coroutine finishes on the client loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the client loop and return a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+
+_llm_client: Optional[AsyncLLMClient] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> AsyncLLMClient:
+    """Return the process-wide async client"""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = AsyncLLMClient()
+    return _llm_client
+
+
+def chat_completion(deadline: float = LLM_DEADLINE_SECONDS, **kwargs):
+    """Synchronous shim for openai.chat.completions.create"""
+    client = get_llm_client()
+    return client.run(client.chat_completion(deadline=deadline, **kwargs))
+
+
+def create_embedding(deadline: float = EMBEDDING_DEADLINE_SECONDS, **kwargs):
+    """Synchronous shim for openai.embeddings.create"""
+    client = get_llm_client()
+    return client.run(client.embedding(deadline=deadline, **kwargs))
+
+
+def embed_batches(model: str, batches: Iterable[List[str]], window: int = LLM_BATCH_WINDOW,
+                  deadline: float = EMBEDDING_DEADLINE_SECONDS, **kwargs) -> Iterator[List[List[float]]]:
+    """
+    Embedding vectors of each input batch, in input order, for bulk jobs
+    Up to `window` batch requests are in flight on the async client at once
+    (still bounded by the model's semaphore and rate limit)
+    """
+    client = get_llm_client()
+    batches = iter(batches)
+    pending = deque()
+
+    def submit_next():
+        batch = next(batches, None)
+        if batch is not None:
+            pending.append(client.submit(client.embedding(deadline=deadline, model=model, input=batch, **kwargs)))
+
+    for _ in range(window):
+        submit_next()
+    while pending:
+        response = pending.popleft().result()
+        submit_next()
+        yield [item.embedding for item in response.data]
@@ -0,0 +1,112 @@
+"""
+Per-product rendered text fragments
+The LLM context row, the short card details and the truncated descriptions of
+a product are rendered once and cached by product ID and a fingerprint of the
+rendered fields (plus the catalog version), so formatting search results is a
+join of cached strings and any metadata change, in any process, renders anew
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from .config import DESCRIPTION_TOKENS, FRAGMENT_CACHE_SIZE
+from .context_builder import truncate_to_tokens
+
+CARD_DESCRIPTION_CHARS = 80
+LIST_DESCRIPTION_CHARS = 100
+DETAIL_DESCRIPTION_CHARS = 150
+
+_FINGERPRINT_FIELDS = ["name", "price", "category", "karat", "weight", "design", "style", "product_url", "description"]
+
+
+class ProductFragments:
+    """Pre-rendered Arabic text for one product version"""
+
+    def __init__(self, metadata: Dict):
+        price = metadata.get('price', 0) or 0
+        weight = metadata.get('weight', 0) or 0
+        description = metadata.get('description', '') or ''
+
+        self.name = metadata.get('name') or 'منتج'
+        self.price_text = f"{float(price):.2f} ريال"
+        self.category = metadata.get('category') or 'غير محدد'
+
+        # LLM context table row without the leading position number
+        fields = [
+            self.name,
+            self.price_text,
+            metadata.get('category') or '-',
+            metadata.get('karat') or '-',
+            f"{weight} جرام" if weight > 0 else '-',
+            metadata.get('design') or '-',
+            metadata.get('product_url') or '-'
+        ]
+        self.context_row_short = " | ".join(fields + ['-'])
+        self.context_row = " | ".join(fields + [truncate_to_tokens(" ".join(description.split()), DESCRIPTION_TOKENS) or '-'])
+
+        # Short card details for the chat UI
+        details = []
+        if metadata.get('karat'):
+            details.append(f"العيار: {metadata.get('karat')}")
+        if weight > 0:
+            details.append(f"الوزن: {weight} جرام")
+        if metadata.get('design'):
+            details.append(f"التصميم: {metadata.get('design')}")
+        self.card_details = " | ".join(details)
+
+        # Truncated descriptions for chat cards, catalog grids and search result pages
+        self.card_description = _truncate_chars(description, CARD_DESCRIPTION_CHARS)
+        self.list_description = _truncate_chars(description, LIST_DESCRIPTION_CHARS)
+        self.detail_description = _truncate_chars(description, DETAIL_DESCRIPTION_CHARS)
+
+
+def _truncate_chars(text: str, limit: int) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def catalog_version(metadata: Dict) -> str:
+    """Cache key part: the stamped version plus a fingerprint of the rendered fields
+    (a metadata update that keeps the version still changes the key)"""
+    payload = "\x1f".join(str(metadata.get(field, '')) for field in ["catalog_version"] + _FINGERPRINT_FIELDS)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def new_catalog_version() -> str:
+    return str(int(time.time() * 1000))
+
+
+def touch_product(product_id: str, metadata: Dict) -> Dict:
+    """Stamp a new catalog version on metadata about to be upserted and drop the cached fragments"""
+    metadata["catalog_version"] = new_catalog_version()
+    invalidate_fragments(product_id)
+    return metadata
+
+
+_cache: "OrderedDict[Tuple[str, str], ProductFragments]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_fragments(product_id: str, metadata: Dict) -> ProductFragments:
+    """Return the cached fragments of a product, rendering them on first use"""
+    key = (product_id, catalog_version(metadata))
+    with _cache_lock:
+        fragments = _cache.get(key)
+        if fragments is not None:
+            _cache.move_to_end(key)
+            return fragments
+
+    fragments = ProductFragments(metadata)
+    with _cache_lock:
+        _cache[key] = fragments
+        while len(_cache) > FRAGMENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return fragments
+
+
+def invalidate_fragments(product_id: str):
+    """Drop every cached version of a product"""
+    with _cache_lock:
+        for key in [key for key in _cache if key[0] == product_id]:
+            del _cache[key]
@@ -0,0 +1,33 @@
+"""
+Message assembly for chat completions
+Keeps static instructions (and the tool schemas sent alongside them) as a
+byte-stable prefix so the provider's automatic prompt caching can hit, and
+appends everything that changes per turn after it
+"""
+
+from typing import Dict, List, Optional, Union
+
+
+def build_messages(
+    system_prompt: str,
+    history: Optional[List[Dict]] = None,
+    context: Optional[Union[str, List[str]]] = None,
+    user_message: Optional[str] = None
+) -> List[Dict]:
+    """Assemble messages as: static system prompt, history, per-turn context, user message"""
+    messages = [{"role": "system", "content": system_prompt}]
+
+    for msg in history or []:
+        if msg.get("role") in ["user", "assistant"]:
+            messages.append({"role": msg["role"], "content": msg["content"]})
+
+    # Per-turn context goes after the cacheable prefix, never inside it
+    context_blocks = [context] if isinstance(context, str) else (context or [])
+    for block in context_blocks:
+        if block:
+            messages.append({"role": "system", "content": block})
+
+    if user_message is not None:
+        messages.append({"role": "user", "content": user_message})
+
+    return messages
@@ -0,0 +1,271 @@
+"""
+Arabic query normalization and constraint parsing for jewelry queries
+Holds the canonical category/material/style/occasion vocabulary shared by the apps
+"""
+
+import re
+from typing import Dict, List, Optional
+
+_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_PREFIXES = ["وبال", "وال", "بال", "فال", "كال", "لل", "ال", "و", "ب", "ل", "ف"]
+
+# Canonical vocabulary: surface form -> canonical value
+CATEGORY_TERMS = {
+    "خاتم": "خواتم", "خواتم": "خواتم", "دبلة": "خواتم", "دبل": "خواتم",
+    "عقد": "عقود", "عقود": "عقود", "قلادة": "عقود", "قلائد": "عقود",
+    "سلسلة": "عقود", "سلاسل": "عقود", "سلسال": "عقود",
+    "أقراط": "أقراط", "قرط": "أقراط", "حلق": "أقراط", "حلقان": "أقراط",
+    "سوار": "أساور", "أساور": "أساور", "اسورة": "أساور", "إسورة": "أساور", "أسورة": "أساور",
+    "دبوس": "دبابيس", "دبابيس": "دبابيس", "بروش": "دبابيس",
+    "طقم": "طقم", "أطقم": "طقم"
+}
+
+MATERIAL_TERMS = {
+    "ذهب": "ذهب", "ذهبي": "ذهب", "ذهبية": "ذهب",
+    "فضة": "فضة", "فضي": "فضة", "فضية": "فضة",
+    "بلاتين": "بلاتين", "ألماس": "ألماس", "ماس": "ألماس", "الماس": "ألماس",
+    "لؤلؤ": "لؤلؤ", "لؤلؤة": "لؤلؤ", "زمرد": "زمرد", "ياقوت": "ياقوت"
+}
+
+STYLE_TERMS = {
+    "بسيط": "بسيط", "بسيطة": "بسيط", "ناعم": "بسيط", "ناعمة": "بسيط",
+    "عصري": "عصري", "عصرية": "عصري", "كلاسيكي": "كلاسيكي", "كلاسيكية": "كلاسيكي",
+    "فاخر": "فاخر", "فاخرة": "فاخر", "فخم": "فاخر", "فخمة": "فاخر",
+    "أنيق": "أنيق", "أنيقة": "أنيق", "رومانسي": "رومانسي", "رومانسية": "رومانسي",
+    "هندسي": "هندسي", "هندسية": "هندسي", "بوهيمي": "بوهيمي", "بوهيمية": "بوهيمي",
+    "عتيق": "عتيق", "عتيقة": "عتيق", "فينتاج": "عتيق"
+}
+
+OCCASION_TERMS = {
+    "زواج": "زواج", "زفاف": "زواج", "عرس": "زواج", "عروس": "زواج",
+    "خطوبة": "خطوبة", "خطوبه": "خطوبة",
+    "هدية": "هدية", "هدايا": "هدية",
+    "يومي": "استعمال يومي", "يومية": "استعمال يومي",
+    "سهرة": "مناسبة", "مناسبة": "مناسبة", "مناسبات": "مناسبة", "حفلة": "مناسبة"
+}
+
+# Everyday words ("ساعات العمل") that mean an occasion only next to a jewelry type ("خاتم للعمل")
+CONTEXTUAL_OCCASION_TERMS = {"عمل": "عمل", "دوام": "عمل"}
+
+VAGUE_TERMS = ["مجوهرات", "اكسسوارات", "إكسسوارات", "شيء", "حاجة"]
+
+# Words that ask to see products ("عندكم", "وريني") without naming one
+INTENT_TERMS = [
+    "ابحث", "أبحث", "أريد", "أطلب", "اعرض", "أعرض", "وريني", "أوريني",
+    "عندكن", "عندكم", "متوفر", "موجود", "يوجد", "عرضوا", "لديكم", "لديكن",
+    "بتصميم", "بشكل"
+]
+
+# Filler words that may surround a vocabulary phrase ("أريد خاتم ذهب لو سمحت")
+FILLER_TERMS = INTENT_TERMS + ["ابي", "ابغى", "بدي", "هل", "في", "من", "عن", "لو", "سمحت", "ممكن", "فيه", "عندك"]
+
+OTHER_OPTION = "أخرى"
+CATEGORY_NAMES = ["خواتم", "عقود", "أقراط", "أساور", "دبابيس", "طقم"]
+KARAT_NAMES = ["18 قيراط", "21 قيراط", "24 قيراط", "فضة 925", "فضة 999", "بلاتين"]
+STYLE_NAMES = ["عصري", "كلاسيكي", "عتيق", "بسيط", "فاخر", "رومانسي", "هندسي", "بوهيمي"]
+
+# Category -> singular word used in queries
+CATEGORY_SINGULAR = {
+    "خواتم": "خاتم", "عقود": "عقد", "أقراط": "أقراط",
+    "أساور": "سوار", "دبابيس": "دبوس", "طقم": "طقم"
+}
+
+_KARAT_PATTERN = re.compile(r"(?:عيار|عياره)\s*(\d{2})|(\d{2})\s*(?:قيراط|ق\b)")
+_SILVER_KARAT_PATTERN = re.compile(r"(?:فضه|فضة)?\s*(925|999)")
+_NOT_WEIGHT = r"(?![\d.,]|\s*(?:جرام|غرام|جم))"
+_MAX_PRICE_PATTERN = re.compile(r"(?:اقل|تحت|حدود|بحدود|لا يتجاوز|ما يتجاوز|ميزانيه|ميزانيتي|الي|حتي)\s*(?:من|عن|ب)?\s*(\d+(?:[.,]\d+)?)" + _NOT_WEIGHT)
+_MIN_PRICE_PATTERN = re.compile(r"(?:اكثر|فوق|اعلي)\s*(?:من)?\s*(\d+(?:[.,]\d+)?)" + _NOT_WEIGHT)
+_RANGE_PATTERN = re.compile(r"بين\s*(\d+(?:[.,]\d+)?)\s*(?:و|-|الي)\s*(\d+(?:[.,]\d+)?)" + _NOT_WEIGHT)
+_MAX_WEIGHT_PATTERN = re.compile(r"(?:اقل|تحت|لا يتجاوز|ما يتجاوز|حتي)\s*(?:من|عن)?\s*(\d+(?:[.,]\d+)?)\s*(?:جرام|غرام|جم)")
+_MIN_WEIGHT_PATTERN = re.compile(r"(?:اكثر|فوق|اثقل)\s*(?:من)?\s*(\d+(?:[.,]\d+)?)\s*(?:جرام|غرام|جم)")
+_PRICE_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:ريال|ر\.?س|درهم|دينار)")
+
+
+def normalize_arabic(text: str) -> str:
+    """Normalize Arabic text: strip diacritics/tatweel, unify alef, ya and ta marbuta, ASCII digits"""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text)
+    text = text.translate(_ARABIC_DIGITS)
+    text = re.sub("[أإآ]", "ا", text)
+    text = text.replace("ى", "ي").replace("ة", "ه")
+    return text.lower().strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text into word tokens"""
+    return re.findall(r"[\w]+", normalize_arabic(text))
+
+
+def _normalized_vocab(terms: Dict[str, str]) -> Dict[str, str]:
+    return {normalize_arabic(surface): canonical for surface, canonical in terms.items()}
+
+
+_CATEGORY_VOCAB = _normalized_vocab(CATEGORY_TERMS)
+_MATERIAL_VOCAB = _normalized_vocab(MATERIAL_TERMS)
+_STYLE_VOCAB = _normalized_vocab(STYLE_TERMS)
+_OCCASION_VOCAB = _normalized_vocab(OCCASION_TERMS)
+_CONTEXTUAL_OCCASION_VOCAB = _normalized_vocab(CONTEXTUAL_OCCASION_TERMS)
+_VAGUE_VOCAB = {normalize_arabic(term) for term in VAGUE_TERMS}
+_INTENT_VOCAB = {normalize_arabic(term) for term in INTENT_TERMS}
+_FILLER_VOCAB = {normalize_arabic(term) for term in FILLER_TERMS}
+_FACET_VOCABS = [("category", _CATEGORY_VOCAB), ("material", _MATERIAL_VOCAB), ("style", _STYLE_VOCAB), ("occasion", _OCCASION_VOCAB)]
+# Words of the price/weight/karat patterns ("اقل من 2000 ريال", "عيار 21"). Negation and
+# question words ("لا", "ما") are left out even though "لا يتجاوز" is a price pattern:
+# "لا أريد ذهب" or "ما عيار الذهب؟" must not pass as a search
+_CONSTRAINT_VOCAB = {normalize_arabic(term) for term in [
+    "عيار", "عياره", "قيراط", "ق", "ريال", "ر", "س", "درهم", "دينار", "جرام", "غرام", "جم",
+    "أقل", "تحت", "حدود", "بحدود", "يتجاوز", "ميزانية", "ميزانيتي", "إلى", "حتى",
+    "أكثر", "فوق", "أعلى", "أثقل", "بين", "و", "ب"
+]}
+
+
+def token_variants(token: str) -> List[str]:
+    """Return the token plus versions with common clitic prefixes removed"""
+    variants = [token]
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            variants.append(token[len(prefix):])
+    return variants
+
+
+def match_term(tokens: List[str], vocab: Dict[str, str]) -> Optional[str]:
+    """Return the canonical value of the first token found in the vocabulary"""
+    for token in tokens:
+        for variant in token_variants(token):
+            if variant in vocab:
+                return vocab[variant]
+    return None
+
+
+def _to_number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def parse_query(text: str) -> Dict:
+    """Extract category, material, style, occasion, karat, price and weight constraints from a query"""
+    normalized = normalize_arabic(text)
+    tokens = tokenize(text)
+
+    constraints = {
+        "category": match_term(tokens, _CATEGORY_VOCAB),
+        "material": match_term(tokens, _MATERIAL_VOCAB),
+        "style": match_term(tokens, _STYLE_VOCAB),
+        "occasion": match_term(tokens, _OCCASION_VOCAB),
+        "karat": None,
+        "min_price": None,
+        "max_price": None,
+        "min_weight": None,
+        "max_weight": None,
+        "vague": any(variant in _VAGUE_VOCAB for token in tokens for variant in token_variants(token))
+    }
+    if constraints["category"] and not constraints["occasion"]:
+        constraints["occasion"] = match_term(tokens, _CONTEXTUAL_OCCASION_VOCAB)
+
+    karat_match = _KARAT_PATTERN.search(normalized)
+    if karat_match:
+        constraints["karat"] = f"{karat_match.group(1) or karat_match.group(2)} قيراط"
+    elif constraints["material"] == "فضة":
+        silver_match = _SILVER_KARAT_PATTERN.search(normalized)
+        if silver_match:
+            constraints["karat"] = f"فضة {silver_match.group(1)}"
+
+    range_match = _RANGE_PATTERN.search(normalized)
+    if range_match:
+        low, high = sorted([_to_number(range_match.group(1)), _to_number(range_match.group(2))])
+        constraints["min_price"], constraints["max_price"] = low, high
+    else:
+        max_match = _MAX_PRICE_PATTERN.search(normalized)
+        min_match = _MIN_PRICE_PATTERN.search(normalized)
+        if max_match:
+            constraints["max_price"] = _to_number(max_match.group(1))
+        if min_match:
+            constraints["min_price"] = _to_number(min_match.group(1))
+        if not max_match and not min_match:
+            # A bare amount in currency ("بـ 2000 ريال") is treated as the budget
+            price_match = _PRICE_PATTERN.search(normalized)
+            if price_match:
+                constraints["max_price"] = _to_number(price_match.group(1))
+
+    max_weight_match = _MAX_WEIGHT_PATTERN.search(normalized)
+    if max_weight_match:
+        constraints["max_weight"] = _to_number(max_weight_match.group(1))
+    min_weight_match = _MIN_WEIGHT_PATTERN.search(normalized)
+    if min_weight_match:
+        constraints["min_weight"] = _to_number(min_weight_match.group(1))
+
+    # Karat numbers must not be mistaken for prices
+    for key in ["min_price", "max_price"]:
+        if constraints[key] is not None and constraints["karat"] and constraints[key] in (18, 21, 22, 24, 925, 999):
+            constraints[key] = None
+
+    return constraints
+
+
+def has_detail(constraints: Dict) -> bool:
+    """True when the query has at least one detail beyond the jewelry type"""
+    return any(constraints.get(key) for key in ["material", "style", "occasion", "karat", "min_price", "max_price", "min_weight", "max_weight"])
+
+
+def is_product_query(text: str) -> bool:
+    """True when the message names a jewelry facet or asks to see products"""
+    tokens = tokenize(text)
+    constraints = parse_query(text)
+    if any(constraints.get(key) for key in ["category", "material", "style", "occasion"]):
+        return True
+    return any(variant in _INTENT_VOCAB for token in tokens for variant in token_variants(token))
+
+
+def unrecognized_tokens(text: str) -> List[str]:
+    """Tokens that are not vocabulary, filler, vague or price/weight/karat words (or numbers)"""
+    known = [_FILLER_VOCAB, _VAGUE_VOCAB, _CONSTRAINT_VOCAB] + [vocab for _, vocab in _FACET_VOCABS]
+    return [
+        token for token in tokenize(text)
+        if not any(variant.isdigit() or any(variant in vocab for vocab in known) for variant in token_variants(token))
+    ]
+
+
+def canonical_phrase(text: str) -> Optional[str]:
+    """
+    Canonical form of a query made only of vocabulary terms and filler words:
+    one facet ("ذهب") or a type plus one facet ("خاتم ذهب"); None otherwise
+    """
+    facets = {}
+    for token in tokenize(text):
+        variants = token_variants(token)
+        for kind, vocab in _FACET_VOCABS:
+            value = next((vocab[variant] for variant in variants if variant in vocab), None)
+            if value:
+                if facets.get(kind, value) != value:
+                    return None
+                facets[kind] = value
+                break
+        else:
+            if not any(variant in _FILLER_VOCAB for variant in variants):
+                return None  # A word outside the vocabulary changes the meaning
+
+    others = [facets[kind] for kind in ["material", "style", "occasion"] if kind in facets]
+    if "category" in facets and len(others) <= 1:
+        return " ".join([CATEGORY_SINGULAR[facets["category"]]] + others)
+    if "category" not in facets and len(others) == 1:
+        return others[0]
+    return None
+
+
+def surface_forms(canonical: str) -> List[str]:
+    """All vocabulary words that map to a canonical value"""
+    forms = []
+    for terms in [CATEGORY_TERMS, MATERIAL_TERMS, STYLE_TERMS, OCCASION_TERMS]:
+        forms.extend(surface for surface, value in terms.items() if value == canonical and surface not in forms)
+    return forms
+
+
+def expand_query_terms(text: str) -> str:
+    """Append the synonyms of the first vocabulary term in the query (for keyword retrieval)"""
+    tokens = tokenize(text)
+    for _, vocab in _FACET_VOCABS:
+        value = match_term(tokens, vocab)
+        if value:
+            return f"{text} {' '.join(surface_forms(value))}"
+    return text
@@ -0,0 +1,99 @@
+"""
+Process-wide deduplication of identical in-flight requests
+When several sessions ask for the same embedding, search, verification or
+image description at the same time, the first caller makes the upstream call
+and the others wait for it and share its result (or its exception). Nothing
+is cached: once the call finishes, the next identical request runs again.
+Shared results must be treated as read-only by the callers
+"""
+
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Hashable
+import numpy as np
+
+
+class _Call:
+    """One in-flight upstream call and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Upstream calls made and calls answered by joining an in-flight one"""
+        with self.lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self.calls)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(kind: str) -> SingleFlight:
+    """The process-wide group for one kind of request ("embedding", "search", ...)"""
+    with _groups_lock:
+        if kind not in _groups:
+            _groups[kind] = SingleFlight()
+        return _groups[kind]
+
+
+def singleflight(kind: str, key: Hashable, fn: Callable[[], Any]) -> Any:
+    """Run fn, or wait for the identical request of this kind that is already running"""
+    return get_group(kind).do(key, fn)
+
+
+def text_key(text: str) -> str:
+    """Whitespace-normalized text, so trivially different spellings share a call"""
+    return " ".join(str(text or "").split())
+
+
+def vector_key(vector) -> str:
+    """Digest of a float32 vector"""
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        groups = dict(_groups)
+    return {kind: group.stats() for kind, group in groups.items()}
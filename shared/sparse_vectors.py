@@ -0,0 +1,196 @@
+"""
+Sparse lexical vectors for hybrid sparse-dense search
+Product text is tokenized with the shared Arabic normalizer and encoded as
+BM25 term-frequency weights over a persisted vocabulary; queries carry the
+IDF weights. Both are stored/queried in Pinecone next to the dense embedding,
+so keyword matching needs no in-process BM25 index or catalog fetch.
+IDF lives only on the query side, so document vectors stay valid as the
+vocabulary grows
+
+Run `python -m shared.sparse_vectors` to rebuild the vocabulary from the
+catalog snapshot and attach sparse vectors to every product in Pinecone
+"""
+
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from .config import SPARSE_VOCAB_PATH, SPARSE_BM25_K1, SPARSE_BM25_B, HYBRID_ALPHA, HYBRID_SEARCH_ENABLED, index_metric
+from .query_parser import FILLER_TERMS, normalize_arabic, tokenize
+
+_STOPWORDS = {normalize_arabic(term) for term in FILLER_TERMS + ["مع", "على", "الى", "إلى", "او", "أو", "ذات", "ذو", "هذا", "هذه"]}
+# Definite-article clitics only: single-letter prefixes are too often part of the word (لؤلؤ)
+_ARTICLE_PREFIXES = ["وبال", "وال", "بال", "فال", "كال", "لل", "ال"]
+
+
+def _stem(token: str) -> str:
+    for prefix in _ARTICLE_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def lexical_tokens(text: str) -> List[str]:
+    """Normalized tokens with the definite article stripped and filler words dropped"""
+    tokens = []
+    for token in tokenize(text):
+        if token in _STOPWORDS:
+            continue
+        stem = _stem(token)
+        if len(stem) >= 2 or stem.isdigit():
+            tokens.append(stem)
+    return tokens
+
+
+def product_lexical_text(metadata: Dict) -> str:
+    """The product fields covered by keyword matching"""
+    fields = ["name", "category", "karat", "design", "style", "description"]
+    return " ".join(str(metadata.get(field) or "") for field in fields)
+
+
+def _unit(weights: Dict[int, float]) -> Dict[str, List]:
+    """Pinecone sparse vector with unit L2 norm (sparse scores stay in [0, 1])"""
+    norm = math.sqrt(sum(value * value for value in weights.values())) or 1.0
+    indices = sorted(weights)
+    return {"indices": indices, "values": [weights[index] / norm for index in indices]}
+
+
+class SparseVocabulary:
+    """Token IDs, document frequencies and average length, persisted as JSON"""
+
+    def __init__(self, path: str = SPARSE_VOCAB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.token_ids: Dict[str, int] = {}
+        self.document_frequency: List[int] = []
+        self.documents = 0
+        self.total_length = 0
+        self._mtime = None
+        self.refresh()
+
+    def refresh(self):
+        """Reload when another process has updated the table"""
+        if not os.path.exists(self.path) or os.path.getmtime(self.path) == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.token_ids = {token: index for index, token in enumerate(data["tokens"])}
+        self.document_frequency = data["document_frequency"]
+        self.documents = data["documents"]
+        self.total_length = data["total_length"]
+        self._mtime = os.path.getmtime(self.path)
+
+    def save(self):
+        data = {
+            "tokens": sorted(self.token_ids, key=self.token_ids.get),
+            "document_frequency": self.document_frequency,
+            "documents": self.documents,
+            "total_length": self.total_length
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def add_document(self, tokens: List[str]):
+        for token in set(tokens):
+            if token not in self.token_ids:
+                self.token_ids[token] = len(self.document_frequency)
+                self.document_frequency.append(0)
+            self.document_frequency[self.token_ids[token]] += 1
+        self.documents += 1
+        self.total_length += len(tokens)
+
+    def idf(self, token_id: int) -> float:
+        frequency = self.document_frequency[token_id]
+        return math.log(1 + (self.documents - frequency + 0.5) / (frequency + 0.5))
+
+    def encode_document(self, text: str, update: bool = True) -> Dict[str, List]:
+        """BM25 term-frequency weights of a product (added to the vocabulary when update is set)"""
+        tokens = lexical_tokens(text)
+        with self.lock:
+            self.refresh()
+            if update:
+                self.add_document(tokens)
+                self.save()
+            average_length = self.total_length / self.documents if self.documents else len(tokens) or 1
+            length_norm = 1 - SPARSE_BM25_B + SPARSE_BM25_B * len(tokens) / average_length
+            weights = {}
+            for token, count in Counter(tokens).items():
+                if token in self.token_ids:
+                    weights[self.token_ids[token]] = count * (SPARSE_BM25_K1 + 1) / (count + SPARSE_BM25_K1 * length_norm)
+        return _unit(weights)
+
+    def encode_query(self, text: str) -> Dict[str, List]:
+        """IDF weights of the query tokens known to the vocabulary"""
+        with self.lock:
+            self.refresh()
+            weights = {
+                self.token_ids[token]: self.idf(self.token_ids[token])
+                for token in set(lexical_tokens(text))
+                if token in self.token_ids
+            }
+        return _unit(weights)
+
+
+_vocabulary: Optional[SparseVocabulary] = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_sparse_vocabulary() -> SparseVocabulary:
+    global _vocabulary
+    if _vocabulary is None:
+        with _vocabulary_lock:
+            if _vocabulary is None:
+                _vocabulary = SparseVocabulary()
+    return _vocabulary
+
+
+def supports_sparse(index) -> bool:
+    """Hybrid search is on and the index accepts sparse values (dotproduct only; legacy cosine indexes reject them)"""
+    return HYBRID_SEARCH_ENABLED and index_metric(index) == "dotproduct"
+
+
+def encode_product(metadata: Dict) -> Dict[str, List]:
+    """Sparse vector for a new product (updates the persisted vocabulary)"""
+    return get_sparse_vocabulary().encode_document(product_lexical_text(metadata))
+
+
+def encode_query(text: str) -> Dict[str, List]:
+    return get_sparse_vocabulary().encode_query(text)
+
+
+def hybrid_scale(dense: List[float], sparse: Dict[str, List], alpha: float = HYBRID_ALPHA):
+    """Convex combination weights: alpha * dense + (1 - alpha) * sparse"""
+    scaled_sparse = {"indices": sparse["indices"], "values": [value * (1 - alpha) for value in sparse["values"]]}
+    return (np.asarray(dense, dtype=np.float64) * alpha).tolist(), scaled_sparse
+
+
+def rebuild_vocabulary(products, path: str = SPARSE_VOCAB_PATH) -> Dict[str, Dict[str, List]]:
+    """Fresh vocabulary from (id, metadata) pairs; returns each product's sparse vector"""
+    vocabulary = SparseVocabulary(path)
+    vocabulary.token_ids, vocabulary.document_frequency = {}, []
+    vocabulary.documents = vocabulary.total_length = 0
+    texts = {product_id: product_lexical_text(metadata) for product_id, metadata in products}
+    for text in texts.values():
+        vocabulary.add_document(lexical_tokens(text))
+    vocabulary.save()
+    return {product_id: vocabulary.encode_document(text, update=False) for product_id, text in texts.items()}
+
+
+if __name__ == "__main__":
+    from .catalog_snapshot import get_catalog_snapshot
+    from .config import init_apis
+
+    _, pinecone_index = init_apis()
+    if not supports_sparse(pinecone_index):
+        raise SystemExit("Sparse vectors need HYBRID_SEARCH_ENABLED and a dotproduct index (e.g. the v2 index)")
+    sparse_vectors = rebuild_vocabulary(get_catalog_snapshot(pinecone_index).products())
+    for product_id, sparse in sparse_vectors.items():
+        if sparse["indices"]:
+            pinecone_index.update(id=product_id, sparse_values=sparse)
+    print(f"Attached sparse vectors to {len(sparse_vectors)} products ({SPARSE_VOCAB_PATH})")
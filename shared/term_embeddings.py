@@ -0,0 +1,135 @@
+"""
+Precomputed embeddings for the canonical query vocabulary
+Every canonical term and every type + facet combination ("خاتم ذهب",
+"عقد بسيط") is embedded once and saved as a versioned table. Queries that
+normalize to a known phrase get their vector without a network call, and the
+per-category centroids detect the jewelry type of any query embedding
+
+Run `python -m shared.term_embeddings` to (re)build the table
+"""
+
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import EMBEDDING_MODEL, EMBEDDING_DIMENSION, TERM_EMBEDDINGS_PATH, CATEGORY_CENTROID_MIN_SCORE
+from .query_parser import (
+    CATEGORY_SINGULAR, MATERIAL_TERMS, STYLE_TERMS, OCCASION_TERMS, canonical_phrase
+)
+
+
+def vocabulary_phrases() -> List[Tuple[str, Optional[str]]]:
+    """(phrase, category) for every canonical term and type + facet combination"""
+    facets = []
+    for terms in [MATERIAL_TERMS, STYLE_TERMS, OCCASION_TERMS]:
+        facets.extend(value for value in dict.fromkeys(terms.values()) if value not in facets)
+
+    phrases = [(facet, None) for facet in facets]
+    for category, singular in CATEGORY_SINGULAR.items():
+        phrases.append((singular, category))
+        phrases.extend((f"{singular} {facet}", category) for facet in facets)
+    return phrases
+
+
+def table_version(phrases: List[str]) -> str:
+    """Changes whenever the model, dimension or vocabulary changes"""
+    payload = "\n".join([EMBEDDING_MODEL, str(EMBEDDING_DIMENSION)] + phrases)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TermEmbeddings:
+    """Loaded embedding table with phrase lookup and category centroids"""
+
+    def __init__(self, phrases: List[str], categories: List[str], vectors: np.ndarray):
+        self.vectors = vectors.astype(np.float32)
+        self.row_by_phrase = {phrase: row for row, phrase in enumerate(phrases)}
+
+        self.centroid_categories: List[str] = []
+        centroids = []
+        for category in dict.fromkeys(c for c in categories if c):
+            rows = [row for row, c in enumerate(categories) if c == category]
+            centroid = self.vectors[rows].mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            self.centroid_categories.append(category)
+        self.centroids = np.vstack(centroids) if centroids else np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+
+    def lookup(self, text: str) -> Optional[List[float]]:
+        phrase = canonical_phrase(text)
+        if phrase is None or phrase not in self.row_by_phrase:
+            return None
+        return self.vectors[self.row_by_phrase[phrase]].tolist()
+
+    def detect_category(self, embedding) -> Tuple[Optional[str], float]:
+        """Nearest category centroid and its cosine similarity"""
+        if not len(self.centroids) or embedding is None:
+            return None, 0.0
+        vector = np.asarray(embedding, dtype=np.float32)
+        scores = self.centroids @ (vector / (np.linalg.norm(vector) or 1.0))
+        best = int(np.argmax(scores))
+        return self.centroid_categories[best], float(scores[best])
+
+
+def build_table(path: str = TERM_EMBEDDINGS_PATH) -> int:
+    """Embed the whole vocabulary in one request and save the versioned table"""
+    from .llm_client import create_embedding
+
+    entries = vocabulary_phrases()
+    phrases = [phrase for phrase, _ in entries]
+    response = create_embedding(model=EMBEDDING_MODEL, input=phrases)
+    vectors = np.array([item.embedding for item in sorted(response.data, key=lambda item: item.index)], dtype=np.float32)
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        phrases=np.array(phrases),
+        categories=np.array([category or "" for _, category in entries]),
+        vectors=vectors,
+        version=np.array(table_version(phrases))
+    )
+    os.replace(tmp_path, path)
+    return len(phrases)
+
+
+_table: Optional[TermEmbeddings] = None
+_table_loaded = False
+_table_lock = threading.Lock()
+
+
+def get_term_embeddings() -> Optional[TermEmbeddings]:
+    """Load the table once; None when it is missing or built for another model/vocabulary"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        with _table_lock:
+            if not _table_loaded:
+                _table_loaded = True
+                if os.path.exists(TERM_EMBEDDINGS_PATH):
+                    data = np.load(TERM_EMBEDDINGS_PATH)
+                    phrases = [str(phrase) for phrase in data["phrases"]]
+                    if str(data["version"]) == table_version([phrase for phrase, _ in vocabulary_phrases()]):
+                        _table = TermEmbeddings(phrases, [str(c) for c in data["categories"]], data["vectors"])
+                    else:
+                        print(f"[term_embeddings] {TERM_EMBEDDINGS_PATH} is stale; run python -m shared.term_embeddings")
+    return _table
+
+
+def lookup_embedding(text: str) -> Optional[List[float]]:
+    """Precomputed vector for a vocabulary-only query, else None"""
+    table = get_term_embeddings()
+    return table.lookup(text) if table else None
+
+
+def detect_category(embedding) -> Optional[str]:
+    """Category whose centroid is close enough to the embedding, else None"""
+    table = get_term_embeddings()
+    if not table:
+        return None
+    category, score = table.detect_category(embedding)
+    return category if score >= CATEGORY_CENTROID_MIN_SCORE else None
+
+
+if __name__ == "__main__":
+    from .config import init_apis
+
+    init_apis()
+    print(f"Embedded {build_table()} vocabulary phrases into {TERM_EMBEDDINGS_PATH}")
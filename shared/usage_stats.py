@@ -0,0 +1,82 @@
+"""
+Token usage tracking for OpenAI calls
+Records prompt, cached and completion tokens per call site so prompt-cache
+hit rates, latency and output failure rates can be checked from the logs
+"""
+
+import threading
+from typing import Dict, Optional
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict] = {}
+
+
+def _new_entry() -> Dict:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "cached_tokens": 0,
+        "completion_tokens": 0,
+        "total_time": 0.0,
+        "failures": 0
+    }
+
+
+def record_usage(label: str, response, elapsed: Optional[float] = None) -> Optional[Dict]:
+    """Record usage metadata of a completion response under the given label"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    with _lock:
+        entry = _stats.setdefault(label, _new_entry())
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["cached_tokens"] += cached_tokens
+        entry["completion_tokens"] += completion_tokens
+        if elapsed is not None:
+            entry["total_time"] += elapsed
+
+    hit_rate = (cached_tokens / prompt_tokens * 100) if prompt_tokens else 0.0
+    timing = f" time={elapsed:.2f}s" if elapsed is not None else ""
+    print(f"[usage] {label}: prompt={prompt_tokens} cached={cached_tokens} ({hit_rate:.0f}%) completion={completion_tokens}{timing}")
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens
+    }
+
+
+def record_failure(label: str, reason: str = ""):
+    """Count a call whose output could not be used (e.g. unparseable JSON)"""
+    with _lock:
+        entry = _stats.setdefault(label, _new_entry())
+        entry["failures"] += 1
+        rate = entry["failures"] / entry["calls"] * 100 if entry["calls"] else 100.0
+    print(f"[usage] {label}: failure {reason} (failure rate {rate:.0f}%)")
+
+
+def get_usage_stats() -> Dict[str, Dict]:
+    """Return a snapshot of the accumulated usage per label"""
+    with _lock:
+        return {label: dict(entry) for label, entry in _stats.items()}
+
+
+def get_cached_token_ratio() -> float:
+    """Return the share of prompt tokens served from the provider cache"""
+    with _lock:
+        prompt_tokens = sum(entry["prompt_tokens"] for entry in _stats.values())
+        cached_tokens = sum(entry["cached_tokens"] for entry in _stats.values())
+    return cached_tokens / prompt_tokens if prompt_tokens else 0.0
+
+
+def reset_usage_stats():
+    """Clear all accumulated usage"""
+    with _lock:
+        _stats.clear()
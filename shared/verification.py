@@ -0,0 +1,73 @@
+"""
+Compact protocol for LLM verification of search results
+Candidates are shown with positional handles (1..N) instead of product IDs and
+the model answers with a strict JSON schema holding the matching handles, so
+the output is a few tokens of schema-valid JSON. Handles are mapped back to the
+results locally
+"""
+
+import json
+from typing import List, Optional
+
+VERIFICATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "verified_products",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "matches": {"type": "array", "items": {"type": "integer"}}
+            },
+            "required": ["matches"],
+            "additionalProperties": False
+        }
+    }
+}
+
+DESCRIPTION_CHARS = 100
+
+
+def build_verification_prompt(query: str, results: list) -> str:
+    """Verification prompt listing the candidates under handles 1..N"""
+    products = []
+    for handle, result in enumerate(results, 1):
+        metadata = result.metadata or {}
+        description = (metadata.get("description") or "")[:DESCRIPTION_CHARS]
+        products.append(f"{handle}. {metadata.get('name', 'N/A')} | {metadata.get('category', 'N/A')} | {description}")
+    products_text = "\n".join(products)
+    return f"""Query: "{query}"
+
+Products:
+{products_text}
+
+Rules:
+- خاتم queries → only خواتم category
+- عقد queries → only عقود category
+- أقراط queries → only أقراط category
+- أساور queries → only أساور category
+
+Return the numbers of the products that match the query in "matches" ([] if none).
+"""
+
+
+def parse_handles(response_text: str, count: int) -> Optional[List[int]]:
+    """Valid handles from the model output in answer order, or None when it does not parse"""
+    try:
+        data = json.loads(response_text)
+    except (TypeError, ValueError):
+        return None
+    handles = data.get("matches") if isinstance(data, dict) else None
+    if not isinstance(handles, list):
+        return None
+    valid = []
+    for handle in handles:
+        if isinstance(handle, int) and 1 <= handle <= count and handle not in valid:
+            valid.append(handle)
+    return valid
+
+
+def select_by_handles(results: list, handles: List[int]) -> list:
+    """Results for the verified handles, in search-score order"""
+    chosen = set(handles)
+    return [result for handle, result in enumerate(results, 1) if handle in chosen]
@@ -0,0 +1,324 @@
+"""
+Optional local visual similarity search
+A CPU image encoder (CLIP-style ONNX model) turns catalog photos and customer
+uploads into image vectors kept in a separate local index, so image search is
+a single in-process nearest-neighbor lookup. Everything here is a no-op when
+onnxruntime or the model file is missing; callers then fall back to the
+description-based search
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from .catalog_snapshot import get_catalog_snapshot
+from .config import (
+    VISUAL_ENCODER_PATH, VISUAL_INDEX_DIR, VISUAL_INPUT_SIZE, VISUAL_MIN_SCORE, VISUAL_TOP_K, VISUAL_COMPACT_MIN_ROWS
+)
+from .embeddings import PreparedImage, to_rgb
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# CLIP preprocessing constants
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+MANIFEST_FILE = "manifest.json"  # Names the current vectors and journal files
+
+
+class VisualMatch:
+    """Search hit with the same attributes as a Pinecone match"""
+
+    def __init__(self, id: str, score: float, metadata: Dict):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+
+class VisualIndex:
+    """
+    Normalized image vectors keyed by product ID (metadata is read from the catalog snapshot)
+    Vectors are appended to a flat float32 file and a JSONL journal records each
+    add (with its row) or removal, so one product costs one append. Compaction
+    writes both files under new names and switches the manifest to them
+    """
+
+    def __init__(self, directory: str = VISUAL_INDEX_DIR):
+        self.directory = directory
+        self.row_by_id: Dict[str, int] = {}
+        self.dimension = 0
+        self.rows = 0  # Rows referenced by the journal, live or replaced
+        self.vectors: Optional[np.ndarray] = None  # mmap of the vectors file
+        self.lock = threading.RLock()
+        self._files = {}
+        self._position = 0
+        self._mtime = None
+        self.load()
+
+    def __len__(self):
+        return len(self.row_by_id)
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self.row_by_id)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        """Read the manifest and replay its journal"""
+        with self.lock:
+            if not os.path.exists(self._path(MANIFEST_FILE)):
+                self._convert_legacy()
+                if not os.path.exists(self._path(MANIFEST_FILE)):
+                    return
+            mtime = os.path.getmtime(self._path(MANIFEST_FILE))
+            with open(self._path(MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._files = {"vectors": manifest["vectors"], "items": manifest["items"]}
+            self.dimension = manifest["dimension"]
+            self.row_by_id = {}
+            self.rows = 0
+            self.vectors = None
+            self._position = 0
+            self._mtime = mtime
+            self._replay()
+
+    def _replay(self):
+        path = self._path(self._files["items"])
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written entry; read it next time
+                self._position += len(line)
+                entry = json.loads(line)
+                if entry["op"] == "add":
+                    self.row_by_id.pop(entry["id"], None)  # Re-added products move to the end
+                    self.row_by_id[entry["id"]] = entry["row"]
+                    self.rows = max(self.rows, entry["row"] + 1)
+                else:
+                    self.row_by_id.pop(entry["id"], None)
+
+    def refresh(self):
+        """Pick up changes by other processes (e.g. the admin app)"""
+        with self.lock:
+            if not os.path.exists(self._path(MANIFEST_FILE)):
+                return
+            if os.path.getmtime(self._path(MANIFEST_FILE)) != self._mtime:
+                self.load()
+            else:
+                self._replay()
+
+    def _convert_legacy(self):
+        """Rewrite an index saved as vectors.npy + items.json in the journal format"""
+        vectors_path, items_path = self._path("vectors.npy"), self._path("items.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(items_path)):
+            return
+        with open(items_path, encoding="utf-8") as f:
+            ids = [item["id"] for item in json.load(f)]
+        vectors = np.load(vectors_path)
+        if len(vectors) == len(ids) and len(vectors):
+            self._checkpoint(ids, vectors.astype(np.float32))
+            os.remove(vectors_path)
+            os.remove(items_path)
+
+    def _checkpoint(self, ids: List[str], vectors: np.ndarray):
+        """Write live rows under new file names, then switch the manifest to them"""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = time.time_ns()
+        files = {"vectors": f"vectors-{generation}.f32", "items": f"items-{generation}.jsonl"}
+        with open(self._path(files["vectors"]), "wb") as f:
+            f.write(vectors.tobytes())
+        with open(self._path(files["items"]), "w", encoding="utf-8") as f:
+            for row, product_id in enumerate(ids):
+                f.write(json.dumps({"op": "add", "id": product_id, "row": row}, ensure_ascii=False) + "\n")
+        with open(self._path(f"{MANIFEST_FILE}.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"dimension": int(vectors.shape[1]), **files}, f)
+        os.replace(self._path(f"{MANIFEST_FILE}.tmp"), self._path(MANIFEST_FILE))
+        # Readers may still be on the previous files
+        keep = set(files.values()) | set(self._files.values())
+        for name in os.listdir(self.directory):
+            if name.startswith(("vectors-", "items-")) and name not in keep:
+                os.remove(self._path(name))
+        self.load()
+
+    def _journal(self, entry: Dict):
+        with open(self._path(self._files["items"]), "ab") as f:
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def _mapped_vectors(self) -> np.ndarray:
+        """Vectors file, remapped when the journal references rows past the mapping"""
+        if self.vectors is None or len(self.vectors) < self.rows:
+            path = self._path(self._files["vectors"])
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, self.dimension)
+        return self.vectors
+
+    def add(self, product_id: str, vector: np.ndarray):
+        """Insert or replace the vector of a product (appends one row and one journal entry)"""
+        vector = vector.astype(np.float32).reshape(-1)
+        with self.lock:
+            self.refresh()  # Build on the latest saved state, not a stale copy
+            if not self._files:
+                self._checkpoint([], np.zeros((0, len(vector)), dtype=np.float32))
+            row = self.rows
+            row_bytes = row * self.dimension * 4
+            with open(self._path(self._files["vectors"]), "ab") as f:
+                if f.tell() != row_bytes:
+                    self.vectors = None  # Rows of an add that never reached the journal
+                    f.truncate(row_bytes)
+                f.write(vector.tobytes())
+            self._journal({"op": "add", "id": product_id, "row": row})
+            self._replay()
+            self._maintain()
+
+    def remove(self, product_id: str):
+        with self.lock:
+            self.refresh()
+            if product_id not in self.row_by_id:
+                return
+            self._journal({"op": "remove", "id": product_id})
+            self._replay()
+            self._maintain()
+
+    def _maintain(self):
+        """Compact once replaced and removed rows outnumber the live ones"""
+        if self.rows - len(self.row_by_id) > max(len(self.row_by_id), VISUAL_COMPACT_MIN_ROWS):
+            self.compact()
+
+    def compact(self):
+        with self.lock:
+            ids = self.ids
+            rows = [self.row_by_id[product_id] for product_id in ids]
+            vectors = np.array(self._mapped_vectors()[rows]) if rows else np.zeros((0, self.dimension), dtype=np.float32)
+            self._checkpoint(ids, vectors)
+
+    def search(self, vector: np.ndarray, top_k: int = VISUAL_TOP_K, min_score: float = VISUAL_MIN_SCORE) -> List[Tuple[str, float]]:
+        """(product_id, cosine score) pairs, best first (vectors are normalized, so a dot product)"""
+        with self.lock:
+            if not self.row_by_id:
+                return []
+            ids = self.ids
+            scores = self._mapped_vectors()[[self.row_by_id[product_id] for product_id in ids]] @ vector.astype(np.float32)
+            top = np.argsort(-scores)[:top_k]
+            return [(ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+_encoder = None
+_visual_index: Optional[VisualIndex] = None
+_init_lock = threading.Lock()
+
+
+def get_image_encoder():
+    """Load the ONNX image encoder once; None when it is not installed"""
+    global _encoder
+    if _encoder is None and onnxruntime is not None and os.path.exists(VISUAL_ENCODER_PATH):
+        with _init_lock:
+            if _encoder is None:
+                _encoder = onnxruntime.InferenceSession(VISUAL_ENCODER_PATH, providers=["CPUExecutionProvider"])
+    return _encoder
+
+
+def get_visual_index() -> VisualIndex:
+    """Return the process-wide visual index, reloaded after changes by other processes"""
+    global _visual_index
+    if _visual_index is None:
+        with _init_lock:
+            if _visual_index is None:
+                _visual_index = VisualIndex()
+    _visual_index.refresh()
+    return _visual_index
+
+
+def visual_search_enabled() -> bool:
+    return get_image_encoder() is not None
+
+
+def _preprocess(image) -> np.ndarray:
+    """Resize shortest side, center crop and normalize to a 1x3xHxW CLIP input"""
+    if isinstance(image, PreparedImage):
+        image = image.image
+    image = to_rgb(image)
+
+    scale = VISUAL_INPUT_SIZE / min(image.size)
+    width, height = round(image.size[0] * scale), round(image.size[1] * scale)
+    image = image.resize((width, height), Image.Resampling.BICUBIC)
+    left, top = (width - VISUAL_INPUT_SIZE) // 2, (height - VISUAL_INPUT_SIZE) // 2
+    image = image.crop((left, top, left + VISUAL_INPUT_SIZE, top + VISUAL_INPUT_SIZE))
+
+    pixels = (np.asarray(image, dtype=np.float32) / 255.0 - CLIP_MEAN) / CLIP_STD
+    return pixels.transpose(2, 0, 1)[np.newaxis, :]
+
+
+def encode_image(image) -> Optional[np.ndarray]:
+    """Normalized image vector, or None when visual search is disabled"""
+    encoder = get_image_encoder()
+    if encoder is None:
+        return None
+    input_name = encoder.get_inputs()[0].name
+    vector = encoder.run(None, {input_name: _preprocess(image)})[0][0].astype(np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def index_product_image(product_id: str, image) -> bool:
+    """Add a catalog photo to the visual index at ingest time"""
+    vector = encode_image(image)
+    if vector is None:
+        return False
+    get_visual_index().add(product_id, vector)
+    return True
+
+
+def remove_product_image(product_id: str):
+    if os.path.exists(VISUAL_INDEX_DIR):
+        get_visual_index().remove(product_id)
+
+
+def search_similar_images(image, top_k: int = VISUAL_TOP_K, min_score: float = VISUAL_MIN_SCORE) -> Optional[List[VisualMatch]]:
+    """
+    Find visually similar catalog products in-process, with current metadata from the snapshot
+    Returns None when visual search is unavailable (callers fall back to text search)
+    """
+    if not visual_search_enabled() or not len(get_visual_index()):
+        return None
+    snapshot = get_catalog_snapshot()
+    if snapshot.loaded_at is None:
+        return None
+    matches = []
+    for product_id, score in get_visual_index().search(encode_image(image), top_k, min_score):
+        metadata = snapshot.get(product_id)
+        if metadata is not None:  # Deleted from the catalog
+            matches.append(VisualMatch(product_id, score, metadata))
+    return matches
+
+
+def rebuild_visual_index(index) -> int:
+    """Encode every catalog photo from the local image store (one-off backfill)"""
+    from .database import get_all_products
+    from .image_store import has_image, load_image
+
+    count = 0
+    for product in get_all_products(index, limit=10000):
+        image_key = product.metadata.get("image_key")
+        if image_key and has_image(image_key):
+            if index_product_image(product.id, load_image(image_key, "large")):
+                count += 1
+    return count
+
+
+if __name__ == "__main__":
+    from .config import init_apis
+
+    if not visual_search_enabled():
+        print(f"Visual search disabled: install onnxruntime and place the encoder at {VISUAL_ENCODER_PATH}")
+    else:
+        _, pinecone_index = init_apis()
+        print(f"Indexed {rebuild_visual_index(pinecone_index)} product images")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test the local HNSW index: search, tombstoned deletes, compaction and journal replay
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import shared.ann_index as ann_module
+from shared.ann_index import LocalANNIndex
+
+DIMENSION = 16
+
+def _vector(position, noise=0.0):
+    vector = np.zeros(DIMENSION, dtype=np.float32)
+    vector[position] = 1.0
+    vector[(position + 1) % DIMENSION] = noise
+    return vector
+
+def _index(directory=None):
+    ann_index = LocalANNIndex(directory or tempfile.mkdtemp(), DIMENSION, m=8, ef_construction=40, ef_search=16)
+    ann_index.build((f"p{i}", _vector(i)) for i in range(DIMENSION))
+    return ann_index
+
+def test_search():
+    print("🧪 Testing HNSW search")
+    ann_index = _index()
+    results = ann_index.search(_vector(3, noise=0.1), top_k=3)
+    assert results[0][0] == "p3"
+    assert results[0][1] > 0.99
+    assert [pid for pid, _ in ann_index.search(_vector(3), top_k=3, min_score=0.5)] == ["p3"]
+    print("✅ Nearest product found first")
+
+def test_delete_and_replace():
+    print("🧪 Testing tombstoned deletes and re-inserts")
+    ann_index = _index()
+    ann_index.delete("p3")
+    assert "p3" not in [pid for pid, _ in ann_index.search(_vector(3), top_k=5)]
+    assert len(ann_index) == DIMENSION - 1
+
+    ann_index.add("p4", _vector(5))  # Replace p4's vector
+    top = [pid for pid, _ in ann_index.search(_vector(5), top_k=2)]
+    assert set(top) == {"p4", "p5"}
+    assert "p4" not in [pid for pid, _ in ann_index.search(_vector(4), top_k=1, min_score=0.5)]
+    print("✅ Deleted products are skipped and replaced vectors are searched")
+
+def test_compact():
+    print("🧪 Testing compaction")
+    ann_index = _index()
+    for i in range(5):
+        ann_index.delete(f"p{i}")
+    # The tombstone ratio crossed the threshold after the fourth delete
+    assert len(ann_index.deleted) == 1
+    assert len(ann_index.labels) == DIMENSION - 4
+    assert len(ann_index) == DIMENSION - 5
+    assert ann_index.search(_vector(7), top_k=1)[0][0] == "p7"
+    print("✅ Tombstones removed from the graph")
+
+def test_quantized_storage():
+    print("🧪 Testing quantized storage with exact re-scoring")
+    for storage in ["flat", "int8"]:
+        ann_index = LocalANNIndex(tempfile.mkdtemp(), DIMENSION, m=8, ef_construction=40, ef_search=16, storage=storage)
+        ann_index.build((f"p{i}", _vector(i, noise=0.5)) for i in range(DIMENSION))
+        product_id, score = ann_index.search(_vector(3, noise=0.5), top_k=1)[0]
+        assert product_id == "p3" and abs(score - 1.0) < 1e-5
+    assert ann_index.code_size() == DIMENSION  # One byte per dimension
+
+    # Too few vectors to train PQ codebooks: falls back to int8 and remembers it
+    directory = tempfile.mkdtemp()
+    ann_index = LocalANNIndex(directory, DIMENSION, m=8, ef_construction=40, ef_search=16, storage="pq")
+    ann_index.build((f"p{i}", _vector(i)) for i in range(DIMENSION))
+    assert ann_index.storage == "int8"
+    assert LocalANNIndex(directory, DIMENSION, storage="pq").storage == "int8"
+
+    # PQ code scan (training threshold lowered for a small test catalog)
+    min_training = ann_module.ANN_PQ_MIN_TRAINING
+    ann_module.ANN_PQ_MIN_TRAINING = 256
+    try:
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(300, DIMENSION)).astype(np.float32)
+        ann_index = LocalANNIndex(tempfile.mkdtemp(), DIMENSION, storage="pq")
+        ann_index.build((f"v{i}", vector) for i, vector in enumerate(vectors))
+        assert ann_index.storage == "pq" and ann_index.code_size() == DIMENSION // 4
+        product_id, score = ann_index.search(vectors[42], top_k=1)[0]
+        assert product_id == "v42" and abs(score - 1.0) < 1e-5
+        ann_index.delete("v42")
+        assert "v42" not in [pid for pid, _ in ann_index.search(vectors[42], top_k=5)]
+    finally:
+        ann_module.ANN_PQ_MIN_TRAINING = min_training
+    print("✅ Quantized first pass, full-precision scores")
+
+def test_persistence_and_journal():
+    print("🧪 Testing persistence and journal replay")
+    directory = tempfile.mkdtemp()
+    writer = _index(directory)
+    reader = LocalANNIndex(directory, DIMENSION, m=8, ef_construction=40, ef_search=16)
+    assert reader.search(_vector(2), top_k=1)[0][0] == "p2"
+
+    writer.delete("p2")
+    writer.add("new", _vector(2))
+    reader.refresh()
+    assert reader.search(_vector(2), top_k=1)[0][0] == "new"
+    assert "p2" not in reader.label_by_id
+
+    writer.save()  # Checkpoint; the reader reloads the graph
+    reader.refresh()
+    assert reader.search(_vector(2), top_k=1)[0][0] == "new"
+    assert len(reader) == len(writer)
+    print("✅ Other processes see inserts and deletes")
+
+def test_vector_rows_match_labels():
+    print("🧪 Testing vector rows after an interrupted add and a rebuild")
+    directory = tempfile.mkdtemp()
+    writer = _index(directory)
+    reader = LocalANNIndex(directory, DIMENSION)
+    # An add that wrote its row but never reached the journal leaves an orphan row
+    with open(os.path.join(directory, writer._files["vectors"]), "ab") as f:
+        f.write(ann_module._normalize(_vector(9)).tobytes())
+    writer.add("new", _vector(5, noise=0.5))
+    reader.refresh()
+    label = reader.label_by_id["new"]
+    assert np.allclose(reader._full_vectors(label + 1)[label], ann_module._normalize(_vector(5, noise=0.5)))
+
+    # A rebuild publishes graph, labels and vectors together; the reader keeps its checkpoint until refresh
+    old_files = dict(reader._files)
+    writer.build((f"q{i}", _vector(DIMENSION - 1 - i)) for i in range(DIMENSION))
+    assert os.path.exists(os.path.join(directory, old_files["vectors"]))
+    reader.refresh()
+    assert reader._files["vectors"] != old_files["vectors"]
+    assert reader.search(_vector(0), top_k=1)[0][0] == f"q{DIMENSION - 1}"
+    print("✅ Row number equals the faiss label")
+
+def test_ann_search_needs_snapshot():
+    print("🧪 Testing hydrated search without a loaded snapshot")
+    from shared.catalog_snapshot import CatalogSnapshot, write_snapshot
+    ann_index = _index()
+    unloaded = CatalogSnapshot(tempfile.mkdtemp())
+    directory = tempfile.mkdtemp()
+    write_snapshot([("p3", {"name": "خاتم", "category": "خواتم"}, None)], directory)
+    loaded = CatalogSnapshot(directory)
+
+    get_ann_index, get_catalog_snapshot = ann_module.get_ann_index, ann_module.get_catalog_snapshot
+    ann_module.get_ann_index = lambda: ann_index
+    try:
+        ann_module.get_catalog_snapshot = lambda: unloaded
+        assert ann_module.ann_search(_vector(3), top_k=3) is None
+        ann_module.get_catalog_snapshot = lambda: loaded
+        matches = ann_module.ann_search(_vector(3, noise=0.1), top_k=3, min_score=0.0)
+        assert [match.id for match in matches] == ["p3"] and matches[0].metadata["name"] == "خاتم"
+    finally:
+        ann_module.get_ann_index, ann_module.get_catalog_snapshot = get_ann_index, get_catalog_snapshot
+    print("✅ Falls back to Pinecone instead of returning empty metadata")
+
+if __name__ == "__main__":
+    test_search()
+    test_delete_and_replace()
+    test_compact()
+    test_quantized_storage()
+    test_persistence_and_journal()
+    test_vector_rows_match_labels()
+    test_ann_search_needs_snapshot()
+    print("\n🎉 All ANN index tests passed!")
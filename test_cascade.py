@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the concurrent fallback cascade and concurrent task runner
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+from shared.cascade import run_cascade, run_all, check_cancelled
+
+def _stage(result, delay):
+    def run():
+        time.sleep(delay)
+        return result
+    return run
+
+def _failing_stage():
+    raise RuntimeError("boom")
+
+def test_primary_wins_when_acceptable():
+    print("🧪 Testing primary stage priority")
+    stage, result = run_cascade([_stage(["primary"], 0.2), _stage(["fallback"], 0.01)])
+    assert (stage, result) == (0, ["primary"])
+    print("✅ Primary result preferred over a faster fallback")
+
+def test_fallback_runs_in_parallel():
+    print("🧪 Testing fallback on a primary miss")
+    start = time.monotonic()
+    stage, result = run_cascade([_stage([], 0.3), _stage(["fallback"], 0.3)])
+    elapsed = time.monotonic() - start
+    assert (stage, result) == (1, ["fallback"])
+    assert elapsed < 0.5, elapsed
+    print(f"✅ Fallback returned in {elapsed:.2f}s (stages overlapped)")
+
+def test_failures_and_deadline():
+    print("🧪 Testing failures and deadline")
+    assert run_cascade([_failing_stage, _stage([], 0.01)]) == (None, None)
+
+    start = time.monotonic()
+    stage, result = run_cascade([_stage(["slow"], 2.0), _stage(["fast"], 0.05)], deadline=0.3)
+    assert (stage, result) == (1, ["fast"])
+    assert time.monotonic() - start < 1.0
+    print("✅ Failed stages skipped, best result returned at the deadline")
+
+def test_run_all_keeps_every_result():
+    print("🧪 Testing concurrent tasks (one worker per tool call)")
+    start = time.monotonic()
+    results = run_all([_stage("خواتم", 0.3), _stage("أساور", 0.3), _failing_stage, _stage("late", 2.0)], deadline=0.6)
+    assert time.monotonic() - start < 1.0  # About one task's wall-clock time
+    assert results[:2] == ["خواتم", "أساور"]
+    assert isinstance(results[2], RuntimeError) and isinstance(results[3], TimeoutError)
+    assert run_all([]) == [] and run_all([_stage("one", 0)]) == ["one"]
+    print("✅ Results in call order; failures and late tasks reported per task")
+
+def test_losing_stages_stop_at_checkpoints():
+    print("🧪 Testing cancellation of losing stages")
+    upstream_calls = []
+    finished = threading.Event()
+    def slow_stage():
+        for step in range(5):
+            time.sleep(0.1)  # One upstream call
+            upstream_calls.append(step)
+            try:
+                check_cancelled()
+            except Exception:
+                finished.set()
+                raise
+        return ["slow"]
+
+    stage, _ = run_cascade([_stage(["fast"], 0.05), slow_stage])
+    assert stage == 0
+    assert finished.wait(1.0)
+    assert len(upstream_calls) == 1  # Stopped after the call that was in progress
+    check_cancelled()  # No-op outside a cascade
+    print("✅ Running stage stopped at its next checkpoint")
+
+if __name__ == "__main__":
+    test_primary_wins_when_acceptable()
+    test_fallback_runs_in_parallel()
+    test_failures_and_deadline()
+    test_run_all_keeps_every_result()
+    test_losing_stages_stop_at_checkpoints()
+    print("\n🎉 All cascade tests passed!")
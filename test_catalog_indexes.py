@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test price/weight/karat secondary indexes and the pre-filtered vector search
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from shared.config import EMBEDDING_DIMENSION
+from shared.catalog_snapshot import CatalogSnapshot, record_change, write_snapshot
+from shared.catalog_indexes import CatalogIndexes, ProductMatch, hydrate_matches, pinecone_filter, rerank_full_vectors
+from shared.embeddings import shorten_embedding
+from shared.query_parser import parse_query
+
+def _vector(position):
+    vector = np.zeros(EMBEDDING_DIMENSION, dtype=np.float32)
+    vector[position] = 1.0
+    return vector
+
+def _indexes():
+    directory = tempfile.mkdtemp()
+    write_snapshot([
+        ("cheap", {"name": "خاتم بسيط", "price": 900.0, "karat": "18 قيراط", "weight": 2.0}, _vector(0)),
+        ("mid", {"name": "خاتم الياسمين", "price": 1800.0, "karat": "21 قيراط", "weight": 3.5}, _vector(0) + _vector(1)),
+        ("luxury", {"name": "خاتم ملكي", "price": 5200.0, "karat": "21 قيراط", "weight": 8.0}, _vector(0)),
+    ], directory)
+    return CatalogIndexes(CatalogSnapshot(directory))
+
+def test_range_and_bitmap_candidates():
+    print("🧪 Testing range lookups and karat bitmaps")
+    indexes = _indexes()
+    ids = lambda constraints: [indexes.ids[row] for row in np.flatnonzero(indexes.candidates(constraints))]
+
+    assert ids({"max_price": 2000}) == ["cheap", "mid"]
+    assert ids({"min_price": 1800, "max_price": 5200}) == ["mid", "luxury"]
+    assert ids({"karat": "21 قيراط"}) == ["mid", "luxury"]
+    assert ids({"max_weight": 4, "karat": "21 قيراط"}) == ["mid"]
+    print("✅ Candidates match the constraints")
+
+def test_filtered_search():
+    print("🧪 Testing pre-filtered vector search")
+    indexes = _indexes()
+    constraints = parse_query("خاتم ذهب عيار 21 أقل من 2000 ريال")
+
+    matches = indexes.search(_vector(0), constraints, top_k=5)
+    assert [match.id for match in matches] == ["mid"]
+    assert matches[0].metadata["price"] == 1800.0
+
+    # Without constraints the closest (but over-budget) products come first
+    assert [match.id for match in indexes.search(_vector(0), {}, top_k=2)] == ["cheap", "luxury"]
+    print("✅ Only in-budget products are scored")
+
+def test_rows_refer_into_snapshot():
+    print("🧪 Testing indexes over the mapped columns and the overlay")
+    directory = tempfile.mkdtemp()
+    write_snapshot([
+        ("cheap", {"name": "خاتم بسيط", "price": 900.0, "karat": "18 قيراط", "weight": 2.0}, _vector(0)),
+        ("mid", {"name": "خاتم الياسمين", "price": 1800.0, "karat": "21 قيراط", "weight": 3.5}, _vector(1)),
+    ], directory)
+    record_change("upsert", "mid", {"name": "خاتم الياسمين", "price": 2500.0, "karat": "21 قيراط", "weight": 3.5},
+                  _vector(0).tolist(), directory=directory)
+    indexes = CatalogIndexes(CatalogSnapshot(directory))
+
+    assert not hasattr(indexes, "metadata")
+    assert list(indexes.base_rows) == [0, -1]  # "mid" now comes from the overlay
+    assert [match.id for match in indexes.search(_vector(0), {"max_price": 2000}, top_k=5)] == ["cheap"]
+    matches = indexes.search(_vector(0), {"karat": "21 قيراط"}, top_k=5)
+    assert [match.id for match in matches] == ["mid"] and matches[0].metadata["price"] == 2500.0
+    print("✅ Base rows and overlay rows indexed without copies")
+
+def test_pinecone_filter():
+    print("🧪 Testing Pinecone metadata filter")
+    assert pinecone_filter({"min_price": 1000, "max_price": 3000, "karat": "21 قيراط"}) == {
+        "price": {"$gte": 1000.0, "$lte": 3000.0},
+        "karat": {"$eq": "21 قيراط"}
+    }
+    print("✅ Filter built")
+
+def test_short_vectors_and_full_rerank():
+    print("🧪 Testing short vectors with full-vector reranking")
+    short = shorten_embedding([3.0, 4.0, 12.0], dimension=2)
+    assert np.allclose(short, [0.6, 0.8])
+    assert shorten_embedding([1.0, 2.0], dimension=4) == [1.0, 2.0]
+
+    directory = tempfile.mkdtemp()
+    write_snapshot([
+        ("near", {"name": "قريب"}, _vector(0) + 0.1 * _vector(1)),
+        ("far", {"name": "بعيد"}, _vector(1)),
+    ], directory)
+    # Short-vector scores got the order wrong; "missing" has no local vector and keeps its score
+    matches = [ProductMatch("far", 0.9, {}), ProductMatch("near", 0.8, {}), ProductMatch("missing", 0.5, {})]
+    reranked = rerank_full_vectors(matches, _vector(0), top_k=2, snapshot=CatalogSnapshot(directory))
+    assert [match.id for match in reranked] == ["near", "missing"]
+    assert reranked[0].score > 0.99
+    print("✅ Candidates re-scored with full vectors")
+
+class _FetchIndex:
+    """Pinecone stand-in that records fetch calls"""
+
+    def __init__(self, products):
+        self.products = products
+        self.fetched = []
+
+    def fetch(self, ids):
+        self.fetched.append(ids)
+        vectors = {pid: type("Vector", (), {"metadata": self.products[pid]})() for pid in ids if pid in self.products}
+        return type("FetchResponse", (), {"vectors": vectors})()
+
+def test_hydrate_matches():
+    print("🧪 Testing local metadata hydration")
+    directory = tempfile.mkdtemp()
+    write_snapshot([("local", {"name": "خاتم", "price": 900.0, "image_url": "images/ab/large.jpg"}, None)], directory)
+    index = _FetchIndex({"remote": {"name": "عقد", "price": 1200.0}})
+    matches = [ProductMatch("local", 0.9, None), ProductMatch("remote", 0.8, None), ProductMatch("gone", 0.7, None)]
+
+    hydrated = hydrate_matches(index, matches, snapshot=CatalogSnapshot(directory))
+    assert [match.id for match in hydrated] == ["local", "remote"]
+    assert hydrated[0].metadata["image_url"] == "images/ab/large.jpg"
+    assert hydrated[1].metadata["name"] == "عقد"
+    assert index.fetched == [["remote", "gone"]]  # One fetch for the local misses only
+    print("✅ Metadata joined locally, misses fetched once")
+
+if __name__ == "__main__":
+    test_range_and_bitmap_candidates()
+    test_filtered_search()
+    test_rows_refer_into_snapshot()
+    test_pinecone_filter()
+    test_short_vectors_and_full_rerank()
+    test_hydrate_matches()
+    print("\n🎉 All catalog index tests passed!")
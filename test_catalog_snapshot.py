@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test the columnar catalog snapshot and its change log
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from shared.config import EMBEDDING_DIMENSION
+from shared.catalog_snapshot import CatalogSnapshot, write_snapshot, record_change
+
+def _vector(value):
+    return [value] * EMBEDDING_DIMENSION
+
+def _rows():
+    return [
+        ("p1", {"name": "خاتم الياسمين", "price": 1200.5, "category": "خواتم", "karat": "21 قيراط", "weight": 3.2, "description": "خاتم: حلقة دائرية"}, _vector(0.1)),
+        ("p2", {"name": "عقد الفراشة", "price": 2100.0, "category": "عقود", "karat": "21 قيراط", "description": "عقد: فراشة"}, _vector(0.2))
+    ]
+
+def test_round_trip():
+    print("🧪 Testing snapshot round trip")
+    directory = tempfile.mkdtemp()
+    write_snapshot(_rows(), directory)
+    snapshot = CatalogSnapshot(directory)
+
+    assert len(snapshot) == 2
+    product = snapshot.get("p1")
+    assert product["name"] == "خاتم الياسمين" and product["price"] == 1200.5
+    assert product["description"] == "خاتم: حلقة دائرية"
+    assert snapshot.get("p2")["weight"] == 0.0
+    assert np.allclose(snapshot.vector("p2")[:3], 0.2)
+
+    # Repeated strings are interned once
+    assert snapshot.strings.count("21 قيراط") == 1
+    print("✅ Columns, strings and descriptions restored")
+
+def test_change_log_refresh():
+    print("🧪 Testing incremental refresh")
+    directory = tempfile.mkdtemp()
+    write_snapshot(_rows(), directory)
+    snapshot = CatalogSnapshot(directory)
+
+    record_change("upsert", "p3", {"name": "سوار", "price": 800.0, "category": "أساور"}, _vector(0.3), directory=directory)
+    record_change("delete", "p1", directory=directory)
+    snapshot.refresh()
+
+    assert sorted(product_id for product_id, _ in snapshot.products()) == ["p2", "p3"]
+    assert snapshot.get("p1") is None
+    assert snapshot.get("p3")["price"] == 800.0
+
+    snapshot.compact()
+    assert len(snapshot) == 2 and snapshot.get("p3")["name"] == "سوار"
+    assert os.path.getsize(os.path.join(directory, "changes.jsonl")) == 0
+    print("✅ Change log replayed and compacted")
+
+def test_refresh_publishes_new_state():
+    print("🧪 Testing that refreshes never change a state readers hold")
+    directory = tempfile.mkdtemp()
+    write_snapshot(_rows(), directory)
+    snapshot = CatalogSnapshot(directory)
+    held = snapshot._state
+    products = snapshot.products()
+    next(products)
+
+    record_change("upsert", "p3", {"name": "سوار"}, None, directory=directory)
+    record_change("delete", "p2", directory=directory)
+    snapshot.refresh()
+    assert "p3" not in held.overlay and not held.deleted and held.get("p2") is not None
+    assert snapshot.get("p3")["name"] == "سوار" and snapshot.get("p2") is None
+    assert [product_id for product_id, _ in products] == ["p2"]  # An iteration in progress keeps its state
+
+    write_snapshot(_rows()[:1], directory)
+    snapshot.refresh()
+    assert held.row_by_id.keys() == {"p1", "p2"} and snapshot.row_by_id.keys() == {"p1"}
+    print("✅ Changes and reloads swap in a new state")
+
+def test_rebuild_switches_generations():
+    print("🧪 Testing snapshot rebuilds under a live reader")
+    directory = tempfile.mkdtemp()
+    write_snapshot(_rows(), directory)
+    reader = CatalogSnapshot(directory)
+
+    write_snapshot(_rows()[:1], directory)
+    # The reader keeps mapping its own generation until it reloads
+    assert reader.get("p2")["name"] == "عقد الفراشة"
+    reader.refresh()
+    assert len(reader) == 1 and reader.get("p2") is None
+
+    write_snapshot(_rows(), directory)
+    generations = [name for name in os.listdir(directory) if name.startswith("gen-")]
+    assert len(generations) == 2  # Current and previous
+    print("✅ Readers never see a mix of columns")
+
+def test_v2_mode_refuses_pinecone_build():
+    print("🧪 Testing snapshot builds from a short-vector index")
+    import shared.catalog_snapshot as snapshot_module
+    queried = []
+    class ShortVectorIndex:
+        def query(self, **kwargs):
+            queried.append(kwargs)
+
+    primary_dimension = snapshot_module.PRIMARY_DIMENSION
+    snapshot_module.PRIMARY_DIMENSION = 256
+    try:
+        snapshot_module.build_snapshot(ShortVectorIndex(), tempfile.mkdtemp())
+        assert False, "v2 snapshots must come from the migration"
+    except ValueError as e:
+        assert "shared.embedding_migration" in str(e)
+    finally:
+        snapshot_module.PRIMARY_DIMENSION = primary_dimension
+    assert not queried
+    print("✅ Pointed to shared.embedding_migration instead")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_change_log_refresh()
+    test_refresh_publishes_new_state()
+    test_rebuild_switches_generations()
+    test_v2_mode_refuses_pinecone_build()
+    print("\n🎉 All catalog snapshot tests passed!")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the template clarifying questions and their catalog-derived options
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.catalog_snapshot import CatalogSnapshot, write_snapshot
+from shared.clarification import FacetDistribution, clarification_questions
+from shared.conversation_state import ConversationState
+from shared.query_parser import parse_query
+
+def _distribution():
+    rows = []
+    # Rings: gold and silver in equal numbers, all in the same style
+    for i in range(6):
+        karat = "21 قيراط" if i % 2 else "فضة 925"
+        rows.append((f"r{i}", {"name": f"خاتم {i}", "category": "خواتم", "karat": karat, "style": "بسيط",
+                               "price": 500.0 + 400 * i, "description": "خاتم بسيط"}, None))
+    rows.append(("n1", {"name": "عقد", "category": "عقود", "karat": "18 قيراط", "style": "فاخر", "price": 9000.0, "description": "عقد زفاف"}, None))
+    directory = tempfile.mkdtemp()
+    write_snapshot(rows, directory)
+    return FacetDistribution(CatalogSnapshot(directory))
+
+def test_defaults_without_catalog():
+    print("🧪 Testing fixed options without a snapshot")
+    questions = clarification_questions(parse_query("مجوهرات"))
+    assert questions[0].startswith("ما نوع المجوهرات") and len(questions) == 3
+    assert not any("نوع المجوهرات" in q for q in clarification_questions(parse_query("خاتم")))
+    assert clarification_questions(parse_query("خاتم ذهب بسيط للزواج أقل من 2000 ريال")) == []
+    print("✅ Only the missing facets are asked")
+
+def test_catalog_options():
+    print("🧪 Testing options from the catalog facet distribution")
+    distribution = _distribution()
+    assert len(distribution) == 7
+
+    questions = clarification_questions(parse_query("خاتم"), distribution=distribution)
+    # Rings split evenly on material and price, not on style (all simple)
+    assert questions[0].startswith("ما المادة") and "ذهب" in questions[0] and "فضة" in questions[0]
+    assert any(q.startswith("ما الميزانية") and "ريال" in q for q in questions)
+    assert not any(q.startswith("ما النمط") for q in questions)
+
+    questions = clarification_questions(parse_query("مجوهرات"), distribution=distribution)
+    assert questions[0].startswith("ما نوع المجوهرات") and "خاتم" in questions[0] and "عقد" in questions[0]
+    print(f"✅ {questions[0]}")
+
+def test_state_answers_facets():
+    print("🧪 Testing facets answered in earlier turns")
+    state = ConversationState()
+    state.update_from_message("خاتم عيار 21")
+    questions = clarification_questions(parse_query("هدية"), state, _distribution())
+    assert not any(q.startswith("ما المادة") or q.startswith("ما نوع") for q in questions)
+    assert questions
+    print("✅ Karat counts as the material")
+
+if __name__ == "__main__":
+    test_defaults_without_catalog()
+    test_catalog_options()
+    test_state_answers_facets()
+    print("\n🎉 All clarification tests passed!")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test the token-budgeted context builder
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.context_builder import (
+    build_product_context, build_history_context, count_tokens, truncate_to_tokens
+)
+from shared.product_fragments import get_fragments
+
+def _product(product_id, name, score, price=1500.0):
+    return {
+        'id': product_id,
+        'score': score,
+        'metadata': {
+            'name': name,
+            'price': price,
+            'category': 'خواتم',
+            'karat': '21 قيراط',
+            'weight': 3.5,
+            'description': 'خاتم: حلقة دائرية بسيطة مع انحناء ناعم ومقطع عرضي مستدير ' * 10
+        }
+    }
+
+def test_products_ranked_and_deduplicated():
+    print("🧪 Testing product ranking and deduplication")
+    results = [
+        _product("a", "خاتم الياسمين", 0.61),
+        _product("b", "خاتم الوردة", 0.83),
+        _product("a", "خاتم الياسمين", 0.61),
+        _product("c", "خاتم الوردة", 0.55),  # same name and price as "b"
+    ]
+
+    table, included = build_product_context(results, max_tokens=2000)
+
+    assert [r['id'] for r in included] == ["b", "a"]
+    assert table.splitlines()[1].startswith("1 | خاتم الوردة")
+    print("✅ Ranked by score, duplicates dropped")
+
+def test_products_respect_budget():
+    print("🧪 Testing product token budget")
+    results = [_product(str(i), f"خاتم {i}", 0.9 - i * 0.01) for i in range(20)]
+
+    table, included = build_product_context(results, max_tokens=300)
+
+    assert 0 < len(included) < 20
+    assert count_tokens(table) <= 300
+    print(f"✅ {len(included)} products packed into {count_tokens(table)} tokens")
+
+def test_history_keeps_most_recent():
+    print("🧪 Testing history packing")
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"رسالة رقم {i} " * 30} for i in range(10)]
+
+    packed = build_history_context(history, max_tokens=200, message_tokens=40)
+
+    assert packed
+    assert packed[-1]["content"].startswith("رسالة رقم 9")
+    assert sum(count_tokens(m["content"]) for m in packed) <= 200
+    print(f"✅ Kept last {len(packed)} messages")
+
+def test_truncate_to_tokens():
+    print("🧪 Testing truncation")
+    text = "قلادة ذهبية بتصميم زهرة الياسمين " * 20
+    truncated = truncate_to_tokens(text, 10)
+
+    assert truncated.endswith("…")
+    assert count_tokens(truncated) <= 12
+    assert truncate_to_tokens("خاتم", 10) == "خاتم"
+    print("✅ Truncation works")
+
+def test_fragments_cached_per_version():
+    print("🧪 Testing rendered fragment cache")
+    product = _product("f1", "خاتم الياسمين", 0.9)
+    first = get_fragments("f1", product['metadata'])
+    assert get_fragments("f1", dict(product['metadata'])) is first
+    assert first.price_text == "1500.00 ريال"
+    assert first.list_description.endswith("...")
+
+    # A changed product renders again
+    changed = dict(product['metadata'], price=1700.0)
+    assert get_fragments("f1", changed).price_text == "1700.00 ريال"
+
+    # Even when an update keeps the stamped catalog version
+    versioned = dict(product['metadata'], catalog_version="1")
+    get_fragments("f1", versioned)
+    assert get_fragments("f1", dict(versioned, name="خاتم الوردة")).name == "خاتم الوردة"
+
+    table, _ = build_product_context([product], max_tokens=2000)
+    assert table.splitlines()[1] == f"1 | {first.context_row}"
+    print("✅ Fragments reused until the product changes")
+
+if __name__ == "__main__":
+    test_products_ranked_and_deduplicated()
+    test_products_respect_budget()
+    test_history_keeps_most_recent()
+    test_truncate_to_tokens()
+    test_fragments_cached_per_version()
+    print("\n🎉 All context builder tests passed!")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the rolling conversation state and query parsing
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.query_parser import parse_query
+from shared.conversation_state import ConversationState
+
+def test_parse_budget_and_karat():
+    print("🧪 Testing constraint parsing")
+    constraints = parse_query("خاتم ذهب عيار 21 أقل من ٢٠٠٠ ريال")
+
+    assert constraints["category"] == "خواتم"
+    assert constraints["material"] == "ذهب"
+    assert constraints["karat"] == "21 قيراط"
+    assert constraints["max_price"] == 2000
+    print(f"✅ Parsed: {constraints}")
+
+def test_parse_does_not_match_inside_words():
+    print("🧪 Testing whole-word matching")
+    # "معقد" contains "عقد" but is not a necklace
+    constraints = parse_query("خاتم: تصميم معقد التفاصيل")
+
+    assert constraints["category"] == "خواتم"
+    print("✅ No false category match")
+
+def test_generic_words_are_not_facets():
+    print("🧪 Testing everyday words")
+    assert parse_query("ما هي ساعات العمل؟")["occasion"] is None
+    assert not parse_query("شي ثاني")["vague"]
+    assert parse_query("خاتم للعمل")["occasion"] == "عمل"
+    print("✅ Occasion words need a jewelry type")
+
+def test_state_tracks_preferences_and_products():
+    print("🧪 Testing conversation state updates")
+    state = ConversationState()
+    state.update_from_message("أريد خاتم ذهب")
+    state.update_from_results("خاتم ذهب", [
+        {'id': 'p1', 'score': 0.8, 'metadata': {'name': 'خاتم الياسمين', 'price': 1200.0, 'category': 'خواتم', 'karat': '21 قيراط'}},
+        {'id': 'p2', 'score': 0.7, 'metadata': {'name': 'خاتم الوردة', 'price': 950.0, 'category': 'خواتم'}}
+    ])
+    state.update_from_message("كم السعر؟")
+
+    assert state.preferences["category"] == "خواتم"
+    assert state.preferences["material"] == "ذهب"
+    assert [p["id"] for p in state.last_products] == ["p1", "p2"]
+
+    prompt = state.to_prompt()
+    assert "خاتم الياسمين" in prompt and "1200.00 ريال" in prompt
+    print(prompt)
+
+    restored = ConversationState.from_dict(state.to_dict())
+    assert restored.to_prompt() == prompt
+    print("✅ State round-trips")
+
+def test_new_category_resets_facets():
+    print("🧪 Testing a category change")
+    state = ConversationState()
+    state.update_from_message("خاتم ذهب للزواج أقل من 3000 ريال")
+    state.update_from_message("أريد سوار")
+    assert state.preferences["category"] == "أساور"
+    assert not any(state.preferences[key] for key in ["material", "style", "occasion", "karat"])
+    assert state.max_price is None
+
+    # Details given before any type still apply to it
+    state = ConversationState()
+    state.update_from_message("ذهب")
+    state.update_from_message("خاتم")
+    assert state.preferences["material"] == "ذهب"
+    print("✅ Facets of the old type dropped")
+
+if __name__ == "__main__":
+    test_parse_budget_and_karat()
+    test_parse_does_not_match_inside_words()
+    test_generic_words_are_not_facets()
+    test_state_tracks_preferences_and_products()
+    test_new_category_resets_facets()
+    print("\n🎉 All conversation state tests passed!")
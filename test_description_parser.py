@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test rule-based extraction from vision descriptions
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.description_parser import parse_image_description, build_simplified_query, is_confident
+
+def test_type_prefix():
+    print("🧪 Testing type prefix extraction")
+    parsed = parse_image_description("خاتم: شكل فراشة متماثل مع أجنحة منحنية ونقاط تفصيلية")
+    assert parsed["type"] == "خاتم" and parsed["shape"] == "فراشة"
+    assert is_confident(parsed)
+    assert build_simplified_query(parsed) == "خاتم فراشة"
+    print(f"✅ {build_simplified_query(parsed)} ({parsed['confidence']})")
+
+def test_labelled_type():
+    print("🧪 Testing 'النوع:' labels")
+    parsed = parse_image_description("**النوع:** عقد: تصميم مستطيل عمودي عصري")
+    assert build_simplified_query(parsed) == "عقد مستطيل عصري"
+
+    parsed = parse_image_description("النوع: سوار ذهبي مضفر")
+    assert build_simplified_query(parsed) == "سوار ذهب مضفر"
+    print("✅ Labelled types parsed")
+
+def test_low_confidence():
+    print("🧪 Testing low-confidence descriptions")
+    assert not is_confident(parse_image_description("تصميم جميل لامع"))
+    assert not is_confident(parse_image_description("قطعة فيها شكل قلب مع خاتم"))
+    print("✅ Unclear descriptions left to the LLM")
+
+if __name__ == "__main__":
+    test_type_prefix()
+    test_labelled_type()
+    test_low_confidence()
+    print("\n🎉 All description parser tests passed!")
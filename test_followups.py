@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test direct answers for follow-up questions about shown products
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.conversation_state import ConversationState
+from shared.followups import answer_followup
+
+def _state_with_products():
+    state = ConversationState()
+    state.update_from_results("خواتم ذهب", [
+        {'id': 'p1', 'score': 0.8, 'metadata': {'name': 'خاتم الياسمين', 'price': 1200.0, 'category': 'خواتم', 'karat': '21 قيراط', 'weight': 3.2, 'product_url': 'https://example.com/p1'}},
+        {'id': 'p2', 'score': 0.7, 'metadata': {'name': 'خاتم الوردة', 'price': 950.0, 'category': 'خواتم', 'karat': '18 قيراط'}},
+        {'id': 'p3', 'score': 0.6, 'metadata': {'name': 'عقد الفراشة', 'price': 2100.0, 'category': 'عقود'}}
+    ])
+    return state
+
+def test_ordinal_reference():
+    print("🧪 Testing ordinal references")
+    answer = answer_followup("كم سعر الأول؟", _state_with_products())
+
+    assert answer and "1200.00 ريال" in answer and "950.00" not in answer
+    print(f"✅ {answer.splitlines()[0]}")
+
+def test_category_reference():
+    print("🧪 Testing category references")
+    answer = answer_followup("كم عيار العقد؟", _state_with_products())
+
+    assert "عقد الفراشة" in answer and "غير متوفرة" in answer
+    print(f"✅ {answer.splitlines()[0]}")
+
+def test_name_reference():
+    print("🧪 Testing name references")
+    answer = answer_followup("أرسل رابط خاتم الياسمين", _state_with_products())
+
+    assert "https://example.com/p1" in answer and "خاتم الوردة" not in answer
+    print(f"✅ {answer.splitlines()[0]}")
+
+def test_unqualified_question_lists_all():
+    print("🧪 Testing questions without a reference")
+    answer = answer_followup("كم السعر؟", _state_with_products())
+
+    assert all(price in answer for price in ["1200.00", "950.00", "2100.00"])
+    print("✅ Listed all shown products")
+
+def test_new_requests_fall_through():
+    print("🧪 Testing that new searches are not treated as follow-ups")
+    state = _state_with_products()
+
+    assert answer_followup("كم سعر الأساور الفضية؟", state) is None
+    assert answer_followup("شو رأيك بالأخير؟", state) is None
+    assert answer_followup("كم السعر؟", ConversationState()) is None
+    # Karat, budget and weight constraints start a new search too
+    assert answer_followup("أريد خاتم عيار 18", state) is None
+    assert answer_followup("خاتم بسعر أقل من 500 ريال", state) is None
+    assert answer_followup("عندكم خواتم وزن أقل من 3 جرام؟", state) is None
+    # Open questions that merely mention an attribute
+    assert answer_followup("هل السعر قابل للتفاوض؟", state) is None
+    assert answer_followup("عندكم أسعار خاصة للعيد؟", state) is None
+    assert answer_followup("ليش السعر غالي؟", state) is None
+    print("✅ Open-ended and new requests go to the LLM")
+
+if __name__ == "__main__":
+    test_ordinal_reference()
+    test_category_reference()
+    test_name_reference()
+    test_unqualified_question_lists_all()
+    test_new_requests_fall_through()
+    print("\n🎉 All follow-up tests passed!")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the image store: bounded master renditions, and the HTTP handler serving
+rendition files only with cache headers on hits only
+"""
+
+import sys
+import os
+import functools
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+import io
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from http.server import ThreadingHTTPServer
+from PIL import Image
+import shared.image_store as image_store_module
+from shared.config import MASTER_MAX_SIZE
+from shared.image_store import CachingImageHandler, rendition_url, store_image, image_path
+
+def _serve(directory):
+    os.makedirs(os.path.join(directory, "ab", "abcd"))
+    with open(os.path.join(directory, "ab", "abcd", "large.jpg"), "wb") as f:
+        f.write(b"jpeg")
+    with open(os.path.join(directory, "ab", "abcd", "product_id"), "wb") as f:
+        f.write(b"p1")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(CachingImageHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.headers.get("Cache-Control")
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("Cache-Control")
+
+def test_handler():
+    print("🧪 Testing the image server handler")
+    server, base = _serve(tempfile.mkdtemp())
+    try:
+        status, cache = _get(f"{base}/ab/abcd/large.jpg")
+        assert status == 200 and "immutable" in cache
+        for path in ["/ab/abcd/thumb.jpg", "/ab/abcd/product_id", "/ab/", "/"]:
+            status, cache = _get(base + path)
+            assert status == 404 and cache is None, path
+    finally:
+        server.shutdown()
+    assert rendition_url("abcd", "thumb").endswith("/ab/abcd/thumb.jpg")
+    print("✅ Renditions cached for a year; misses, markers and listings are 404 and uncached")
+
+def _image_bytes(size, format="JPEG", mode="RGB"):
+    buffered = io.BytesIO()
+    Image.new(mode, size, (180, 140, 60) if mode == "RGB" else (180, 140, 60, 255)).save(buffered, format=format)
+    return buffered.getvalue()
+
+def test_master_rendition():
+    print("🧪 Testing stored master renditions")
+    store_dir = image_store_module.IMAGE_STORE_DIR
+    image_store_module.IMAGE_STORE_DIR = tempfile.mkdtemp()
+    try:
+        small = _image_bytes((640, 480))
+        with open(image_path(store_image(small), "master"), "rb") as f:
+            assert f.read() == small  # Stored as uploaded, no decode/re-encode
+
+        key = store_image(_image_bytes((4000, 3000)))
+        master = Image.open(image_path(key, "master"))
+        assert master.size[0] <= MASTER_MAX_SIZE[0] and master.size[1] <= MASTER_MAX_SIZE[1]
+
+        key = store_image(_image_bytes((300, 300), format="PNG", mode="RGBA"))
+        assert Image.open(image_path(key, "master")).format == "JPEG"
+        assert Image.open(image_path(key, "thumb")).size == (200, 200)
+    finally:
+        image_store_module.IMAGE_STORE_DIR = store_dir
+    print("✅ Large uploads capped, small JPEGs kept as uploaded")
+
+if __name__ == "__main__":
+    test_handler()
+    test_master_rendition()
+    print("\n🎉 All image store tests passed!")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test the deterministic search/clarify routing of chat turns
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.conversation_state import ConversationState
+from shared.intent_router import route_intent, CLARIFICATION_TOOL_NAME, SEARCH_TOOL_NAME
+
+def _route(messages):
+    """Route the last message after folding every message into a fresh state"""
+    state = ConversationState()
+    for message in messages:
+        state.update_from_message(message)
+    routed = route_intent(messages[-1], state)
+    if routed is None:
+        return None, None
+    tool_call = routed.tool_calls[0]
+    return tool_call.function.name, json.loads(tool_call.function.arguments)
+
+def test_type_plus_detail_searches():
+    print("🧪 Testing type + detail → search")
+    for message in ["خاتم ذهب", "أبي عقد بسيط لو سمحت", "خاتم خطوبة", "أساور عيار 21", "هل عندكم أقراط فضة؟"]:
+        name, arguments = _route([message])
+        assert name == SEARCH_TOOL_NAME, message
+        assert arguments["query"] == message
+    print("✅ Searched directly")
+
+def test_type_or_detail_alone_clarifies():
+    print("🧪 Testing type alone / vague → clarify")
+    for message in ["خاتم", "مجوهرات", "هدية", "ذهب"]:
+        name, arguments = _route([message])
+        assert name == CLARIFICATION_TOOL_NAME, message
+        assert arguments["questions"]
+    _, arguments = _route(["خاتم"])
+    assert not any("نوع المجوهرات" in question for question in arguments["questions"])
+    print("✅ Asked for the missing details")
+
+def test_state_completes_query():
+    print("🧪 Testing facets remembered across turns")
+    name, arguments = _route(["خاتم", "ذهب"])
+    assert name == SEARCH_TOOL_NAME and arguments["query"] == "خاتم ذهب"
+
+    name, arguments = _route(["أبي خاتم ذهب", "أقل من 2000 ريال"])
+    assert name == SEARCH_TOOL_NAME and arguments["query"] == "خاتم ذهب أقل من 2000 ريال"
+    print(f"✅ {arguments['query']}")
+
+def test_new_type_drops_old_facets():
+    print("🧪 Testing a new jewelry type after a search")
+    name, arguments = _route(["خاتم ذهب", "أريد سوار"])
+    assert name == CLARIFICATION_TOOL_NAME  # A bare type clarifies; gold belonged to the ring
+
+    name, arguments = _route(["خاتم ذهب أقل من 2000 ريال", "أريد سوار فضة"])
+    assert name == SEARCH_TOOL_NAME and arguments["query"] == "أريد سوار فضة"
+    print("✅ Old material and budget not carried over")
+
+def test_ambiguous_goes_to_llm():
+    print("🧪 Testing ambiguous messages")
+    for message in ["مرحبا", "كيف أنظف الذهب؟", "خاتم بشكل فراشة", "شكرا لك"]:
+        assert _route([message]) == (None, None), message
+    print("✅ Left to the LLM router")
+
+def test_negated_and_question_turns_go_to_llm():
+    print("🧪 Testing negated and question turns")
+    assert _route(["خاتم", "لا أريد ذهب"]) == (None, None)
+    assert _route(["ما عيار الذهب؟"]) == (None, None)
+    assert _route(["خاتم ذهب", "ما عيار الذهب؟"]) == (None, None)
+    print("✅ Not routed to a search")
+
+def test_routed_message_shape():
+    print("🧪 Testing the synthesized assistant message")
+    state = ConversationState()
+    state.update_from_message("خاتم ذهب")
+    message = route_intent("خاتم ذهب", state).to_dict()
+    tool_call = message["tool_calls"][0]
+    assert message["role"] == "assistant" and tool_call["type"] == "function"
+    assert tool_call["id"].startswith("call_local_")
+    assert json.loads(tool_call["function"]["arguments"]) == {"query": "خاتم ذهب"}
+    print("✅ Same shape as an API tool call")
+
+if __name__ == "__main__":
+    test_type_plus_detail_searches()
+    test_type_or_detail_alone_clarifies()
+    test_state_completes_query()
+    test_new_type_drops_old_facets()
+    test_ambiguous_goes_to_llm()
+    test_negated_and_question_turns_go_to_llm()
+    test_routed_message_shape()
+    print("\n🎉 All intent router tests passed!")
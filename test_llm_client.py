@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test the async OpenAI client layer with a stand-in transport: rate limiting,
+retries honoring Retry-After, deadlines and batched bulk embeddings
+"""
+
+import sys
+import os
+import asyncio
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import openai
+import shared.llm_client as llm_module
+from shared.llm_client import AsyncLLMClient, TokenBucket
+
+class _Embedding:
+    def __init__(self, vector):
+        self.embedding = vector
+
+class _Response:
+    def __init__(self, inputs):
+        self.data = [_Embedding([float(len(text))]) for text in inputs]
+
+class _FakeEmbeddings:
+    """embeddings.create stand-in: optional failures first, optional delay"""
+
+    def __init__(self, failures=(), delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.calls = []
+
+    async def create(self, model, input, **kwargs):
+        self.calls.append((time.monotonic(), input))
+        if self.failures:
+            raise self.failures.pop(0)
+        await asyncio.sleep(self.delay)
+        return _Response(input)
+
+def _client(embeddings):
+    client = AsyncLLMClient()
+    client._client = type("FakeOpenAI", (), {"embeddings": embeddings})()
+    return client
+
+def _rate_limited(retry_after):
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+def test_token_bucket():
+    print("🧪 Testing the token bucket")
+    async def acquire_all(bucket, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_all(TokenBucket(rate=20.0, capacity=5), 5)) < 0.05  # Burst
+    elapsed = asyncio.run(acquire_all(TokenBucket(rate=20.0, capacity=5), 9))
+    assert 0.15 < elapsed < 0.5  # Four more tokens at 20/s
+    print(f"✅ Burst immediate, then {elapsed:.2f}s for 4 refills")
+
+def test_retry_after_is_honored():
+    print("🧪 Testing retries with Retry-After")
+    embeddings = _FakeEmbeddings(failures=[_rate_limited("0.3")])
+    client = _client(embeddings)
+    response = client.run(client.embedding(model="m", input=["خاتم"]))
+    assert response.data[0].embedding == [4.0]
+    (first, _), (second, _) = embeddings.calls
+    assert len(embeddings.calls) == 2 and second - first >= 0.3
+    assert AsyncLLMClient._retry_delay(_rate_limited("120"), 0) == llm_module.LLM_RETRY_MAX_DELAY
+    print(f"✅ Retried after {second - first:.2f}s")
+
+def test_deadline():
+    print("🧪 Testing the per-call deadline")
+    client = _client(_FakeEmbeddings(delay=1.0))
+    start = time.monotonic()
+    try:
+        client.run(client.embedding(deadline=0.2, model="m", input=["عقد"]))
+        assert False, "the call must time out"
+    except (asyncio.TimeoutError, TimeoutError):
+        pass
+    assert time.monotonic() - start < 0.8
+    print("✅ Timed out at the deadline")
+
+def test_embed_batches():
+    print("🧪 Testing batched bulk embeddings")
+    embeddings = _FakeEmbeddings(delay=0.2)
+    client = _client(embeddings)
+    get_llm_client = llm_module.get_llm_client
+    llm_module.get_llm_client = lambda: client
+    try:
+        batches = [["خاتم"] * 2, ["عقد"], ["سوار ذهب"]]
+        start = time.monotonic()
+        results = list(llm_module.embed_batches("m", batches, window=3))
+        elapsed = time.monotonic() - start
+    finally:
+        llm_module.get_llm_client = get_llm_client
+    assert results == [[[4.0], [4.0]], [[3.0]], [[8.0]]]  # Input order
+    assert elapsed < 0.5  # Three batches in flight together, not one after another
+    print(f"✅ 3 batches in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_retry_after_is_honored()
+    test_deadline()
+    test_embed_batches()
+    print("\n🎉 All LLM client tests passed!")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the process-wide deduplication of identical in-flight requests
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.singleflight import SingleFlight, text_key, vector_key
+
+def _run_concurrently(group, key, fn, callers=8):
+    results, errors = [], []
+    def worker():
+        try:
+            results.append(group.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+def test_concurrent_calls_share_one():
+    print("🧪 Testing identical in-flight requests")
+    group, calls = SingleFlight(), []
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["p1", "p2"]
+
+    results, errors = _run_concurrently(group, ("search", "خاتم ذهب"), slow_call)
+    assert len(calls) == 1 and not errors
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert group.stats() == {"executed": 1, "shared": 7, "in_flight": 0}
+
+    # Nothing is cached once the call has finished
+    group.do(("search", "خاتم ذهب"), slow_call)
+    assert len(calls) == 2
+    print("✅ One upstream call for 8 concurrent callers")
+
+def test_errors_and_distinct_keys():
+    print("🧪 Testing shared errors and distinct keys")
+    group = SingleFlight()
+    def failing_call():
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+    results, errors = _run_concurrently(group, "k", failing_call, callers=4)
+    assert not results and len(errors) == 4
+    assert all(str(error) == "upstream down" for error in errors)
+
+    assert group.do("a", lambda: 1) == 1 and group.do("b", lambda: 2) == 2
+    print("✅ Every waiter sees the failure; other keys run independently")
+
+def test_keys():
+    print("🧪 Testing request keys")
+    assert text_key("  خاتم   ذهب ") == text_key("خاتم ذهب")
+    assert vector_key([0.1, 0.2]) == vector_key([0.1, 0.2]) != vector_key([0.1, 0.3])
+    print("✅ Normalized text and vector digests")
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_one()
+    test_errors_and_distinct_keys()
+    test_keys()
+    print("\n🎉 All singleflight tests passed!")
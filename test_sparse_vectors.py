@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the Arabic sparse lexical vectors used for hybrid search
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import shared.sparse_vectors as sparse_module
+from shared.sparse_vectors import SparseVocabulary, hybrid_scale, lexical_tokens, rebuild_vocabulary, supports_sparse
+
+PRODUCTS = [
+    ("ring", {"name": "خاتم الياسمين", "category": "خواتم", "karat": "21 قيراط", "description": "خاتم ذهب بتصميم زهرة"}),
+    ("necklace", {"name": "عقد اللؤلؤ", "category": "عقود", "karat": "18 قيراط", "description": "عقد من اللؤلؤ الطبيعي"}),
+    ("bracelet", {"name": "سوار الزهرة", "category": "أساور", "karat": "21 قيراط", "description": "سوار ذهب بنقشة زهرة"}),
+]
+
+def _dot(a, b):
+    weights = dict(zip(b["indices"], b["values"]))
+    return sum(value * weights.get(index, 0.0) for index, value in zip(a["indices"], a["values"]))
+
+def test_tokens():
+    print("🧪 Testing lexical tokens")
+    assert lexical_tokens("أبي خاتم بالذهب مع اللؤلؤة") == ["خاتم", "ذهب", "لؤلؤه"]
+    assert "21" in lexical_tokens("عيار 21")
+    print("✅ Normalized, prefix-stripped, fillers dropped")
+
+def test_document_and_query_vectors():
+    print("🧪 Testing BM25 document and IDF query vectors")
+    path = os.path.join(tempfile.mkdtemp(), "vocab.json")
+    documents = rebuild_vocabulary(PRODUCTS, path)
+    vocabulary = SparseVocabulary(path)
+    assert vocabulary.documents == 3
+
+    query = vocabulary.encode_query("عقد لؤلؤ")
+    scores = {product_id: _dot(query, vector) for product_id, vector in documents.items()}
+    assert max(scores, key=scores.get) == "necklace"
+    assert scores["ring"] == 0.0
+
+    # The rarer term (لؤلؤ) outweighs the common one (ذهب)
+    query = vocabulary.encode_query("ذهب لؤلؤ")
+    weights = dict(zip(query["indices"], query["values"]))
+    assert weights[vocabulary.token_ids["لؤلؤ"]] > weights[vocabulary.token_ids["ذهب"]]
+    assert vocabulary.encode_query("شيء غير معروف")["indices"] == []
+    print("✅ Keyword matches rank first")
+
+def test_vocabulary_updates_persist():
+    print("🧪 Testing persisted vocabulary updates")
+    path = os.path.join(tempfile.mkdtemp(), "vocab.json")
+    rebuild_vocabulary(PRODUCTS, path)
+    writer, reader = SparseVocabulary(path), SparseVocabulary(path)
+    writer.encode_document("خاتم زمرد أخضر")
+    os.utime(path, (0, os.path.getmtime(path) + 1))  # Make sure the mtime moves on coarse clocks
+    assert reader.encode_query("زمرد")["indices"] == [writer.token_ids["زمرد"]]
+    assert reader.documents == 4
+    print("✅ Other processes see new tokens")
+
+def test_hybrid_scale():
+    print("🧪 Testing hybrid weighting")
+    dense, sparse = hybrid_scale([1.0, 0.5], {"indices": [3], "values": [1.0]}, alpha=0.8)
+    assert dense == [0.8, 0.4]
+    assert abs(sparse["values"][0] - 0.2) < 1e-9
+    print("✅ alpha * dense + (1 - alpha) * sparse")
+
+class _StatsIndex:
+    """Pinecone stand-in reporting its metric in the index stats"""
+
+    def __init__(self, metric):
+        self.metric = metric
+
+    def describe_index_stats(self):
+        return {"metric": self.metric, "dimension": 1536}
+
+def test_sparse_needs_dotproduct_index():
+    print("🧪 Testing sparse vectors per index metric")
+    cosine, dotproduct = _StatsIndex("cosine"), _StatsIndex("dotproduct")
+    assert not supports_sparse(dotproduct)  # Hybrid search off
+    enabled = sparse_module.HYBRID_SEARCH_ENABLED
+    sparse_module.HYBRID_SEARCH_ENABLED = True
+    try:
+        assert supports_sparse(dotproduct)
+        assert not supports_sparse(cosine)  # Legacy cosine indexes reject sparse values
+    finally:
+        sparse_module.HYBRID_SEARCH_ENABLED = enabled
+    print("✅ Sparse values only for dotproduct indexes")
+
+if __name__ == "__main__":
+    test_tokens()
+    test_document_and_query_vectors()
+    test_vocabulary_updates_persist()
+    test_hybrid_scale()
+    test_sparse_needs_dotproduct_index()
+    print("\n🎉 All sparse vector tests passed!")
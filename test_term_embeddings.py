@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test canonical vocabulary phrases and the precomputed term embedding table
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from shared.query_parser import canonical_phrase, is_product_query, expand_query_terms
+from shared.term_embeddings import TermEmbeddings, vocabulary_phrases, table_version
+
+def test_canonical_phrases():
+    print("🧪 Testing canonical phrases")
+    assert canonical_phrase("أريد خاتم ذهب") == "خاتم ذهب"
+    assert canonical_phrase("عندكم عقود بسيطة؟") == "عقد بسيط"
+    assert canonical_phrase("ذهبي") == "ذهب"
+    assert canonical_phrase("خاتم ذهب بحدود 2000") is None
+    assert canonical_phrase("خاتم ذهب بسيط") is None
+    print("✅ Vocabulary-only queries normalized")
+
+def test_vocabulary_table():
+    print("🧪 Testing phrase lookup and category centroids")
+    entries = vocabulary_phrases()
+    phrases = [phrase for phrase, _ in entries]
+    assert "خاتم ذهب" in phrases and "عقد بسيط" in phrases
+    assert table_version(phrases) == table_version(list(phrases))
+
+    # One axis per category so centroids are easy to check
+    categories = [category or "" for _, category in entries]
+    axes = {category: i for i, category in enumerate(dict.fromkeys(c for c in categories if c))}
+    vectors = np.full((len(entries), 8), 0.01, dtype=np.float32)
+    for row, category in enumerate(categories):
+        if category:
+            vectors[row, axes[category]] = 1.0
+
+    table = TermEmbeddings(phrases, categories, vectors)
+    assert table.lookup("أريد خاتم ذهب") == vectors[phrases.index("خاتم ذهب")].tolist()
+    assert table.lookup("خاتم مثل اللي شفته") is None
+
+    category, score = table.detect_category(vectors[phrases.index("عقد بسيط")])
+    assert category == "عقود" and score > 0.9
+    print("✅ Lookup and centroid detection work")
+
+def test_product_intent_and_expansion():
+    print("🧪 Testing product intent and synonym expansion")
+    assert is_product_query("عندكم شي للخطوبة؟")
+    assert is_product_query("وريني")
+    assert not is_product_query("شكراً لك")
+    assert "قلادة" in expand_query_terms("عندكن سلاسل")
+    print("✅ Intent and expansion use the shared vocabulary")
+
+if __name__ == "__main__":
+    test_canonical_phrases()
+    test_vocabulary_table()
+    test_product_intent_and_expansion()
+    print("\n🎉 All term embedding tests passed!")
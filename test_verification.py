@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Test the positional-handle protocol of the LLM verification stage
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.catalog_indexes import ProductMatch
+from shared.verification import VERIFICATION_RESPONSE_FORMAT, build_verification_prompt, parse_handles, select_by_handles
+
+def _results():
+    return [
+        ProductMatch("3f2b9c1e-7a44-4b8e-9d1a-0c5e6f7a8b90", 0.82, {"name": "خاتم الياسمين", "category": "خواتم", "description": "خاتم ذهب"}),
+        ProductMatch("a1b2c3d4-e5f6-4a7b-8c9d-0e1f2a3b4c5d", 0.74, {"name": "عقد الفراشة", "category": "عقود", "description": "عقد ذهب"}),
+        ProductMatch("0f9e8d7c-6b5a-4c3d-2e1f-0a9b8c7d6e5f", 0.61, {"name": "خاتم اللؤلؤ", "category": "خواتم", "description": "خاتم فضة"})
+    ]
+
+def test_prompt_uses_handles():
+    print("🧪 Testing handles instead of product IDs")
+    results = _results()
+    prompt = build_verification_prompt("خاتم ذهب", results)
+    assert not any(result.id in prompt for result in results)
+    assert "1. خاتم الياسمين" in prompt and "3. خاتم اللؤلؤ" in prompt
+    schema = VERIFICATION_RESPONSE_FORMAT["json_schema"]
+    assert schema["strict"] and schema["schema"]["required"] == ["matches"]
+    print("✅ Candidates numbered 1..N")
+
+def test_handles_map_back():
+    print("🧪 Testing handle parsing and mapping")
+    results = _results()
+    handles = parse_handles(json.dumps({"matches": [3, 1, 1, 7, 0, "2"]}), len(results))
+    assert handles == [3, 1]  # Duplicates, out-of-range and non-integer handles dropped
+    assert [r.id for r in select_by_handles(results, handles)] == [results[0].id, results[2].id]
+    assert parse_handles('{"matches": []}', 3) == []
+    for broken in ["", "[1, 2]", '{"ids": [1]}', '{"matches": [1,']:
+        assert parse_handles(broken, 3) is None, broken
+    print("✅ Handles mapped to products locally; bad output detected")
+
+if __name__ == "__main__":
+    test_prompt_uses_handles()
+    test_handles_map_back()
+    print("\n🎉 All verification protocol tests passed!")
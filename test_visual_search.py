@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test the local visual index and CLIP preprocessing (no encoder model needed)
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PIL import Image
+import shared.visual_search as visual_module
+from shared.catalog_snapshot import CatalogSnapshot, write_snapshot
+from shared.visual_search import VisualIndex, _preprocess
+
+def _unit(values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_nearest_neighbors():
+    print("🧪 Testing visual nearest neighbors")
+    index = VisualIndex(tempfile.mkdtemp())
+    index.add("ring", _unit([1, 0, 0]))
+    index.add("necklace", _unit([0, 1, 0]))
+
+    matches = index.search(_unit([0.9, 0.1, 0]), top_k=2, min_score=0.5)
+    assert [product_id for product_id, _ in matches] == ["ring"]
+    print(f"✅ {matches[0][0]} ({matches[0][1]:.3f})")
+
+def test_persistence_and_remove():
+    print("🧪 Testing persistence and removal")
+    directory = tempfile.mkdtemp()
+    index = VisualIndex(directory)
+    index.add("ring", _unit([1, 0, 0]))
+    index.add("necklace", _unit([0, 1, 0]))
+    index.remove("ring")
+
+    reloaded = VisualIndex(directory)
+    assert reloaded.ids == ["necklace"]
+    assert reloaded.search(_unit([1, 0, 0]), min_score=0.5) == []
+    print("✅ Index reloaded without the removed product")
+
+def test_refresh_sees_other_writers():
+    print("🧪 Testing reload after another process changes the index")
+    directory = tempfile.mkdtemp()
+    writer = VisualIndex(directory)
+    writer.add("ring", _unit([1, 0, 0]))
+    reader = VisualIndex(directory)
+
+    writer.add("necklace", _unit([0, 1, 0]))
+    writer.remove("ring")
+    reader.refresh()
+    assert reader.ids == ["necklace"]
+    assert [product_id for product_id, _ in reader.search(_unit([0, 1, 0]), min_score=0.5)] == ["necklace"]
+    print("✅ Admin changes visible without a restart")
+
+def test_appends_and_compaction():
+    print("🧪 Testing appended writes and compaction")
+    directory = tempfile.mkdtemp()
+    index = VisualIndex(directory)
+    index.add("ring", _unit([1, 0, 0]))
+    items_file = index._files["items"]
+    for i in range(visual_module.VISUAL_COMPACT_MIN_ROWS):
+        index.add("ring", _unit([1, 0, i + 1]))  # Each re-add appends one row
+        assert index._files["items"] == items_file
+    index.add("ring", _unit([0, 0, 1]))
+    assert index._files["items"] != items_file and index.rows == 1  # Compacted to the live row
+    assert VisualIndex(directory).search(_unit([0, 0, 1]))[0][0] == "ring"
+    print("✅ One append per product, dead rows compacted away")
+
+def test_matches_use_current_metadata():
+    print("🧪 Testing snapshot metadata on visual matches")
+    index = VisualIndex(tempfile.mkdtemp())
+    index.add("ring", _unit([1, 0, 0]))
+    index.add("gone", _unit([0.9, 0.1, 0]))
+    directory = tempfile.mkdtemp()
+    write_snapshot([("ring", {"name": "خاتم", "price": 1500.0}, None)], directory)
+    snapshot = CatalogSnapshot(directory)
+
+    patched = ["visual_search_enabled", "get_visual_index", "encode_image", "get_catalog_snapshot"]
+    originals = {name: getattr(visual_module, name) for name in patched}
+    visual_module.visual_search_enabled = lambda: True
+    visual_module.get_visual_index = lambda: index
+    visual_module.encode_image = lambda image: _unit([1, 0, 0])
+    visual_module.get_catalog_snapshot = lambda: snapshot
+    try:
+        matches = visual_module.search_similar_images(None, min_score=0.5)
+        assert [match.id for match in matches] == ["ring"] and matches[0].metadata["price"] == 1500.0
+        visual_module.get_catalog_snapshot = lambda: CatalogSnapshot(tempfile.mkdtemp())
+        assert visual_module.search_similar_images(None) is None
+    finally:
+        for name, original in originals.items():
+            setattr(visual_module, name, original)
+    print("✅ Price and description edits reach image search")
+
+def test_preprocess_shape():
+    print("🧪 Testing CLIP preprocessing")
+    pixels = _preprocess(Image.new("RGBA", (640, 480), (200, 150, 50, 255)))
+    assert pixels.shape == (1, 3, 224, 224)
+    assert pixels.dtype == np.float32
+    print("✅ 1x3x224x224 float32 input")
+
+if __name__ == "__main__":
+    test_nearest_neighbors()
+    test_persistence_and_remove()
+    test_refresh_sees_other_writers()
+    test_appends_and_compaction()
+    test_matches_use_current_metadata()
+    test_preprocess_shape()
+    print("\n🎉 All visual search tests passed!")
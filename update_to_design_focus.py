@@ -8,6 +8,8 @@ sys.path.append('/home/hussein/shop-assistant')
 
 from shared.config import init_apis
 from shared.embeddings import get_text_embedding
+from shared.product_fragments import touch_product
+from shared.catalog_snapshot import record_change
 import json
 
 def extract_design_features(openai_client, product_name, current_description):
@@ -108,6 +110,7 @@ def update_to_design_focus():
                 # Update metadata
                 updated_metadata = result.metadata.copy()
                 updated_metadata['description'] = final_description
+                touch_product(result.id, updated_metadata)  # New version: cached fragments re-render
 
                 # Update in Pinecone
                 pinecone_index.upsert(vectors=[{
@@ -115,6 +118,7 @@ def update_to_design_focus():
                     "values": new_embedding,
                     "metadata": updated_metadata
                 }])
+                record_change("upsert", result.id, updated_metadata, new_embedding)  # Local snapshot and image search
 
                 updated_count += 1
                 print(f"   ✅ Updated")